@@ -0,0 +1,207 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+import config
+import metrics
+
+# Admission control in front of the booking flow, per show. When a
+# premiere opens, the sessions choosing it are let through at a steady
+# rate instead of all hitting the database at once:
+#   - a token bucket lets `rate` sessions a second into the flow, with
+#     bursts of up to `burst`,
+#   - at most `max_in_flight` admitted sessions book the show at once;
+#     a slot is freed when the session books, gives up, or stays silent
+#     for ADMISSION_LEASE_SECONDS,
+#   - everyone else waits in a first-come first-served line and is told
+#     their place and roughly how long it will take. A line longer than
+#     `max_queue` turns new arrivals away with a "try again" reply rather
+#     than letting them pile up.
+# Nothing runs in the background: the line moves whenever any session of
+# the show asks, which is often during a rush. A queued session that has
+# not asked for ADMISSION_QUEUE_IDLE seconds loses its place when it
+# reaches the front. State is per process, like the catalog cache.
+#
+# Limits come from config, per show from ADMISSION_SHOWS
+# ({"<movie id>": {"rate": 2, "max_in_flight": 40}}) or configure().
+
+ADMITTED = "admitted"
+QUEUED = "queued"
+FULL = "full"
+
+LIMITS = ("rate", "burst", "max_in_flight", "max_queue")
+
+
+def default_limits():
+    return {
+        "rate": config.ADMISSION_RATE,
+        "burst": config.ADMISSION_BURST,
+        "max_in_flight": config.ADMISSION_MAX_IN_FLIGHT,
+        "max_queue": config.ADMISSION_MAX_QUEUE,
+    }
+
+
+# {movie id: limits} from ADMISSION_SHOWS; unknown keys are refused so a
+# typo does not silently leave a premiere unprotected
+def parse_overrides(text):
+    overrides = {}
+    for movie_id, limits in (json.loads(text) if text else {}).items():
+        unknown = set(limits) - set(LIMITS)
+        if unknown:
+            raise ValueError(f"unknown admission limits for show {movie_id}: {sorted(unknown)}")
+        overrides[int(movie_id)] = limits
+    return overrides
+
+
+class ShowLine:
+    def __init__(self, movie_id, limits, now):
+        self.movie_id = movie_id
+        self.limits = limits
+        self.tokens = limits['burst']
+        self.refilled = now
+        self.waiting = OrderedDict()  # ticket -> last time the session asked
+        self.in_flight = {}  # ticket -> lease deadline
+        self.next_ticket = 1
+
+    def _refill(self, now):
+        rate, burst = self.limits['rate'], self.limits['burst']
+        self.tokens = min(burst, self.tokens + (now - self.refilled) * rate)
+        self.refilled = now
+
+    def _grant(self, ticket, now):
+        self.tokens -= 1
+        self.in_flight[ticket] = now + config.ADMISSION_LEASE_SECONDS
+
+    # Free lapsed slots and let the front of the line in while tokens and
+    # slots allow
+    def advance(self, now):
+        for ticket in [t for t, deadline in self.in_flight.items() if deadline <= now]:
+            del self.in_flight[ticket]
+            metrics.admissions.inc("lease_expired")
+        self._refill(now)
+        while self.waiting and self.tokens >= 1 and len(self.in_flight) < self.limits['max_in_flight']:
+            ticket, seen = self.waiting.popitem(last=False)
+            if now - seen > config.ADMISSION_QUEUE_IDLE:
+                metrics.admissions.inc("abandoned")
+                continue
+            self._grant(ticket, now)
+            metrics.admissions.inc("promoted")
+
+    def join(self, now):
+        ticket = self.next_ticket
+        self.next_ticket += 1
+        if not self.waiting and self.tokens >= 1 and len(self.in_flight) < self.limits['max_in_flight']:
+            self._grant(ticket, now)
+            metrics.admissions.inc(ADMITTED)
+            return ticket, ADMITTED
+        if len(self.waiting) >= self.limits['max_queue']:
+            metrics.admissions.inc(FULL)
+            return None, FULL
+        self.waiting[ticket] = now
+        metrics.admissions.inc(QUEUED)
+        return ticket, QUEUED
+
+    # Place in line counting from 1. Tickets are handed out in order and
+    # mostly leave from the front, so the distance to the front is close
+    # enough without walking the line.
+    def position(self, ticket):
+        return ticket - next(iter(self.waiting)) + 1
+
+    # Seconds until a ticket at this position gets in, at the current rate
+    def eta(self, position):
+        rate = self.limits['rate']
+        return max(0.0, (position - self.tokens) / rate) if rate > 0 else None
+
+
+class AdmissionController:
+    def __init__(self, overrides=None):
+        self.overrides = dict(overrides or {})
+        self.lines = {}
+        self.lock = threading.Lock()
+
+    # Change one show's limits from now on, e.g. before a premiere opens
+    def configure(self, movie_id, **limits):
+        unknown = set(limits) - set(LIMITS)
+        if unknown:
+            raise ValueError(f"unknown admission limits: {sorted(unknown)}")
+        with self.lock:
+            self.overrides[movie_id] = {**self.overrides.get(movie_id, {}), **limits}
+            line = self.lines.get(movie_id)
+            if line is not None:
+                line.limits = self.limits(movie_id)
+
+    def limits(self, movie_id):
+        return {**default_limits(), **self.overrides.get(movie_id, {})}
+
+    def _line(self, movie_id, now):
+        line = self.lines.get(movie_id)
+        if line is None:
+            line = self.lines[movie_id] = ShowLine(movie_id, self.limits(movie_id), now)
+        return line
+
+    # Ask to book a show. Pass back the ticket from an earlier answer to
+    # keep one's place (or one's slot, whose lease this renews). Returns
+    # {"status": ADMITTED/QUEUED/FULL, "ticket", "position", "eta"}, with
+    # position and eta (seconds, None when the rate is 0) set when queued.
+    def request(self, movie_id, ticket=None, now=None):
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            line = self._line(movie_id, now)
+            line.advance(now)
+            if ticket in line.in_flight:
+                line.in_flight[ticket] = now + config.ADMISSION_LEASE_SECONDS
+                status = ADMITTED
+            elif ticket in line.waiting:
+                line.waiting[ticket] = now
+                status = QUEUED
+            else:
+                # New, or the slot or place lapsed: to the back of the line
+                ticket, status = line.join(now)
+            answer = {"status": status, "ticket": ticket, "position": None, "eta": None}
+            if status == QUEUED:
+                answer['position'] = line.position(ticket)
+                answer['eta'] = line.eta(answer['position'])
+            self._observe(line)
+        return answer
+
+    # Give up a slot or a place in line
+    def release(self, movie_id, ticket, now=None):
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            line = self.lines.get(movie_id)
+            if line is None:
+                return
+            if line.in_flight.pop(ticket, None) is not None:
+                metrics.admissions.inc("released")
+            elif line.waiting.pop(ticket, None) is not None:
+                metrics.admissions.inc("left")
+            line.advance(now)
+            self._observe(line)
+
+    def _observe(self, line):
+        show = str(line.movie_id)
+        metrics.admission_waiting.set(len(line.waiting), show)
+        metrics.admission_in_flight.set(len(line.in_flight), show)
+
+    # {movie id: {"waiting", "in_flight", "tokens", limits...}} for shows
+    # that have had sessions
+    def snapshot(self):
+        with self.lock:
+            return {
+                movie_id: {"waiting": len(line.waiting), "in_flight": len(line.in_flight),
+                           "tokens": round(line.tokens, 2), **line.limits}
+                for movie_id, line in self.lines.items()
+            }
+
+
+_controller = None
+_controller_lock = threading.Lock()
+
+
+def get_controller():
+    global _controller
+    with _controller_lock:
+        if _controller is None:
+            _controller = AdmissionController(parse_overrides(config.ADMISSION_SHOWS))
+    return _controller
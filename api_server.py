@@ -0,0 +1,414 @@
+import argparse
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import struct
+import sys
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from http import HTTPStatus
+from urllib.parse import parse_qs, urlsplit
+
+import config
+import metrics
+from db import check_login
+from engine import BookingEngine, new_state
+from intent_classifier import get_classifier, start_watcher
+from reservations import start_sweeper
+from sales import daily_report, show_report, top_shows
+from schema import migrate
+from sessions import make_store
+
+# HTTP and WebSocket front end for the booking engine, on plain asyncio
+# streams. The event loop only parses requests and shuffles bytes; each
+# turn of a conversation (classifier, database, ticket rendering) runs on a
+# thread pool, one turn at a time per session. Idle conversations cost one
+# entry in the session store, so a single process holds thousands.
+#
+#   POST   /sessions                 {"username", "password"} -> {"session_id", "state"}
+#   GET    /sessions/<id>            -> {"state"}
+#   POST   /sessions/<id>/messages   {"text"} -> turn (see _turn_body)
+#   DELETE /sessions/<id>            ends the session and releases its hold
+#   GET    /ws?session=<id>          WebSocket: send text (or {"text"}), receive turns
+#   GET    /reports/daily?from=&to=  sales per show date (see sales.py)
+#   GET    /reports/top?from=&to=&limit=&by=
+#   GET    /reports/shows/<movie id>
+#   GET    /healthz, GET /metrics
+#
+# The reports need "Authorization: Bearer <REPORTS_TOKEN>" and are not
+# served at all while REPORTS_TOKEN is unset.
+#
+#   python api_server.py --port 8080
+
+MAX_BODY = 64 * 1024
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+class HttpError(Exception):
+    def __init__(self, status, message=None):
+        super().__init__(message or status.phrase)
+        self.status = status
+
+
+def _turn_body(turn):
+    body = {
+        "reply": turn.reply,
+        "expecting": turn.state['expecting'],
+        "booking": turn.state['booking'],
+        "ticket": None,
+    }
+    if turn.ticket:
+        file_name, pdf_bytes = turn.ticket
+        body["ticket"] = {"filename": file_name, "pdf_base64": base64.b64encode(pdf_bytes).decode("ascii")}
+    return body
+
+
+async def _read_request(reader):
+    head = await reader.readuntil(b"\r\n\r\n")
+    lines = head.decode("latin-1").split("\r\n")
+    try:
+        method, target, _ = lines[0].split(" ", 2)
+    except ValueError:
+        raise HttpError(HTTPStatus.BAD_REQUEST)
+    headers = {}
+    for line in lines[1:]:
+        if line:
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+    try:
+        length = int(headers.get("content-length") or 0)
+    except ValueError:
+        raise HttpError(HTTPStatus.BAD_REQUEST)
+    if length > MAX_BODY:
+        raise HttpError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+    body = await reader.readexactly(length) if length else b""
+    return method.upper(), target, headers, body
+
+
+def _write_response(writer, status, body=None, content_type="application/json", keep_alive=True):
+    if body is None:
+        payload = b""
+    elif isinstance(body, (bytes, str)):
+        payload = body.encode("utf-8") if isinstance(body, str) else body
+    else:
+        payload = json.dumps(body, default=str).encode("utf-8")
+    head = (
+        f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+        f"Content-Type: {content_type}\r\n"
+        f"Content-Length: {len(payload)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+    )
+    writer.write(head.encode("latin-1") + payload)
+
+
+def _json_body(body):
+    try:
+        data = json.loads(body or b"{}")
+    except ValueError:
+        raise HttpError(HTTPStatus.BAD_REQUEST, "body is not valid JSON")
+    if not isinstance(data, dict):
+        raise HttpError(HTTPStatus.BAD_REQUEST, "body must be a JSON object")
+    return data
+
+
+# WebSocket frames (RFC 6455). Client frames are masked, ours are not.
+async def _read_frame(reader):
+    first, second = await reader.readexactly(2)
+    opcode = first & 0x0F
+    length = second & 0x7F
+    if length == 126:
+        (length,) = struct.unpack("!H", await reader.readexactly(2))
+    elif length == 127:
+        (length,) = struct.unpack("!Q", await reader.readexactly(8))
+    if length > MAX_BODY:
+        raise HttpError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+    mask = await reader.readexactly(4) if second & 0x80 else None
+    data = await reader.readexactly(length)
+    if mask and length:
+        key = (mask * (length // 4 + 1))[:length]
+        data = (int.from_bytes(data, "big") ^ int.from_bytes(key, "big")).to_bytes(length, "big")
+    return bool(first & 0x80), opcode, data
+
+
+def _write_frame(writer, opcode, payload):
+    length = len(payload)
+    if length < 126:
+        head = struct.pack("!BB", 0x80 | opcode, length)
+    elif length < 1 << 16:
+        head = struct.pack("!BBH", 0x80 | opcode, 126, length)
+    else:
+        head = struct.pack("!BBQ", 0x80 | opcode, 127, length)
+    writer.write(head + payload)
+
+
+# Reports are for staff: a 404 while no token is set, a 401 without it
+def _check_reports_token(headers):
+    if not config.REPORTS_TOKEN:
+        raise HttpError(HTTPStatus.NOT_FOUND)
+    scheme, _, token = headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(token.strip().encode(), config.REPORTS_TOKEN.encode()):
+        raise HttpError(HTTPStatus.UNAUTHORIZED, "reports need the admin token")
+
+
+class ApiServer:
+    def __init__(self, engine=None, store=None, workers=None):
+        self.engine = engine or BookingEngine()
+        self.store = store if store is not None else make_store()  # an empty store is falsy
+        self.executor = ThreadPoolExecutor(max_workers=workers or config.API_WORKERS, thread_name_prefix="api-turn")
+        # session id -> [lock, users]; a session's turns run one at a time
+        self._locks = {}
+
+    # Blocking work, run on the thread pool
+
+    def _create_session(self, username, password):
+        if not check_login(username, password):
+            return None
+        session_id = uuid.uuid4().hex
+        self.store.put(session_id, {"username": username, "state": new_state()})
+        return session_id
+
+    def _take_turn(self, session_id, text):
+        metrics.set_session(session_id)
+        session = self.store.get(session_id)
+        if session is None:
+            raise HttpError(HTTPStatus.NOT_FOUND, "unknown or expired session")
+        turn = self.engine.handle(session['state'], text)
+        session['state'] = turn.state
+        self.store.put(session_id, session)
+        return turn
+
+    def _end_session(self, session_id):
+        session = self.store.get(session_id)
+        if session is None:
+            return False
+        self.engine.end(session['state'])
+        self.store.delete(session_id)
+        return True
+
+    # Drop expired sessions and give back what they held. Returns how many.
+    def purge_sessions(self):
+        expired = self.store.purge()
+        for session in expired:
+            try:
+                self.engine.end(session['state'])
+            except Exception as exc:  # the hold still lapses on its own
+                print(f"⚠️ Could not end an expired session: {exc!r}")
+        return len(expired)
+
+    async def purge_forever(self, interval):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self._blocking(self.purge_sessions)
+            except Exception as exc:  # try again next interval
+                print(f"⚠️ Session purge failed: {exc!r}")
+
+    async def _blocking(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    async def turn(self, session_id, text):
+        entry = self._locks.setdefault(session_id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                return await self._blocking(self._take_turn, session_id, text)
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[session_id]
+
+    # Request handling, on the event loop
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(_read_request(reader), config.API_IDLE_TIMEOUT)
+                except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+                    break
+                except (asyncio.LimitOverrunError, HttpError) as exc:
+                    status = exc.status if isinstance(exc, HttpError) else HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE
+                    _write_response(writer, status, {"error": str(exc)}, keep_alive=False)
+                    break
+                method, target, headers, body = request
+                if headers.get("upgrade", "").lower() == "websocket":
+                    await self.websocket(reader, writer, target, headers)
+                    break
+                keep_alive = headers.get("connection", "").lower() != "close"
+                try:
+                    status, response = await self.route(method, target, body, headers)
+                except HttpError as exc:
+                    status, response = exc.status, {"error": str(exc)}
+                except Exception as exc:
+                    print(f"⚠️ API request failed: {exc!r}")
+                    status, response = HTTPStatus.INTERNAL_SERVER_ERROR, {"error": "internal error"}
+                if isinstance(response, str):
+                    _write_response(writer, status, response, "text/plain; version=0.0.4; charset=utf-8", keep_alive)
+                else:
+                    _write_response(writer, status, response, keep_alive=keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        finally:
+            writer.close()
+
+    async def route(self, method, target, body, headers=None):
+        path = urlsplit(target).path.strip("/").split("/")
+        if path == ["healthz"] and method == "GET":
+            return HTTPStatus.OK, {"ok": True}
+        if path == ["metrics"] and method == "GET":
+            return HTTPStatus.OK, metrics.render()
+        if path == ["sessions"] and method == "POST":
+            data = _json_body(body)
+            session_id = await self._blocking(self._create_session, data.get("username"), data.get("password"))
+            if session_id is None:
+                raise HttpError(HTTPStatus.UNAUTHORIZED, "invalid credentials")
+            return HTTPStatus.CREATED, {"session_id": session_id, "state": new_state()}
+        if len(path) == 2 and path[0] == "sessions":
+            if method == "GET":
+                session = await self._blocking(self.store.get, path[1])
+                if session is None:
+                    raise HttpError(HTTPStatus.NOT_FOUND, "unknown or expired session")
+                return HTTPStatus.OK, {"state": session['state']}
+            if method == "DELETE":
+                if not await self._blocking(self._end_session, path[1]):
+                    raise HttpError(HTTPStatus.NOT_FOUND, "unknown or expired session")
+                return HTTPStatus.OK, {"ok": True}
+        if path[0] == "reports" and method == "GET":
+            _check_reports_token(headers or {})
+            return HTTPStatus.OK, await self._blocking(self.report, path[1:], parse_qs(urlsplit(target).query))
+        if len(path) == 3 and path[0] == "sessions" and path[2] == "messages" and method == "POST":
+            text = _json_body(body).get("text")
+            if not isinstance(text, str) or not text:
+                raise HttpError(HTTPStatus.BAD_REQUEST, "text is required")
+            return HTTPStatus.OK, _turn_body(await self.turn(path[1], text))
+        raise HttpError(HTTPStatus.NOT_FOUND)
+
+    # Sales reports, read from the summary table only
+    def report(self, path, query):
+        def arg(name, parse, default=None):
+            values = query.get(name)
+            if not values:
+                if default is None:
+                    raise HttpError(HTTPStatus.BAD_REQUEST, f"{name} is required")
+                return default
+            try:
+                return parse(values[0])
+            except ValueError:
+                raise HttpError(HTTPStatus.BAD_REQUEST, f"invalid {name}: {values[0]!r}")
+
+        if path == ["daily"]:
+            return {"days": daily_report(arg("from", date.fromisoformat), arg("to", date.fromisoformat))}
+        if path == ["top"]:
+            by = arg("by", str, "revenue")
+            if by not in ("revenue", "tickets"):
+                raise HttpError(HTTPStatus.BAD_REQUEST, "by must be revenue or tickets")
+            shows = top_shows(arg("from", date.fromisoformat), arg("to", date.fromisoformat),
+                              min(arg("limit", int, 10), 100), by)
+            return {"shows": shows}
+        if len(path) == 2 and path[0] == "shows" and path[1].isdigit():
+            report = show_report(int(path[1]))
+            if report is None:
+                raise HttpError(HTTPStatus.NOT_FOUND, "unknown show")
+            return report
+        raise HttpError(HTTPStatus.NOT_FOUND)
+
+    async def websocket(self, reader, writer, target, headers):
+        url = urlsplit(target)
+        session_id = parse_qs(url.query).get("session", [None])[0]
+        key = headers.get("sec-websocket-key")
+        if url.path.rstrip("/") != "/ws" or not key or session_id is None:
+            _write_response(writer, HTTPStatus.BAD_REQUEST, {"error": "expected /ws?session=<id>"}, keep_alive=False)
+            return
+        if await self._blocking(self.store.get, session_id) is None:
+            _write_response(writer, HTTPStatus.NOT_FOUND, {"error": "unknown or expired session"}, keep_alive=False)
+            return
+        accept = base64.b64encode(hashlib.sha1((key + WS_GUID).encode("ascii")).digest()).decode("ascii")
+        writer.write((
+            "HTTP/1.1 101 Switching Protocols\r\n"
+            "Upgrade: websocket\r\n"
+            "Connection: Upgrade\r\n"
+            f"Sec-WebSocket-Accept: {accept}\r\n\r\n"
+        ).encode("latin-1"))
+        await writer.drain()
+
+        message = b""
+        while True:
+            try:
+                fin, opcode, data = await asyncio.wait_for(_read_frame(reader), config.API_IDLE_TIMEOUT)
+            except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError, HttpError):
+                return
+            if opcode == 0x8:    # close
+                _write_frame(writer, 0x8, data[:2])
+                await writer.drain()
+                return
+            if opcode == 0x9:    # ping
+                _write_frame(writer, 0xA, data)
+                await writer.drain()
+                continue
+            if opcode in (0x0, 0x1, 0x2):
+                message += data
+                if len(message) > MAX_BODY:
+                    return
+                if not fin:
+                    continue
+                text, message = message.decode("utf-8", "replace"), b""
+                if text.startswith("{"):
+                    try:
+                        text = json.loads(text).get("text")
+                    except ValueError:
+                        pass
+                # Answered like the HTTP route: an error frame, and the
+                # connection stays open
+                try:
+                    if not isinstance(text, str) or not text:
+                        raise HttpError(HTTPStatus.BAD_REQUEST, "text is required")
+                    response = _turn_body(await self.turn(session_id, text))
+                except HttpError as exc:
+                    response = {"error": str(exc)}
+                except Exception as exc:
+                    print(f"⚠️ WebSocket turn failed: {exc!r}")
+                    response = {"error": "internal error"}
+                _write_frame(writer, 0x1, json.dumps(response, default=str).encode("utf-8"))
+                await writer.drain()
+
+    async def serve(self, host, port):
+        return await asyncio.start_server(self.handle_connection, host, port, limit=MAX_BODY)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the booking chat over HTTP and WebSocket.")
+    parser.add_argument("--host", default=config.API_HOST)
+    parser.add_argument("--port", type=int, default=config.API_PORT)
+    parser.add_argument("--store", choices=["memory", "sqlite"], default=config.SESSION_STORE)
+    args = parser.parse_args(argv)
+
+    migrate()
+    start_sweeper()
+    metrics.start_exporters()
+    get_classifier()  # load the intent model before taking traffic
+    start_watcher()
+    api = ApiServer(store=make_store(args.store))
+
+    async def run():
+        server = await api.serve(args.host, args.port)
+        purger = asyncio.create_task(api.purge_forever(config.SESSION_PURGE_INTERVAL))
+        print(f"TicketGenie API listening on {args.host}:{args.port}")
+        async with server:
+            try:
+                await server.serve_forever()
+            finally:
+                purger.cancel()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
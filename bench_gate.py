@@ -0,0 +1,53 @@
+import argparse
+import random
+import time
+
+from gate import Gate
+from ticket_codes import encode
+
+# Scan throughput of one gate with no database in the path: a sold-out
+# show's tickets each scanned once, then a second pass where every scan is
+# refused as already used, plus a pass of forged codes.
+#
+#   python bench_gate.py --tickets 5000
+
+KEY = b"bench-gate-key-not-for-production"
+
+
+def _rate(gate, codes, now):
+    started = time.perf_counter()
+    results = [gate.scan(code, now)['result'] for code in codes]
+    elapsed = time.perf_counter() - started
+    return len(codes) / elapsed, results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark offline ticket verification at a gate.")
+    parser.add_argument("--tickets", type=int, default=5000, help="tickets for the show")
+    args = parser.parse_args(argv)
+
+    now = time.time()
+    expires = int(now) + 3600
+    codes = [
+        encode(1000 + n // 4, 7, (n // 1000 + 1, n // 50 % 20 + 1, n % 50 + 1), expires, KEY)
+        for n in range(args.tickets)
+    ]
+    random.shuffle(codes)
+    forged = [code[:-2] + ("AA" if code[-2:] != "AA" else "BB") for code in codes]
+
+    gate = Gate("bench", shows=[7], key=KEY)
+    first, results = _rate(gate, codes, now)
+    assert results.count("ok") == len(codes), "every ticket should get in once"
+    second, results = _rate(gate, codes, now)
+    assert set(results) == {"already_used"}
+    third, results = _rate(gate, forged, now)
+    assert set(results) == {"bad_signature"}
+
+    print(f"tickets: {args.tickets}")
+    print(f"first scan:    {first:,.0f} scans/s")
+    print(f"already used:  {second:,.0f} scans/s")
+    print(f"forged:        {third:,.0f} scans/s")
+
+
+if __name__ == "__main__":
+    main()
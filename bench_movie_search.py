@@ -0,0 +1,82 @@
+import argparse
+import random
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from catalog import MovieCatalog
+from movie_search import MovieIndex
+
+# Query latency of the movie search index over a synthetic catalog (many
+# titles, each shown on several screens a day for a few weeks), plus the
+# cost of the first build and of an incremental resync after one change.
+#
+#   python bench_movie_search.py --shows 50000
+
+TITLE_WORDS = [
+    "avengers", "endgame", "dark", "knight", "rises", "lost", "city", "star", "wars", "empire",
+    "return", "jedi", "toy", "story", "inside", "out", "frozen", "kingdom", "mission", "impossible",
+    "fast", "furious", "jurassic", "world", "park", "spider", "man", "home", "far", "from",
+    "black", "panther", "wakanda", "forever", "top", "gun", "maverick", "dune", "part", "two",
+    "oppenheimer", "barbie", "interstellar", "inception", "matrix", "reloaded", "revolutions", "gladiator",
+]
+GENRES = ["Action", "Comedy", "Drama", "Horror", "Sci-Fi", "Animation", "Thriller", "Romance"]
+SHOWTIMES = [timedelta(hours=h, minutes=m) for h, m in ((10, 0), (13, 15), (16, 30), (19, 45), (22, 30))]
+QUERIES = [
+    "avengers tonight", "comedy tomorrow", "avengrs", "dark knight", "spider man saturday",
+    "horror night", "interstelar tomorrow evening", "book frozen", "weekend animation", "matrix",
+]
+
+
+def synthetic_movies(shows, seed=7):
+    rng = random.Random(seed)
+    titles = sorted({" ".join(rng.sample(TITLE_WORDS, rng.randint(1, 3))).title() for _ in range(shows // 20)})
+    today = date.today()
+    movies = []
+    for movie_id in range(1, shows + 1):
+        movies.append({
+            "id": movie_id,
+            "name": rng.choice(titles),
+            "genre": rng.choice(GENRES),
+            "rating": Decimal("7.5"),
+            "available_seats": rng.randint(0, 200),
+            "Date": today + timedelta(days=rng.randint(-3, 27)),
+            "showtiming": rng.choice(SHOWTIMES),
+            "Price": Decimal("250.00"),
+        })
+    return movies
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the movie search index.")
+    parser.add_argument("--shows", type=int, default=50000, help="shows in the catalog")
+    parser.add_argument("-n", type=int, default=2000, help="searches per query")
+    args = parser.parse_args(argv)
+
+    movies = synthetic_movies(args.shows)
+    catalog = MovieCatalog(lambda: movies, ttl=3600)
+    index = MovieIndex(catalog)
+
+    started = time.perf_counter()
+    index.sync()
+    print(f"shows: {args.shows}")
+    print(f"first build:        {(time.perf_counter() - started) * 1e3:9.1f} ms")
+
+    catalog.put(dict(movies[0], name="Avengers Secret Wars"))
+    started = time.perf_counter()
+    index.sync()
+    print(f"resync, one change: {(time.perf_counter() - started) * 1e3:9.1f} ms")
+
+    print()
+    for query in QUERIES:
+        index.search(query)  # warm the typo expansions
+        started = time.perf_counter()
+        for _ in range(args.n):
+            results = index.search(query)
+        elapsed = (time.perf_counter() - started) / args.n
+        names = ", ".join(sorted({movie['name'] for movie in results}))
+        print(f"{query!r:34} {elapsed * 1e6:7.1f} us  {len(results)} hits  {names}")
+
+
+if __name__ == "__main__":
+    main()
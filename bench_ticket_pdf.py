@@ -0,0 +1,157 @@
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import timedelta
+
+import qrcode
+from fpdf import FPDF
+
+import config
+from ticket_codes import ticket_code
+from ticket_pdf import QR_ERROR_CORRECTION, QR_MASK, QR_VERSION, _qr_codewords, sanitize_text, generate_ticket_pdf
+
+# Per-ticket cost of the previous renderer (full layout on every call,
+# written to ticket_<name>.pdf and read back for the download button and
+# again for the email) against the in-memory renderer with the cached
+# static template. Both draw the ticket's signed QR code (ticket_codes.py):
+# the baseline as qrcode makes it by default, a square per dark module,
+# where the old ticket drew random bars. The QR encoding alone is timed
+# too, since it is most of what a ticket costs.
+#
+#   python bench_ticket_pdf.py -n 500
+
+SAMPLE_BOOKING = {
+    "booking_id": 42,
+    "movie_id": 7,
+    "show_date": "2025-06-03",
+    "name": "Jane Doe",
+    "email": "jane@example.com",
+    "phone": "5550100",
+    "movie": "Avengers",
+    "booking_time": "2025-06-03 18:30",
+    "show_time": timedelta(hours=19, minutes=45),
+    "seats": [(2, 7, 14)],
+}
+
+
+# The renderer as it was before the template, kept here as the baseline
+def legacy_generate_ticket_pdf(booking_info, directory):
+    pdf = FPDF('P', 'mm', (80, 150))
+    pdf.add_page()
+    pdf.set_fill_color(190, 30, 45)
+    pdf.rect(0, 0, 80, 40, 'F')
+    pdf.set_font("Arial", 'B', 12)
+    pdf.set_text_color(255, 255, 255)
+    pdf.set_xy(0, 5)
+    pdf.cell(80, 7, "E-TICKET", ln=True, align='C')
+    pdf.set_font("Arial", 'B', 25)
+    pdf.cell(60, 10, sanitize_text(booking_info['movie']), ln=True, align='C')
+    pdf.set_fill_color(255, 245, 230)
+    pdf.rect(0, 40, 80, 110, 'F')
+    pdf.set_text_color(0, 0, 0)
+    pdf.set_xy(0, 45)
+    pdf.set_font("Arial", 'B', 14)
+    pdf.cell(80, 8, "Movie Details", ln=True, align='C')
+    pdf.set_draw_color(0, 0, 0)
+    for x in range(5, 75, 5):
+        pdf.line(x, 55, x+2, 55)
+    pdf.set_font("Arial", 'B', 12)
+    pdf.set_xy(5, 60)
+    pdf.cell(23, 10, "BLOCK", ln=0)
+    pdf.cell(23, 10, "ROW", ln=0)
+    pdf.cell(23, 10, "SEAT", ln=1)
+    pdf.set_font("Arial", '', 12)
+    pdf.set_x(5)
+    pdf.cell(23, 8, f"{random.randint(1, 5):02d}", ln=0)
+    pdf.cell(23, 8, f"{random.randint(1, 20):02d}", ln=0)
+    pdf.cell(23, 8, f"{random.randint(1, 50):02d}", ln=1)
+    pdf.ln(5)
+    pdf.set_font("Arial", 'B', 12)
+    pdf.set_x(5)
+    pdf.cell(35, 10, "DATE", ln=0)
+    pdf.cell(35, 10, "TIME", ln=1)
+    pdf.set_font("Arial", '', 12)
+    booking_date, _ = booking_info['booking_time'].split()
+    pdf.set_x(5)
+    pdf.cell(35, 8, booking_date, ln=0)
+    total_seconds = int(booking_info['show_time'].total_seconds())
+    hours, remainder = divmod(total_seconds, 3600)
+    minutes, _ = divmod(remainder, 60)
+    pdf.cell(35, 8, f"{hours % 12 or 12}:{minutes:02} {'AM' if hours < 12 else 'PM'}", ln=1)
+    pdf.set_font("Arial", '', 10)
+    pdf.set_y(103)
+    pdf.cell(0, 8, f"TICKET #{random.randint(1000, 9999)}", 0, 0, 'C')
+    pdf.set_fill_color(0, 0, 0)
+    legacy_draw_qr(pdf, ticket_code(booking_info, booking_info['seats'][0], 1), x=25, y=113, size=30)
+    file_name = os.path.join(directory, f"ticket_{sanitize_text(booking_info['name'].replace(' ', '_'))}.pdf")
+    pdf.output(file_name)
+    return file_name
+
+
+# A QR code the straightforward way: qrcode picks the version and the mask,
+# and each dark module is its own rectangle
+def legacy_draw_qr(pdf, text, x, y, size):
+    qr = qrcode.QRCode(error_correction=qrcode.constants.ERROR_CORRECT_M, border=0)
+    qr.add_data(text)
+    qr.make(fit=True)
+    matrix = qr.get_matrix()
+    module = size / len(matrix)
+    for r, line in enumerate(matrix):
+        for c, dark in enumerate(line):
+            if dark:
+                pdf.rect(x + c * module, y + r * module, module, module, 'F')
+
+
+def _time_per_call(fn, n):
+    fn()  # warm up (font metrics, template)
+    started = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - started) / n
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark ticket PDF rendering.")
+    parser.add_argument("-n", type=int, default=300, help="tickets per variant")
+    args = parser.parse_args(argv)
+    # Sign with a throwaway key rather than create ticket.key here
+    config.TICKET_SECRET = config.TICKET_SECRET or "bench"
+    code = ticket_code(SAMPLE_BOOKING, SAMPLE_BOOKING['seats'][0], 1)
+
+    with tempfile.TemporaryDirectory() as directory:
+        def legacy():
+            path = legacy_generate_ticket_pdf(SAMPLE_BOOKING, directory)
+            # The old flow read the file once for the email and once for the download
+            for _ in range(2):
+                with open(path, "rb") as f:
+                    f.read()
+
+        def current():
+            generate_ticket_pdf(SAMPLE_BOOKING)
+
+        def qr_default():
+            qr = qrcode.QRCode(error_correction=qrcode.constants.ERROR_CORRECT_M, border=0)
+            qr.add_data(code)
+            qr.make(fit=True)
+
+        def qr_fixed():
+            qr = qrcode.QRCode(version=QR_VERSION, error_correction=QR_ERROR_CORRECTION, border=0, mask_pattern=QR_MASK)
+            qr.data_cache = _qr_codewords(code)
+            qr.make(fit=False)
+
+        before = _time_per_call(legacy, args.n)
+        after = _time_per_call(current, args.n)
+        qr_before = _time_per_call(qr_default, args.n)
+        qr_after = _time_per_call(qr_fixed, args.n)
+
+    print(f"tickets per variant: {args.n}")
+    print(f"before (full layout + file round trip + default QR): {before * 1e3:.3f} ms/ticket")
+    print(f"after  (cached template + fixed-version QR):         {after * 1e3:.3f} ms/ticket")
+    print(f"speed-up: {before / after:.2f}x")
+    print(f"QR encoding alone: {qr_before * 1e3:.3f} -> {qr_after * 1e3:.3f} ms ({qr_before / qr_after:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+import argparse
+import csv
+import json
+import sys
+from datetime import date, datetime, timedelta
+
+from db import stream_bookings
+
+# Export bookings as CSV or JSONL in constant memory: rows come from
+# db.stream_bookings() and are written out one at a time.
+#
+#   python bookings_export.py --format jsonl --movie-id 3 -o bookings.jsonl
+
+FIELDS = ["id", "name", "email", "phone", "movie_id", "movie_name", "num_tickets", "seats", "booking_time"]
+
+
+def _plain(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat(sep=' ') if isinstance(value, datetime) else value.isoformat()
+    if isinstance(value, timedelta):
+        return str(value)
+    return value
+
+
+def export_bookings(out, fmt='csv', **filters):
+    count = 0
+    if fmt == 'csv':
+        writer = csv.DictWriter(out, fieldnames=FIELDS, extrasaction='ignore')
+        writer.writeheader()
+        for row in stream_bookings(**filters):
+            writer.writerow({key: _plain(value) for key, value in row.items()})
+            count += 1
+    elif fmt == 'jsonl':
+        for row in stream_bookings(**filters):
+            out.write(json.dumps({key: _plain(value) for key, value in row.items()}) + "\n")
+            count += 1
+    else:
+        raise ValueError(f"unknown format {fmt!r}")
+    return count
+
+
+def _parse_time(value):
+    return datetime.fromisoformat(value)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export bookings as CSV or JSONL.")
+    parser.add_argument("--format", choices=("csv", "jsonl"), default="csv")
+    parser.add_argument("-o", "--output", default="-", help="file to write (default: stdout)")
+    parser.add_argument("--movie-id", type=int)
+    parser.add_argument("--email")
+    parser.add_argument("--since", type=_parse_time, help="booking_time >= this (ISO date/time)")
+    parser.add_argument("--until", type=_parse_time, help="booking_time < this (ISO date/time)")
+    args = parser.parse_args(argv)
+
+    out = sys.stdout if args.output == "-" else open(args.output, "w", newline="", encoding="utf-8")
+    try:
+        count = export_bookings(out, args.format, movie_id=args.movie_id, email=args.email,
+                                start=args.since, end=args.until)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    sys.stderr.write(f"✅ exported {count} bookings\n")
+
+
+if __name__ == "__main__":
+    main()
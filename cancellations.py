@@ -0,0 +1,205 @@
+import argparse
+import sys
+from datetime import datetime
+
+import metrics
+from db import booking_filters, connection, movie_catalog, record_sales, retry_transaction
+from display import format_show_date, format_show_time
+from mail_queue import get_queue
+from metrics import timed
+from reservations import HELD, RELEASED, lock_seat_map, save_seat_map
+from seatmap import describe_seats, parse_seats
+
+# Cancelling bookings: one booking, everything booked under an email, or a
+# whole show when a screen goes down. Each call is one transaction of
+# set-based statements whatever the number of bookings:
+#   - the bookings are copied to cancelled_bookings and deleted,
+#   - the seats are freed in each show's seat map, and movies.available_seats
+#     gets back exactly the seats the maps freed, so the two stay equal,
+#   - cancelling a show also releases its live holds and withdraws it
+#     (movies.withdrawn_at), so it is no longer listed, found or held,
+#   - each show's sales summary (show_sales) loses the bookings,
+# and the notification emails go to the outbox in one batch after commit.
+# Locks follow reservations.place_hold: each show's map (show_seats) first,
+# in id order, then seat_holds -> bookings -> movies -> show_sales.
+
+CANCEL_SUBJECT = "❌ Your movie booking has been cancelled"
+DEFAULT_REASON = "cancelled at your request"
+DELETE_CHUNK = 500
+
+
+# Seats of a show's bookings and live holds, which a seat-less booking's
+# tickets must not be taken from
+def _assigned_seats(cursor, show_id):
+    cursor.execute(
+        "SELECT seats FROM bookings WHERE movie_id = %s AND seats IS NOT NULL"
+        " UNION ALL SELECT seats FROM seat_holds WHERE movie_id = %s AND status = %s AND seats IS NOT NULL",
+        (show_id, show_id, HELD)
+    )
+    return [seat for row in cursor.fetchall() for seat in parse_seats(row[0])]
+
+
+@retry_transaction
+def _cancel(scope, filters, reason, notify, mail, movie_id=None):
+    clauses, params = booking_filters(**filters)
+    where = " AND ".join(clauses)
+    now = datetime.now()
+    since = movie_catalog.stamp()
+    with timed(f"cancel.{scope}"), connection() as conn:
+        cursor = conn.cursor(dictionary=True)
+        plain = conn.cursor()
+        if movie_id is not None:
+            show_ids = [movie_id]
+        else:
+            # A plain read: which maps to lock before anything else
+            plain.execute(f"SELECT DISTINCT b.movie_id FROM bookings b WHERE {where}", params)
+            show_ids = sorted(row[0] for row in plain.fetchall())
+        maps = {show_id: lock_seat_map(plain, show_id) for show_id in show_ids}
+
+        holds = []
+        if movie_id is not None:
+            cursor.execute(
+                "SELECT id, num_tickets, seats FROM seat_holds WHERE movie_id = %s AND status = %s FOR UPDATE",
+                (movie_id, HELD)
+            )
+            holds = cursor.fetchall()
+        cursor.execute(
+            f"SELECT b.id, b.name, b.email, b.movie_id, b.num_tickets, b.seats FROM bookings b WHERE {where} FOR UPDATE",
+            params
+        )
+        bookings = cursor.fetchall()
+        if not bookings and not holds and movie_id is None:
+            plain.close()
+            cursor.close()
+            return []
+        for show_id in sorted({booking['movie_id'] for booking in bookings} - set(maps)):
+            # Booked since the plain read; retry_transaction covers a deadlock here
+            maps[show_id] = lock_seat_map(plain, show_id)
+
+        # Seats back into each show's map. Bookings made before the show had
+        # a map have no seats; the map holds their tickets as taken seats
+        # at the back, and as many of those are freed.
+        freed, unseated = {}, {}
+        for booking in bookings:
+            if booking['seats']:
+                freed.setdefault(booking['movie_id'], []).extend(parse_seats(booking['seats']))
+            else:
+                unseated[booking['movie_id']] = unseated.get(booking['movie_id'], 0) + booking['num_tickets']
+        for hold in holds:
+            freed.setdefault(movie_id, []).extend(parse_seats(hold['seats']))
+        returned = {}
+        for show_id in sorted(set(freed) | set(unseated)):
+            seat_map = maps[show_id]
+            if seat_map is None:  # the show is gone
+                continue
+            before = seat_map.free_count()
+            seat_map.release(freed.get(show_id, []))
+            if unseated.get(show_id):
+                seat_map.release_unassigned(unseated[show_id], _assigned_seats(plain, show_id))
+            save_seat_map(plain, show_id, seat_map)
+            returned[show_id] = seat_map.free_count() - before
+
+        if holds:
+            plain.execute(
+                "UPDATE seat_holds SET status = %s WHERE movie_id = %s AND status = %s",
+                (RELEASED, movie_id, HELD)
+            )
+        plain.executemany(
+            "UPDATE movies SET available_seats = available_seats + %s WHERE id = %s",
+            [(count, show_id) for show_id, count in sorted(returned.items()) if count]
+        )
+        if movie_id is not None:
+            plain.execute("UPDATE movies SET withdrawn_at = %s WHERE id = %s", (now, movie_id))
+        sold = {}
+        for booking in bookings:
+            count, tickets = sold.get(booking['movie_id'], (0, 0))
+            sold[booking['movie_id']] = (count - 1, tickets - booking['num_tickets'])
+        record_sales(plain, sold)
+        plain.execute(
+            "INSERT INTO cancelled_bookings"
+            " (id, name, email, phone, movie_id, num_tickets, seats, booking_time, cancelled_at, reason)"
+            " SELECT b.id, b.name, b.email, b.phone, b.movie_id, b.num_tickets, b.seats, b.booking_time, %s, %s"
+            f" FROM bookings b WHERE {where}",
+            [now, reason] + params
+        )
+        # What the notices say about each show, read while it is still listed
+        shows = {}
+        if notify and bookings:
+            cursor.execute(
+                f"SELECT id, name, Date, showtiming FROM movies WHERE id IN ({', '.join(['%s'] * len(sold))})",
+                sorted(sold)
+            )
+            shows = {show['id']: show for show in cursor.fetchall()}
+        # By id: MySQL before 8.0.16 has no alias in a single-table DELETE
+        ids = [booking['id'] for booking in bookings]
+        for start in range(0, len(ids), DELETE_CHUNK):
+            chunk = ids[start:start + DELETE_CHUNK]
+            plain.execute(f"DELETE FROM bookings WHERE id IN ({', '.join(['%s'] * len(chunk))})", chunk)
+        plain.close()
+        cursor.close()
+
+    for show_id, num_tickets in returned.items():
+        movie_catalog.adjust_seats(show_id, num_tickets, since)
+    if movie_id is not None:
+        movie_catalog.remove(movie_id)
+    metrics.cancellations.inc(scope, amount=len(bookings))
+    if notify and bookings:
+        (mail or get_queue()).enqueue_many([_notice(booking, reason, shows.get(booking['movie_id'])) for booking in bookings])
+    return bookings
+
+
+def _notice(booking, reason, movie):
+    movie = movie or {}
+    when = f" on {format_show_date(movie.get('Date'))} at {format_show_time(movie.get('showtiming'))}" if movie else ""
+    seats = parse_seats(booking['seats'])
+    body = (
+        f"Hi {booking['name']},\n\n"
+        f"Your booking #{booking['id']} for {movie.get('name', 'your show')}{when}"
+        f" ({booking['num_tickets']} ticket{'s' if booking['num_tickets'] != 1 else ''}"
+        f"{', ' + describe_seats(seats) if seats else ''}) has been cancelled: {reason}.\n\n"
+        "We're sorry for the inconvenience."
+    )
+    return {"to_email": booking['email'], "subject": CANCEL_SUBJECT, "body": body}
+
+
+# Each returns the cancelled bookings (id, name, email, movie_id,
+# num_tickets, seats); an empty list when nothing matched. The notices go
+# through `mail` (a MailQueue), else the process-wide queue.
+def cancel_booking(booking_id, reason=DEFAULT_REASON, notify=True, mail=None):
+    return _cancel("booking", {"booking_id": booking_id}, reason, notify, mail)
+
+
+def cancel_bookings_for_email(email, reason=DEFAULT_REASON, notify=True, mail=None):
+    return _cancel("email", {"email": email}, reason, notify, mail)
+
+
+def cancel_show(movie_id, reason="the show has been cancelled", notify=True, mail=None):
+    return _cancel("show", {"movie_id": movie_id}, reason, notify, mail, movie_id=movie_id)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cancel bookings and notify the customers.")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--booking", type=int, help="one booking id")
+    target.add_argument("--email", help="every booking made with this email")
+    target.add_argument("--show", type=int, help="every booking (and live hold) for this movie id")
+    parser.add_argument("--reason", help="sentence for the notification email")
+    parser.add_argument("--no-notify", action="store_true", help="do not email the customers")
+    args = parser.parse_args(argv)
+
+    notify = not args.no_notify
+    if args.booking is not None:
+        cancelled = cancel_booking(args.booking, args.reason or DEFAULT_REASON, notify)
+    elif args.email is not None:
+        cancelled = cancel_bookings_for_email(args.email, args.reason or DEFAULT_REASON, notify)
+    else:
+        cancelled = cancel_show(args.show, args.reason or "the show has been cancelled", notify)
+    tickets = sum(booking['num_tickets'] for booking in cancelled)
+    print(f"✅ cancelled {len(cancelled)} bookings, {tickets} seats returned")
+    if notify and cancelled and not get_queue().drain():
+        print("⚠️ some notifications are still queued; they will be retried by the next mail worker")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,85 @@
+import threading
+import time
+
+
+# In-process cache of the movies table, indexed by movie id.
+# The whole table is reloaded through `loader` at most once per `ttl`
+# seconds; writers keep it current with put()/adjust_seats()/remove()/
+# invalidate().
+# Seat counts served from here are for display only: bookings are checked
+# by reservations.place_hold's conditional UPDATE.
+# `version` goes up whenever rows are reloaded or replaced (not on seat
+# count changes), so indexes built over the catalog know when to resync.
+class MovieCatalog:
+    def __init__(self, loader, ttl):
+        self.loader = loader
+        self.ttl = ttl
+        self.version = 0
+        self._movies = {}
+        self._loaded_at = None  # when the last reload began
+        self._stale = True
+        self._lock = threading.Lock()
+
+    def _fresh(self):
+        return not self._stale and time.monotonic() - self._loaded_at < self.ttl
+
+    def _ensure_loaded(self):
+        if self._fresh():
+            return
+        with self._lock:
+            if self._fresh():
+                return
+            started = time.monotonic()
+            movies = self.loader()
+            self._movies = {movie['id']: movie for movie in movies}
+            self._loaded_at = started
+            self._stale = False
+            self.version += 1
+
+    def all(self):
+        self._ensure_loaded()
+        return list(self._movies.values())
+
+    # (version, {id: movie}) as of now; the dict must not be modified
+    def snapshot(self):
+        self._ensure_loaded()
+        with self._lock:
+            return self.version, self._movies
+
+    def get(self, movie_id):
+        self._ensure_loaded()
+        movie = self._movies.get(movie_id)
+        return dict(movie) if movie is not None else None
+
+    def put(self, movie):
+        with self._lock:
+            if self._loaded_at is not None:
+                self._movies[movie['id']] = dict(movie)
+                self.version += 1
+
+    # Taken before a transaction that changes seat counts; pass it to
+    # adjust_seats() once the transaction has committed
+    def stamp(self):
+        return time.monotonic()
+
+    # Shift a cached seat count after a relative update in the database made
+    # by a transaction that began at `since` (see stamp()). A reload that
+    # began after that may already have read the new count, so the delta is
+    # skipped: at worst the count stays too high until the next reload,
+    # which place_hold's conditional UPDATE guards against, where applying
+    # it twice could turn people away from a show with seats left.
+    def adjust_seats(self, movie_id, delta, since):
+        with self._lock:
+            movie = self._movies.get(movie_id)
+            if movie is not None and self._loaded_at < since:
+                self._movies[movie_id] = dict(movie, available_seats=movie['available_seats'] + delta)
+
+    # Drop a show taken off sale
+    def remove(self, movie_id):
+        with self._lock:
+            if self._movies.pop(movie_id, None) is not None:
+                self.version += 1
+
+    def invalidate(self):
+        with self._lock:
+            self._stale = True
@@ -0,0 +1,140 @@
+import os
+
+# Settings are read from the environment so the same code runs on a laptop,
+# a kiosk or a server without edits.
+
+# Intent model
+INTENTS_PATH = os.environ.get("TICKETGENIE_INTENTS", "intents.json")
+MODEL_DIR = os.environ.get("TICKETGENIE_MODEL_DIR", "models")
+# Below this probability the bot answers with the "didn't understand" reply
+INTENT_CONFIDENCE_THRESHOLD = float(os.environ.get("TICKETGENIE_INTENT_THRESHOLD", "0.35"))
+INTENT_TOP_K = int(os.environ.get("TICKETGENIE_INTENT_TOP_K", "3"))
+# Seconds between checks of the intents file for edits; a changed file is
+# retrained in the background and swapped in once it passes validation
+INTENTS_WATCH_INTERVAL = float(os.environ.get("TICKETGENIE_INTENTS_WATCH_INTERVAL", "5"))
+# Share of each intent's patterns held out to validate a retrained model,
+# and the held-out accuracy it must reach (or at least match the model it
+# replaces) to be swapped in
+INTENT_HOLDOUT = float(os.environ.get("TICKETGENIE_INTENT_HOLDOUT", "0.2"))
+INTENT_MIN_ACCURACY = float(os.environ.get("TICKETGENIE_INTENT_MIN_ACCURACY", "0.8"))
+
+# Storage backend: "mysql" (the server below) or "sqlite" (one local file,
+# for single-screen venues, kiosks and tests; see storage.py)
+DB_BACKEND = os.environ.get("TICKETGENIE_DB_BACKEND", "mysql")
+SQLITE_PATH = os.environ.get("TICKETGENIE_SQLITE_PATH", "ticketgenie.db")
+
+# MySQL
+DB_HOST = os.environ.get("TICKETGENIE_DB_HOST", "localhost")
+DB_PORT = int(os.environ.get("TICKETGENIE_DB_PORT", "3306"))
+DB_USER = os.environ.get("TICKETGENIE_DB_USER", "root")
+DB_PASSWORD = os.environ.get("TICKETGENIE_DB_PASSWORD", "")
+DB_NAME = os.environ.get("TICKETGENIE_DB_NAME", "moviedb")
+# One pool per process, shared by every Streamlit session (mysql-connector caps it at 32)
+DB_POOL_SIZE = int(os.environ.get("TICKETGENIE_DB_POOL_SIZE", "8"))
+# Seconds to wait for a free pooled connection (MySQL) or the write lock
+# (SQLite) before giving up
+DB_POOL_TIMEOUT = float(os.environ.get("TICKETGENIE_DB_POOL_TIMEOUT", "10"))
+# Connections idle longer than this are pinged (and reconnected) before use
+DB_POOL_PING_AFTER = float(os.environ.get("TICKETGENIE_DB_POOL_PING_AFTER", "30"))
+# Times a booking transaction is run again after MySQL rolls it back to
+# break a deadlock or a row lock wait times out
+DB_DEADLOCK_RETRIES = int(os.environ.get("TICKETGENIE_DB_DEADLOCK_RETRIES", "3"))
+
+# Seconds the in-process movie catalog is served before it is reloaded
+CATALOG_TTL = float(os.environ.get("TICKETGENIE_CATALOG_TTL", "30"))
+# Shows per page when the bot lists what is on
+LISTING_PAGE_SIZE = int(os.environ.get("TICKETGENIE_LISTING_PAGE_SIZE", "10"))
+
+# Seat holds: minutes a hold survives between choosing a ticket count and
+# confirming, and how often the sweeper returns expired holds to the pool
+HOLD_TTL_MINUTES = float(os.environ.get("TICKETGENIE_HOLD_TTL_MINUTES", "10"))
+HOLD_SWEEP_INTERVAL = float(os.environ.get("TICKETGENIE_HOLD_SWEEP_INTERVAL", "30"))
+
+# Admission control for busy shows (see admission.py): sessions let into
+# the booking flow per second per show and the burst allowed, sessions
+# booking one show at once, and the longest line before newcomers are
+# asked to come back later
+ADMISSION_RATE = float(os.environ.get("TICKETGENIE_ADMISSION_RATE", "5"))
+ADMISSION_BURST = int(os.environ.get("TICKETGENIE_ADMISSION_BURST", "20"))
+ADMISSION_MAX_IN_FLIGHT = int(os.environ.get("TICKETGENIE_ADMISSION_MAX_IN_FLIGHT", "100"))
+ADMISSION_MAX_QUEUE = int(os.environ.get("TICKETGENIE_ADMISSION_MAX_QUEUE", "50000"))
+# Seconds an admitted session keeps its slot without sending a message,
+# and a queued one keeps its place
+ADMISSION_LEASE_SECONDS = float(os.environ.get("TICKETGENIE_ADMISSION_LEASE_SECONDS", "180"))
+ADMISSION_QUEUE_IDLE = float(os.environ.get("TICKETGENIE_ADMISSION_QUEUE_IDLE", "300"))
+# Per-show limits as JSON, e.g. {"42": {"rate": 2, "max_in_flight": 40}}
+ADMISSION_SHOWS = os.environ.get("TICKETGENIE_ADMISSION_SHOWS", "")
+
+# Outgoing mail. Point SMTP_HOST/PORT at smtp_stub.py (with SMTP_SSL=0) to
+# run without a real provider. There is no default account: without
+# SMTP_USER and SMTP_PASSWORD only a server on this machine is used, and
+# otherwise ticket emails wait in the outbox until they are set.
+SMTP_HOST = os.environ.get("TICKETGENIE_SMTP_HOST", "smtp.gmail.com")
+SMTP_PORT = int(os.environ.get("TICKETGENIE_SMTP_PORT", "465"))
+SMTP_SSL = os.environ.get("TICKETGENIE_SMTP_SSL", "1") == "1"
+SMTP_USER = os.environ.get("TICKETGENIE_SMTP_USER", "")
+SMTP_PASSWORD = os.environ.get("TICKETGENIE_SMTP_PASSWORD", "")
+MAIL_SENDER = os.environ.get("TICKETGENIE_MAIL_SENDER", SMTP_USER or "tickets@localhost")
+# SQLite file holding the outbox of queued ticket emails
+OUTBOX_PATH = os.environ.get("TICKETGENIE_OUTBOX", "outbox.db")
+MAIL_WORKERS = int(os.environ.get("TICKETGENIE_MAIL_WORKERS", "2"))
+MAIL_MAX_ATTEMPTS = int(os.environ.get("TICKETGENIE_MAIL_MAX_ATTEMPTS", "6"))
+# Retry n waits MAIL_BACKOFF_BASE * 2**(n-1) seconds, capped at MAIL_BACKOFF_MAX
+MAIL_BACKOFF_BASE = float(os.environ.get("TICKETGENIE_MAIL_BACKOFF_BASE", "5"))
+MAIL_BACKOFF_MAX = float(os.environ.get("TICKETGENIE_MAIL_BACKOFF_MAX", "600"))
+# Seconds a worker's claim on a message lasts; an unfinished claim is
+# taken to be a dead worker's and the message is sent again. It must cover
+# a batch of 10 messages, each allowed two 30-second SMTP attempts.
+MAIL_CLAIM_LEASE = float(os.environ.get("TICKETGENIE_MAIL_CLAIM_LEASE", "900"))
+# Sent and failed messages are deleted from the outbox after this many
+# days (0 keeps them); idle workers check at most once an hour
+MAIL_RETENTION_DAYS = float(os.environ.get("TICKETGENIE_MAIL_RETENTION_DAYS", "14"))
+# A worker's SMTP connection is closed after this many idle seconds
+SMTP_IDLE_TIMEOUT = float(os.environ.get("TICKETGENIE_SMTP_IDLE_TIMEOUT", "60"))
+
+# Default auditorium for a show's seat map: blocks x rows x seats per row
+SEAT_LAYOUT = os.environ.get("TICKETGENIE_SEAT_LAYOUT", "5x20x50")
+
+# Signed ticket codes (see ticket_codes.py). Gates must share the key: set
+# TICKET_SECRET everywhere, or copy the key file created on first use.
+TICKET_SECRET = os.environ.get("TICKETGENIE_TICKET_SECRET", "")
+TICKET_KEY_PATH = os.environ.get("TICKETGENIE_TICKET_KEY", "ticket.key")
+# Hours after the show starts that its tickets still open the gate
+TICKET_GRACE_HOURS = float(os.environ.get("TICKETGENIE_TICKET_GRACE_HOURS", "6"))
+# Seconds between a gate pushing its scans to the database and pulling the
+# other gates' scans and new cancellations
+GATE_SYNC_INTERVAL = float(os.environ.get("TICKETGENIE_GATE_SYNC_INTERVAL", "5"))
+
+# API server (see api_server.py): listen address, threads running
+# conversation turns, and seconds an idle connection is kept open
+API_HOST = os.environ.get("TICKETGENIE_API_HOST", "127.0.0.1")
+API_PORT = int(os.environ.get("TICKETGENIE_API_PORT", "8080"))
+API_WORKERS = int(os.environ.get("TICKETGENIE_API_WORKERS", "16"))
+API_IDLE_TIMEOUT = float(os.environ.get("TICKETGENIE_API_IDLE_TIMEOUT", "300"))
+# Bearer token for the /reports routes (sales and occupancy). Empty keeps
+# them off the server; sales.py prints the same reports.
+REPORTS_TOKEN = os.environ.get("TICKETGENIE_REPORTS_TOKEN", "")
+# Conversation state between messages: "memory" or "sqlite" (SESSION_DB).
+# Sessions idle for SESSION_TTL seconds are dropped; the memory store keeps
+# at most SESSION_MAX.
+SESSION_STORE = os.environ.get("TICKETGENIE_SESSION_STORE", "memory")
+SESSION_DB = os.environ.get("TICKETGENIE_SESSION_DB", "sessions.db")
+SESSION_TTL = float(os.environ.get("TICKETGENIE_SESSION_TTL", "3600"))
+SESSION_MAX = int(os.environ.get("TICKETGENIE_SESSION_MAX", "100000"))
+# Seconds between sweeps that drop expired sessions and release their holds
+SESSION_PURGE_INTERVAL = float(os.environ.get("TICKETGENIE_SESSION_PURGE_INTERVAL", "60"))
+
+# Metrics (see metrics.py): Prometheus text on http://METRICS_HOST:METRICS_PORT/metrics
+# (0 = off) and/or rewritten to METRICS_FILE every METRICS_FILE_INTERVAL
+# seconds. TIMING_LOG gets one JSON line per timed stage.
+METRICS_HOST = os.environ.get("TICKETGENIE_METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.environ.get("TICKETGENIE_METRICS_PORT", "0"))
+METRICS_FILE = os.environ.get("TICKETGENIE_METRICS_FILE", "")
+METRICS_FILE_INTERVAL = float(os.environ.get("TICKETGENIE_METRICS_FILE_INTERVAL", "15"))
+TIMING_LOG = os.environ.get("TICKETGENIE_TIMING_LOG", "")
+
+# Chat history: messages kept on screen (older ones are paged in with
+# "Load earlier") and where full transcripts are written
+CHAT_WINDOW = int(os.environ.get("TICKETGENIE_CHAT_WINDOW", "30"))
+TRANSCRIPT_DIR = os.environ.get("TICKETGENIE_TRANSCRIPT_DIR", "transcripts")
+TRANSCRIPT_MAX_BYTES = int(os.environ.get("TICKETGENIE_TRANSCRIPT_MAX_BYTES", str(1024 * 1024)))
@@ -0,0 +1,259 @@
+import functools
+import random
+import time
+from datetime import date, datetime
+
+import config
+import metrics
+from catalog import MovieCatalog
+from metrics import timed
+from movie_search import MovieIndex
+from storage import get_storage
+
+
+# Borrow a connection from the configured backend (see storage.py). Commits
+# when the block succeeds, rolls back when it raises.
+def connection():
+    return get_storage().connection()
+
+# Decorator for a function that is one whole transaction: when the database
+# rolls it back to break a deadlock or a row lock wait times out, run it
+# again after a short random pause, up to DB_DEADLOCK_RETRIES times
+def retry_transaction(fn):
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        for attempt in range(config.DB_DEADLOCK_RETRIES + 1):
+            try:
+                return fn(*args, **kwargs)
+            except Exception as exc:
+                if attempt == config.DB_DEADLOCK_RETRIES or not get_storage().is_transient(exc):
+                    raise
+                metrics.transaction_retries.inc(fn.__name__)
+                time.sleep(random.uniform(0, 0.02 * 2 ** attempt))
+    return wrapper
+
+
+@timed("db.check_login")
+def check_login(username, password):
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM users WHERE username=%s", (username,))
+        user = cursor.fetchone()
+        cursor.close()
+
+    if user is None:
+        return False  # User not found
+    return user[2] == password  # user[2] is the plain-text password
+
+# Register new user
+@timed("db.register_user")
+def register_user(username, password):
+    with connection() as conn:
+        cursor = conn.cursor()
+
+        # Check if username already exists
+        cursor.execute("SELECT * FROM users WHERE username=%s", (username,))
+        user = cursor.fetchone()
+        if user:
+            cursor.close()
+            return False  # Username already exists
+
+        # Insert new user into database with plain text password
+        cursor.execute("INSERT INTO users (username, password) VALUES (%s, %s)", (username, password))
+        cursor.close()
+    return True
+
+# Function to load all movies still on sale (not withdrawn)
+@timed("db.load_movies")
+def load_movies():
+    with connection() as conn:
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute("SELECT * FROM movies WHERE withdrawn_at IS NULL")
+        movies = cursor.fetchall()
+        cursor.close()
+    return movies
+
+# Cached catalog shared by every session; see catalog.MovieCatalog
+movie_catalog = MovieCatalog(load_movies, config.CATALOG_TTL)
+
+# Search over the cached catalog; see movie_search.MovieIndex
+movie_index = MovieIndex(movie_catalog)
+
+# One page of the shows worth listing, soonest first, filtered and paged
+# by the database: from `today` on, with seats left and not withdrawn,
+# optionally one genre.
+# Returns (movies, whether there is another page).
+@timed("db.load_movies_page")
+def load_movies_page(page=0, page_size=None, genre=None, today=None):
+    page_size = page_size or config.LISTING_PAGE_SIZE
+    clauses, params = ["Date >= %s", "available_seats > 0", "withdrawn_at IS NULL"], [today or date.today()]
+    if genre is not None:
+        clauses.append("genre = %s")
+        params.append(genre)
+    with connection() as conn:
+        cursor = conn.cursor(dictionary=True)
+        # One extra row tells whether another page follows
+        cursor.execute(
+            f"SELECT * FROM movies WHERE {' AND '.join(clauses)}"
+            " ORDER BY Date, showtiming, id LIMIT %s OFFSET %s",
+            params + [page_size + 1, page * page_size]
+        )
+        movies = cursor.fetchall()
+        cursor.close()
+    return movies[:page_size], len(movies) > page_size
+
+# Upcoming shows with seats left matching free text like "avengers tonight"
+def search_movies(query, limit=5):
+    return movie_index.search(query, limit=limit)
+
+# One movie from the catalog cache (seat count may be up to CATALOG_TTL old)
+def get_movie(movie_id):
+    return movie_catalog.get(movie_id)
+
+# Function to add a new movie (one show). For schedules, see movie_import.py
+@timed("db.save_movie")
+def save_movie(name, genre, rating, available_seats, price=0, show_date=None, showtiming=None):
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "INSERT INTO movies (name, genre, rating, available_seats, Price, Date, showtiming)"
+            " VALUES (%s, %s, %s, %s, %s, %s, %s)",
+            (name, genre, rating, available_seats, price, show_date, showtiming)
+        )
+        movie_id = cursor.lastrowid
+        cursor.close()
+    movie_catalog.invalidate()
+    return movie_id
+
+BOOKING_COLUMNS = (
+    "b.id, b.name, b.email, b.phone, b.movie_id, m.name as movie_name, b.num_tickets, b.seats, b.booking_time"
+)
+
+# WHERE clause and parameters for the optional booking filters.
+# start/end bound booking_time: start inclusive, end exclusive.
+def booking_filters(movie_id=None, email=None, start=None, end=None, booking_id=None):
+    clauses, params = [], []
+    if booking_id is not None:
+        clauses.append("b.id = %s")
+        params.append(booking_id)
+    if movie_id is not None:
+        clauses.append("b.movie_id = %s")
+        params.append(movie_id)
+    if email is not None:
+        clauses.append("b.email = %s")
+        params.append(email)
+    if start is not None:
+        clauses.append("b.booking_time >= %s")
+        params.append(start)
+    if end is not None:
+        clauses.append("b.booking_time < %s")
+        params.append(end)
+    return clauses, params
+
+# One page of bookings using keyset pagination, so page N costs the same as
+# page 1. order_by is 'id' or 'time'. Pass the returned cursor as `after`
+# to get the next page; it is None on the last page.
+#   id order:   cursor is the last booking id
+#   time order: cursor is (booking_time, id) of the last booking
+@timed("db.load_bookings_page")
+def load_bookings_page(after=None, limit=50, order_by='id', movie_id=None, email=None, start=None, end=None):
+    clauses, params = booking_filters(movie_id, email, start, end)
+    if order_by == 'id':
+        if after is not None:
+            clauses.append("b.id > %s")
+            params.append(after)
+        order = "b.id"
+    elif order_by == 'time':
+        if after is not None:
+            after_time, after_id = after
+            clauses.append("(b.booking_time > %s OR (b.booking_time = %s AND b.id > %s))")
+            params.extend([after_time, after_time, after_id])
+        order = "b.booking_time, b.id"
+    else:
+        raise ValueError(f"order_by must be 'id' or 'time', not {order_by!r}")
+    where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+    with connection() as conn:
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute(
+            f"SELECT {BOOKING_COLUMNS} FROM bookings b JOIN movies m ON b.movie_id = m.id"
+            f"{where} ORDER BY {order} LIMIT %s",
+            params + [limit]
+        )
+        bookings = cursor.fetchall()
+        cursor.close()
+    next_cursor = None
+    if len(bookings) == limit:
+        last = bookings[-1]
+        next_cursor = last['id'] if order_by == 'id' else (last['booking_time'], last['id'])
+    return bookings, next_cursor
+
+# Yield every matching booking, in id order, through an unbuffered cursor:
+# rows are read off the socket fetch_size at a time, so memory stays flat
+# however big the table is. Holds one pooled connection until the
+# generator is exhausted or closed.
+def stream_bookings(movie_id=None, email=None, start=None, end=None, fetch_size=1000):
+    clauses, params = booking_filters(movie_id, email, start, end)
+    where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+    with connection() as conn:
+        cursor = conn.cursor(dictionary=True, buffered=False)
+        cursor.execute(
+            f"SELECT {BOOKING_COLUMNS} FROM bookings b JOIN movies m ON b.movie_id = m.id"
+            f"{where} ORDER BY b.id",
+            params
+        )
+        finished = False
+        try:
+            while True:
+                rows = cursor.fetchmany(fetch_size)
+                if not rows:
+                    finished = True
+                    break
+                yield from rows
+        finally:
+            if not finished:
+                # Stopped early: drain the result so the connection can be reused
+                conn.consume_results()
+            cursor.close()
+
+# Bookings for one show with the movie fields a ticket needs
+@timed("db.load_show_bookings")
+def load_show_bookings(movie_id):
+    with connection() as conn:
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute(
+            "SELECT b.id, b.movie_id, b.name, b.email, b.phone, b.num_tickets, b.seats, b.booking_time, m.name as movie_name, m.Date, m.showtiming "
+            "FROM bookings b JOIN movies m ON b.movie_id = m.id WHERE b.movie_id = %s ORDER BY b.id",
+            (movie_id,)
+        )
+        bookings = cursor.fetchall()
+        cursor.close()
+    return bookings
+
+# Insert a booking row with an open cursor, inside the caller's transaction
+def insert_booking(cursor, name, email, phone, movie_id, num_tickets=1, seats=None):
+    booking_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    cursor.execute(
+        "INSERT INTO bookings (name, email, phone, movie_id, num_tickets, seats, booking_time) VALUES (%s, %s, %s, %s, %s, %s, %s)",
+        (name, email, phone, movie_id, num_tickets, seats, booking_time)
+    )
+    return cursor.lastrowid  # ✅ Fetch the auto-incremented ID from DB
+
+# Add to each show's row in show_sales (see sales.py) with an open cursor,
+# inside the caller's transaction. changes is {movie_id: (bookings,
+# tickets)}, negative to take sales back; revenue moves by tickets at the
+# show's current Price. Taken last, after any movies row.
+#
+# One upsert per show: the first sale creates the row and later ones add to
+# it, with no update-then-insert gap for two first sales to deadlock in.
+def record_sales(cursor, changes):
+    now = datetime.now()
+    for movie_id in sorted(changes):
+        bookings, tickets = changes[movie_id]
+        cursor.execute(
+            "INSERT INTO show_sales (movie_id, show_date, bookings, tickets_sold, revenue, updated_at)"
+            " SELECT id, Date, %s, %s, %s * Price, %s FROM movies WHERE id = %s"
+            " ON DUPLICATE KEY UPDATE bookings = bookings + VALUES(bookings),"
+            " tickets_sold = tickets_sold + VALUES(tickets_sold), revenue = revenue + VALUES(revenue),"
+            " updated_at = VALUES(updated_at)",
+            (bookings, tickets, tickets, now, movie_id)
+        )
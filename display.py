@@ -0,0 +1,39 @@
+from functools import lru_cache
+
+# How shows are written in chat replies and on tickets. A listing line is
+# built once per show and cached; only the seat count, which changes with
+# every booking, is filled in per reply.
+
+
+# Convert showtiming (timedelta) to 12-hour format
+def format_show_time(td):
+    if td is None:
+        return "TBA"
+    total_seconds = int(td.total_seconds())
+    hours, remainder = divmod(total_seconds, 3600)
+    minutes, _ = divmod(remainder, 60)
+    return f"{hours % 12 or 12}:{minutes:02} {'AM' if hours < 12 else 'PM'}"
+
+
+def format_show_date(day):
+    return day.strftime('%d-%b-%Y') if day is not None else "TBA"
+
+
+@lru_cache(maxsize=8192)
+def _show_label(movie_id, name, genre, rating, show_date, showtiming, price):
+    return (
+        f"{movie_id}. {name} ({genre}, Rating: {rating},Date: {format_show_date(show_date)}"
+        f" Showtime: {format_show_time(showtiming)},Price:{price}"
+    )
+
+
+def listing_line(movie):
+    label = _show_label(
+        movie['id'], movie['name'], movie['genre'], movie['rating'],
+        movie['Date'], movie['showtiming'], movie['Price'],
+    )
+    return f"{label}, Available Seats: {movie['available_seats']})"
+
+
+def movie_listing(movies):
+    return "\n".join(listing_line(movie) for movie in movies)
@@ -0,0 +1,332 @@
+from datetime import datetime, timedelta
+
+import config
+from admission import FULL, QUEUED, get_controller
+from cancellations import cancel_booking
+from db import get_movie, load_movies_page, search_movies
+from display import format_show_date, format_show_time, movie_listing
+from intent_classifier import get_classifier
+from mail_queue import get_queue
+from metrics import timed
+from reservations import confirm_hold, place_hold, release_hold
+from seatmap import describe_seats
+from ticket_pdf import generate_ticket_pdf, sanitize_text, ticket_filename
+
+# The booking conversation as a state machine with no UI attached. A
+# session's state is a plain JSON-serializable dict; handle(state, message)
+# returns the reply and the next state without touching the one it was
+# given, so the state can live anywhere (Streamlit's session_state, the
+# API server's session store). The steps, in state['expecting']:
+#   greeting -> movie_id -> num_tickets -> user_info -> delete_prompt
+#   -> delete_ticket, and None once a conversation is finished. A session
+#   choosing a show that is too busy to let it in yet (see admission.py)
+#   goes through 'waiting' between movie_id and num_tickets.
+
+STEPS = ('greeting', 'movie_id', 'waiting', 'num_tickets', 'user_info', 'delete_prompt', 'delete_ticket')
+LEAVE_WORDS = ('leave', 'cancel', 'exit', 'quit')
+
+
+def new_state():
+    return {
+        "expecting": 'greeting',
+        "movie_id": None,
+        "num_tickets": None,
+        "hold_id": None,
+        "booking": None,
+        "page": None,
+        "admission": None,
+    }
+
+
+# What one message produced. ticket is (file name, PDF bytes) on the turn
+# that completes a booking, else None.
+class Turn:
+    def __init__(self, reply, state, ticket=None):
+        self.reply = reply
+        self.state = state
+        self.ticket = ticket
+
+
+def calculate_price(movie_id, num_tickets):
+    movie = get_movie(movie_id)
+    if movie:
+        # Price per ticket fetched from the database
+        return movie['Price'] * num_tickets
+    return 0
+
+
+# booking_info for ticket_pdf from the JSON-friendly booking kept in state
+def ticket_info(booking):
+    info = dict(booking)
+    hours, minutes, seconds = (int(part) for part in booking['show_time'].split(":"))
+    info['show_time'] = timedelta(hours=hours, minutes=minutes, seconds=seconds)
+    info['seats'] = [tuple(seat) for seat in booking['seats']]
+    return info
+
+
+def _search_reply(query, movies):
+    return f"🔍 Shows matching **{query}**:\n\n{movie_listing(movies)}\n\nPlease enter the **Movie ID** to book."
+
+
+def _wait_time(seconds):
+    if seconds < 60:
+        return "less than a minute"
+    minutes = round(seconds / 60)
+    return f"about {minutes} minute{'s' if minutes != 1 else ''}"
+
+
+def _queue_reply(movie, answer):
+    wait = f" ({_wait_time(answer['eta'])} to go)" if answer['eta'] is not None else ""
+    return (
+        f"⏳ Lots of people are booking **{movie['name']}** right now. "
+        f"You are number **{answer['position']}** in line{wait}.\n\n"
+        "Send any message to check your place, or **leave** to pick another show."
+    )
+
+
+class BookingEngine:
+    # mail is the MailQueue that ticket and cancellation emails go through,
+    # the process-wide one by default. send_email(to, pdf_bytes, file_name)
+    # replaces how a ticket is delivered.
+    def __init__(self, classifier=None, send_email=None, admission=None, mail=None):
+        self._classifier = classifier
+        self._mail = mail
+        self.send_email = send_email or (lambda to, pdf_bytes, name: self.mail.enqueue_ticket(to, pdf_bytes, name))
+        self.admission = admission or get_controller()
+
+    @property
+    def mail(self):
+        return self._mail if self._mail is not None else get_queue()
+
+    @property
+    def classifier(self):
+        # get_classifier() picks up a retrained model; a fixed one stays put
+        return self._classifier or get_classifier()
+
+    def handle(self, state, message):
+        state = dict(state)
+        step = state['expecting'] if state['expecting'] in STEPS else 'idle'
+        with timed(f"dialog.{step}"):
+            reply, ticket = getattr(self, f"_on_{step}")(state, message)
+        return Turn(reply, state, ticket)
+
+    # A session is over (logged out, expired): give back what it holds
+    def end(self, state):
+        if state.get('hold_id'):
+            release_hold(state['hold_id'])
+        self._leave_line(state)
+
+    def _reset(self, state):
+        self._leave_line(state)
+        state['expecting'] = None
+        state['movie_id'] = None
+        state['num_tickets'] = None
+
+    # Give up the session's slot or place in line for a show, if any
+    def _leave_line(self, state):
+        admission = state.get('admission')
+        if admission:
+            self.admission.release(admission['movie_id'], admission['ticket'])
+            state['admission'] = None
+
+    # Ask admission control to let the session book this show. Returns None
+    # when it may go ahead, else the reply to send: the session is in line
+    # (and now 'waiting') or the line is full.
+    def _admit(self, state, movie):
+        admission = state.get('admission')
+        if admission and admission['movie_id'] != movie['id']:
+            self._leave_line(state)
+            admission = None
+        answer = self.admission.request(movie['id'], admission['ticket'] if admission else None)
+        if answer['status'] == FULL:
+            state['admission'] = None
+            state['expecting'] = 'movie_id'
+            return f"🔥 **{movie['name']}** is in very high demand right now. Please try again in a few minutes, or enter another **Movie ID**."
+        state['admission'] = {"movie_id": movie['id'], "ticket": answer['ticket']}
+        if answer['status'] == QUEUED:
+            state['movie_id'] = movie['id']
+            state['expecting'] = 'waiting'
+            return _queue_reply(movie, answer)
+        return None
+
+    def _selected(self, state, movie):
+        state['movie_id'] = movie['id']
+        state['expecting'] = 'num_tickets'
+        return f"You selected **{movie['name']}**.\n\nHow many tickets would you like to book? (Available: {movie['available_seats']})"
+
+    # Shows matching free text, for messages that may name a movie; an
+    # empty list when they name none
+    def _find_shows(self, state, message):
+        movies = search_movies(message)
+        if movies:
+            state['expecting'] = 'movie_id'
+        return movies
+
+    # One page of upcoming shows; "more" at the movie id step shows the next
+    def _listing(self, state, page):
+        movies, more = load_movies_page(page)
+        state['page'] = page
+        state['expecting'] = 'movie_id'
+        if not movies:
+            return "😔 No more upcoming shows with seats left." if page else "😔 There are no upcoming shows with seats left."
+        prompt = "Type **more** for more shows, or enter the **Movie ID** to book." if more else "Please enter the **Movie ID** to book."
+        return f"🎬 Here are the available movies:\n\n{movie_listing(movies)}\n\n{prompt}"
+
+    def _on_greeting(self, state, message):
+        intent = self.classifier.predict_one(message)['tag']
+        if intent == "greeting":
+            return "👋 Hello! Would you like to book a movie?", None
+        # "avengers tonight" goes straight to the matching shows
+        if intent in (None, "book_movie"):
+            movies = self._find_shows(state, message)
+            if movies:
+                return _search_reply(message, movies), None
+        if intent == "book_movie":
+            return self._listing(state, 0), None
+        return "🤖 I'm here to help! Say 'hello' or 'book a movie' to get started.", None
+
+    def _on_movie_id(self, state, message):
+        if message.lower() in ('more', 'next') and state.get('page') is not None:
+            return self._listing(state, state['page'] + 1), None
+        if message.isdigit():
+            movie = get_movie(int(message))
+            if not movie:
+                return "💔 Invalid movie ID. Please try again.", None
+        else:
+            movies = search_movies(message)
+            if not movies:
+                return "🔍 No upcoming shows match that. Please enter a valid movie ID or name.", None
+            if len(movies) > 1:
+                return _search_reply(message, movies), None
+            movie = movies[0]
+        if movie['available_seats'] <= 0:
+            return f"💔 Sorry, **{movie['name']}** has **no available seats**. Please select another movie.", None
+        reply = self._admit(state, movie)
+        if reply:
+            return reply, None
+        return self._selected(state, movie), None
+
+    def _on_waiting(self, state, message):
+        movie = get_movie(state['movie_id'])
+        if message.lower() in LEAVE_WORDS or not movie or movie['available_seats'] <= 0:
+            self._leave_line(state)
+            state['expecting'] = 'movie_id'
+            if message.lower() in LEAVE_WORDS:
+                return "👍 You have left the line. Please enter the **Movie ID** you want to book.", None
+            return "💔 Sorry, this show has sold out while you were waiting. Please select another movie.", None
+        reply = self._admit(state, movie)
+        if reply:
+            return reply, None
+        return "🎉 It's your turn! " + self._selected(state, movie), None
+
+    def _on_num_tickets(self, state, message):
+        if not message.isdigit():
+            return "Please enter a valid number for tickets.", None
+        num_tickets = int(message)
+        movie = get_movie(state['movie_id'])
+        if movie is None:
+            # Deleted or cancelled since it was picked
+            self._leave_line(state)
+            state['expecting'] = 'movie_id'
+            return "💔 Sorry, this show is no longer available. Please enter another **Movie ID**.", None
+        if not 1 <= num_tickets <= movie['available_seats']:
+            return f"⚠️ Please enter a number between 1 and {movie['available_seats']}.", None
+        # Renews the session's slot; one idle past its lease lines up again
+        reply = self._admit(state, movie)
+        if reply:
+            return reply, None
+        if state['hold_id']:
+            release_hold(state['hold_id'])
+        # Take the seats out of the pool now; they come back if the hold expires
+        state['hold_id'] = place_hold(movie['id'], num_tickets)
+        if not state['hold_id']:
+            state['expecting'] = 'movie_id' if num_tickets == 1 else 'num_tickets'
+            if num_tickets == 1:
+                self._leave_line(state)
+            return f"💔 Sorry, there are no longer {num_tickets} seats left for **{movie['name']}**. Please enter a smaller number or another **Movie ID**.", None
+        state['num_tickets'] = num_tickets
+        state['expecting'] = 'user_info'
+        total_price = calculate_price(movie['id'], num_tickets)
+        return f"Great! The total price for {num_tickets} tickets is ₹{total_price}. Your seats are held for {config.HOLD_TTL_MINUTES:g} minutes. Now, please enter your **Name, Email, and Phone**, separated by commas.", None
+
+    def _on_user_info(self, state, message):
+        parts = message.split(',')
+        if len(parts) != 3:
+            return "Please enter **Name, Email, and Phone** properly, separated by commas.", None
+        name, email, phone = [p.strip() for p in parts]
+        # The held seats become the booking, unless the hold has expired
+        confirmed = confirm_hold(state['hold_id'], name, email, phone)
+        state['hold_id'] = None
+        self._leave_line(state)
+        if confirmed is None:
+            state['expecting'] = 'movie_id'
+            return "⌛ Sorry, your seat hold expired. Please enter the **Movie ID** to pick again.", None
+
+        booking_id, seats = confirmed
+        movie = get_movie(state['movie_id'])
+        state['booking'] = {
+            "booking_id": booking_id,
+            "movie_id": movie['id'],
+            "name": sanitize_text(name),
+            "email": sanitize_text(email),
+            "phone": sanitize_text(phone),
+            "movie": movie['name'],
+            "show_date": str(movie["Date"]),
+            "booking_time": datetime.now().strftime("%Y-%m-%d %H:%M"),
+            "show_time": str(movie["showtiming"]),
+            "seats": [list(seat) for seat in seats],
+        }
+        info = ticket_info(state['booking'])
+
+        # Render the ticket once; the same bytes go to the email and the client
+        pdf_bytes = generate_ticket_pdf(info)
+        file_name = ticket_filename(info)
+        self.send_email(email, pdf_bytes, file_name)
+
+        state['expecting'] = 'delete_prompt'
+        reply = (
+            f"📧 **Booking Successful!**<br>"
+            f"🆔 Booking ID: {booking_id}<br>"
+            f"🎬 Movie: {movie['name']}<br>"
+            f"📅 Date: {format_show_date(movie['Date'])}<br>"
+            f"⏰ Time: {format_show_time(info['show_time'])}<br>"
+            f"💺 Seats: {describe_seats(seats)}<br>"
+            f"👤 Name: {name}<br>"
+            f"📧 Email: {email}<br>"
+            f"📞 Phone: {phone}"
+            "\n\n❓ Do you want to delete any ticket? (yes/no)"
+        )
+        return reply, (file_name, pdf_bytes)
+
+    def _on_delete_prompt(self, state, message):
+        if message.lower() in ['yes', 'y']:
+            state['expecting'] = 'delete_ticket'
+            return "Pls enter Booking ID you want to delete.", None
+        self._reset(state)
+        return "Alright! Thanks for using our service! 🎬✨", None
+
+    def _on_delete_ticket(self, state, message):
+        if not message.isdigit():
+            return "Please enter a valid Booking ID.", None
+        booking_id = int(message)
+        # Only the booking made in this conversation: ids are sequential,
+        # and anyone could cancel a stranger's seats by guessing one
+        booking = state.get('booking')
+        if not booking or booking['booking_id'] != booking_id:
+            mine = f" (yours is {booking['booking_id']})" if booking else ""
+            return f"💔 You can only delete the booking made in this chat{mine}. Please check the ID.", None
+        if not cancel_booking(booking_id, mail=self.mail):
+            return f"💔 No booking with ID {booking_id} was found. Please check the ID.", None
+        self._reset(state)
+        return f"✅ Successfully deleted booking with ID {booking_id}!", None
+
+    def _on_idle(self, state, message):
+        if "book movie" in message.lower() or "book ticket" in message.lower():
+            return self._listing(state, 0), None
+        classifier = self.classifier
+        prediction = classifier.predict_one(message)
+        if prediction['tag'] in (None, "book_movie"):
+            movies = self._find_shows(state, message)
+            if movies:
+                return _search_reply(message, movies), None
+        return classifier.response_for(prediction), None
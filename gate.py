@@ -0,0 +1,204 @@
+import argparse
+import sys
+import threading
+import time
+from datetime import datetime
+
+import config
+import metrics
+from db import connection
+from ticket_codes import InvalidTicket, decode
+
+# Offline ticket checks at the entry gates. A Gate verifies the signed code
+# from ticket_codes.py with its key alone and keeps two sets in memory:
+#   - scanned: tickets already let in, by (booking, block, row, seat),
+#   - revoked: booking ids that have been cancelled,
+# so a scan never waits on the database. A sync thread brings the sets and
+# the database together every GATE_SYNC_INTERVAL seconds: it writes this
+# gate's admissions to ticket_scans and reads back other gates' admissions
+# and new cancellations.
+#
+# Plain sets rather than a Bloom filter: a false positive would turn away
+# a paying customer, and a sold-out show is only a few thousand keys.
+#
+# Two gates can each admit the same ticket inside one sync interval; the
+# unique key on ticket_scans keeps the first and the second is counted as a
+# duplicate at the next sync.
+#
+#   python gate.py --gate north-1 --show 12 < codes.txt
+
+OK = "ok"
+EPOCH = datetime(1970, 1, 1)
+
+
+class Gate:
+    def __init__(self, name, shows=None, key=None):
+        self.name = name
+        self.shows = set(shows) if shows else None
+        self.key = key
+        self.scanned = set()
+        self.revoked = set()
+        self.pending = []
+        self.duplicates = 0
+        self.lock = threading.Lock()
+        self._last_scan_id = 0
+        self._last_cancelled_at = EPOCH
+
+    # Check one code and let it in if it is good. Returns a dict with the
+    # decoded fields (when the code could be read) and 'result', one of
+    # MESSAGES; only "ok" opens the gate.
+    def scan(self, code, now=None):
+        try:
+            ticket = decode(code, self.key)
+        except InvalidTicket as exc:
+            metrics.gate_scans.inc(str(exc))
+            return {"result": str(exc)}
+        now = time.time() if now is None else now
+        ticket_key = (ticket['booking_id'],) + ticket['seat']
+        with self.lock:
+            if self.shows is not None and ticket['movie_id'] not in self.shows:
+                result = "wrong_show"
+            elif now > ticket['expires_at']:
+                result = "expired"
+            elif ticket['booking_id'] in self.revoked:
+                result = "cancelled"
+            elif ticket_key in self.scanned:
+                result = "already_used"
+            else:
+                result = OK
+                self.scanned.add(ticket_key)
+                self.pending.append(ticket_key + (ticket['movie_id'], datetime.fromtimestamp(now)))
+        metrics.gate_scans.inc(result)
+        ticket['result'] = result
+        return ticket
+
+    # Push this gate's admissions, pull everyone's since the last sync and
+    # the new cancellations. Admissions that fail to save are kept for the
+    # next try. Returns how many admissions were pushed.
+    def sync(self):
+        with self.lock:
+            pending, self.pending = self.pending, []
+        try:
+            scans, cancelled = self._exchange(pending)
+        except Exception:
+            with self.lock:
+                self.pending[:0] = pending
+            raise
+        mine = {row[:4] for row in pending}
+        with self.lock:
+            for ticket_key, gate in scans:
+                self.scanned.add(ticket_key)
+                if ticket_key in mine and gate != self.name:
+                    # Another gate saved it first: the ticket went in twice
+                    self.duplicates += 1
+            self.revoked.update(cancelled)
+        return len(pending)
+
+    def _exchange(self, pending):
+        shows = sorted(self.shows) if self.shows is not None else []
+        show_filter = f"movie_id IN ({', '.join(['%s'] * len(shows))}) AND " if shows else ""
+        with connection() as conn:
+            cursor = conn.cursor()
+            if pending:
+                cursor.executemany(
+                    "INSERT IGNORE INTO ticket_scans"
+                    " (booking_id, seat_block, seat_row, seat_number, movie_id, scanned_at, gate)"
+                    " VALUES (%s, %s, %s, %s, %s, %s, %s)",
+                    [row + (self.name,) for row in pending]
+                )
+            cursor.execute(
+                "SELECT id, booking_id, seat_block, seat_row, seat_number, gate FROM ticket_scans"
+                f" WHERE {show_filter}id > %s ORDER BY id",
+                shows + [self._last_scan_id]
+            )
+            scans = cursor.fetchall()
+            # >=: rows cancelled in the same second as the last pull may be new
+            cursor.execute(
+                "SELECT id, cancelled_at FROM cancelled_bookings"
+                f" WHERE {show_filter}cancelled_at >= %s",
+                shows + [self._last_cancelled_at]
+            )
+            cancelled = cursor.fetchall()
+            cursor.close()
+        if scans:
+            self._last_scan_id = scans[-1][0]
+        if cancelled:
+            self._last_cancelled_at = max(row[1] for row in cancelled)
+        return [(tuple(row[1:5]), row[5]) for row in scans], [row[0] for row in cancelled]
+
+
+class GateSync(threading.Thread):
+    def __init__(self, gate, interval):
+        super().__init__(name=f"gate-sync-{gate.name}", daemon=True)
+        self.gate = gate
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.gate.sync()
+            except Exception as exc:  # keep scanning offline; retry at the next interval
+                print(f"⚠️ Gate sync failed: {exc}")
+
+    def stop(self):
+        self.stopped.set()
+
+
+# A gate loaded with the current scans and cancellations, kept in sync in
+# the background. Without shows it loads every scan ever saved, so gates
+# should name the shows they serve.
+def open_gate(name, shows=None, interval=None):
+    gate = Gate(name, shows)
+    gate.sync()
+    syncer = GateSync(gate, config.GATE_SYNC_INTERVAL if interval is None else interval)
+    syncer.start()
+    return gate, syncer
+
+
+MESSAGES = {
+    "ok": "✅ OK",
+    "malformed": "❌ not a TicketGenie ticket",
+    "bad_signature": "❌ forged or damaged ticket",
+    "wrong_show": "❌ ticket for another show",
+    "expired": "❌ ticket expired",
+    "cancelled": "❌ booking cancelled",
+    "already_used": "❌ ticket already used",
+}
+
+
+def describe(ticket):
+    message = MESSAGES[ticket['result']]
+    if 'booking_id' in ticket:
+        block, row, seat = ticket['seat']
+        where = f"block {block} row {row} seat {seat}" if block else f"ticket {seat}"
+        message += f" (booking #{ticket['booking_id']}, {where})"
+    return message
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check ticket QR codes read from stdin, one per line.")
+    parser.add_argument("--gate", required=True, help="name of this gate, recorded with each admission")
+    parser.add_argument("--show", type=int, action="append", required=True,
+                        help="movie id this gate admits; repeat for several")
+    parser.add_argument("--interval", type=float, help="seconds between syncs (default GATE_SYNC_INTERVAL)")
+    args = parser.parse_args(argv)
+
+    gate, syncer = open_gate(args.gate, args.show, args.interval)
+    print(f"🎟️ gate {args.gate}: {len(gate.scanned)} already in, {len(gate.revoked)} cancelled bookings")
+    try:
+        for line in sys.stdin:
+            if line.strip():
+                print(describe(gate.scan(line)), flush=True)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        syncer.stop()
+        gate.sync()
+    if gate.duplicates:
+        print(f"⚠️ {gate.duplicates} tickets were also let in at another gate")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
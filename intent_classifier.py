@@ -0,0 +1,191 @@
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+
+import numpy as np
+
+import config
+import model_store
+from metrics import model_reloads, timed
+
+FALLBACK_RESPONSE = "Sorry, I didn't understand that. Can you please rephrase?"
+
+
+class IntentClassifier:
+    # artifacts['runtime'] is the compiled pipeline (intent_runtime.CompiledModel)
+    def __init__(self, artifacts, threshold=None):
+        self.model = artifacts['runtime']
+        self.threshold = config.INTENT_CONFIDENCE_THRESHOLD if threshold is None else threshold
+        self.intents = artifacts['intents']
+        self.fingerprint = artifacts.get('fingerprint')
+        self.responses = {
+            intent['tag']: intent['responses'] for intent in artifacts['intents']['intents']
+        }
+        # Column i of predict_proba is the tag self.tags[i]
+        self.tags = self.model.tags
+
+    # Classify a batch of utterances with one predict_proba call. Each
+    # result has the best tag, its probability and the top_k alternatives
+    # as (tag, probability) pairs.
+    @timed("classify")
+    def predict(self, utterances, top_k=None):
+        top_k = config.INTENT_TOP_K if top_k is None else top_k
+        if not utterances:
+            return []
+        probabilities = self.model.predict_proba([u.lower() for u in utterances])
+        k = max(1, min(top_k, probabilities.shape[1]))
+        # argpartition picks the top k without sorting every row fully
+        top = np.argpartition(-probabilities, k - 1, axis=1)[:, :k]
+        rows = np.arange(len(utterances))[:, None]
+        order = np.argsort(-probabilities[rows, top], axis=1)
+        top = top[rows, order]
+
+        results = []
+        for i, utterance in enumerate(utterances):
+            alternatives = [(self.tags[j], float(probabilities[i, j])) for j in top[i]]
+            tag, probability = alternatives[0]
+            results.append({
+                "text": utterance,
+                "tag": tag if probability >= self.threshold else None,
+                "probability": probability,
+                "alternatives": alternatives,
+            })
+        return results
+
+    def predict_one(self, utterance):
+        return self.predict([utterance])[0]
+
+    def response_for(self, prediction):
+        if prediction['tag'] is None:
+            return FALLBACK_RESPONSE
+        return random.choice(self.responses[prediction['tag']])
+
+    def respond(self, utterances):
+        return [self.response_for(p) for p in self.predict(utterances)]
+
+
+_classifier = None
+_classifier_lock = threading.Lock()
+
+
+# Classifier shared by every session in the process. The first call loads
+# (or trains) it; after that it only changes when the intents watcher swaps
+# in a retrained one, so requests never wait on a refit.
+def get_classifier():
+    global _classifier
+    if _classifier is None:
+        with _classifier_lock:
+            if _classifier is None:
+                _classifier = IntentClassifier(model_store.load_artifacts())
+    return _classifier
+
+
+def _file_state(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+# Background thread that checks the intents file every interval seconds.
+# When its content changes it retrains and validates a model off the
+# request path (model_store.load_artifacts with the served intents as the
+# baseline) and swaps it in with one assignment; sessions keep using the
+# old classifier until then, and for good if the new one is rejected.
+# One per process; start_watcher() is safe to call on every rerun.
+class IntentsWatcher(threading.Thread):
+    def __init__(self, interval, intents_path=None):
+        super().__init__(name="intents-watcher", daemon=True)
+        self.interval = interval
+        self.intents_path = intents_path or config.INTENTS_PATH
+        self.stopped = threading.Event()
+        self._state = _file_state(self.intents_path)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.check()
+            except Exception as exc:  # keep serving the old model
+                model_reloads.inc("failed")
+                print(f"⚠️ Intent model reload failed: {exc}")
+
+    # Returns True when a new classifier was swapped in
+    def check(self):
+        global _classifier
+        state = _file_state(self.intents_path)
+        if state is None or state == self._state:
+            return False
+        self._state = state
+        current = get_classifier()
+        try:
+            artifacts = model_store.load_artifacts(self.intents_path, baseline=current.intents)
+        except model_store.ModelRejected as exc:
+            model_reloads.inc("rejected")
+            print(f"⚠️ Kept the current intent model, {self.intents_path} was rejected: {exc}")
+            return False
+        if artifacts['fingerprint'] == current.fingerprint:
+            return False  # touched, not changed
+        classifier = IntentClassifier(artifacts, threshold=current.threshold)
+        with _classifier_lock:
+            _classifier = classifier
+        model_reloads.inc("swapped")
+        print(f"✅ Intent model {artifacts['fingerprint']} is now serving")
+        return True
+
+    def stop(self):
+        self.stopped.set()
+
+
+_watcher = None
+
+
+def start_watcher(interval=None):
+    global _watcher
+    with _classifier_lock:
+        if _watcher is None or not _watcher.is_alive():
+            _watcher = IntentsWatcher(config.INTENTS_WATCH_INTERVAL if interval is None else interval)
+            _watcher.start()
+    return _watcher
+
+
+# Score a chat log offline: one utterance per line in, one JSON result per line out
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Classify utterances in bulk.")
+    parser.add_argument("input", nargs="?", default="-", help="text file, one utterance per line (default: stdin)")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--top-k", type=int, default=config.INTENT_TOP_K)
+    parser.add_argument("--threshold", type=float, default=None)
+    args = parser.parse_args(argv)
+
+    classifier = get_classifier()
+    if args.threshold is not None:
+        classifier = IntentClassifier(model_store.load_artifacts(), threshold=args.threshold)
+
+    source = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    try:
+        batch = []
+        for line in source:
+            line = line.strip()
+            if line:
+                batch.append(line)
+            if len(batch) >= args.batch_size:
+                _write_results(classifier.predict(batch, top_k=args.top_k))
+                batch = []
+        if batch:
+            _write_results(classifier.predict(batch, top_k=args.top_k))
+    finally:
+        if source is not sys.stdin:
+            source.close()
+
+
+def _write_results(results):
+    for result in results:
+        sys.stdout.write(json.dumps(result) + "\n")
+
+
+if __name__ == "__main__":
+    main()
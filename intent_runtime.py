@@ -0,0 +1,144 @@
+import re
+
+import numpy as np
+
+# The fitted TF-IDF + LogisticRegression pipeline compiled to plain arrays,
+# scored with NumPy alone. Serving processes load a model.npz written by
+# model_store and never import sklearn, which is only needed to train.
+#
+#   terms       vocabulary, terms[i] is feature column i
+#   idf         idf weight per column
+#   coef        (classes or 1, columns) logistic regression weights
+#   intercept   per row of coef
+#   tags        intent tag for each class, in predict_proba column order
+#   settings    token_pattern, lowercase, ngram min/max, sublinear_tf,
+#               norm and the probability link ("softmax", "ovr", "binary")
+
+# Vectorizer settings the scorer reproduces; anything else is refused at export
+SUPPORTED_VECTORIZER = {
+    "analyzer": "word",
+    "binary": False,
+    "preprocessor": None,
+    "tokenizer": None,
+    "stop_words": None,
+    "strip_accents": None,
+}
+
+
+# Arrays for CompiledModel from a fitted vectorizer, model and label encoder
+def compile_pipeline(vectorizer, model, label_encoder):
+    params = vectorizer.get_params()
+    for name, expected in SUPPORTED_VECTORIZER.items():
+        if params[name] != expected:
+            raise ValueError(f"cannot compile a vectorizer with {name}={params[name]!r}")
+    if params["norm"] not in ("l2", "l1", None):
+        raise ValueError(f"cannot compile a vectorizer with norm={params['norm']!r}")
+
+    vocabulary = vectorizer.vocabulary_
+    terms = np.empty(len(vocabulary), dtype=object)
+    for term, column in vocabulary.items():
+        terms[column] = term
+    idf = vectorizer.idf_ if params["use_idf"] else np.ones(len(terms))
+
+    coef = np.asarray(model.coef_, dtype=np.float64)
+    if coef.shape[0] == 1:
+        link = "binary"
+    elif getattr(model, "multi_class", "auto") == "ovr" or model.solver == "liblinear":
+        link = "ovr"
+    else:
+        link = "softmax"
+    low, high = params["ngram_range"]
+    return {
+        "terms": terms.astype(str),
+        "idf": np.asarray(idf, dtype=np.float64),
+        "coef": coef,
+        "intercept": np.asarray(model.intercept_, dtype=np.float64),
+        "tags": np.asarray(label_encoder.inverse_transform(model.classes_)).astype(str),
+        "settings": np.array([
+            params["token_pattern"], str(int(params["lowercase"])), str(low), str(high),
+            str(int(params["sublinear_tf"])), params["norm"] or "", link,
+        ]),
+    }
+
+
+class CompiledModel:
+    def __init__(self, arrays):
+        self.idf = arrays["idf"]
+        self.coef = arrays["coef"]
+        self.intercept = arrays["intercept"]
+        self.tags = arrays["tags"].tolist()
+        token_pattern, lowercase, low, high, sublinear, norm, link = arrays["settings"].tolist()
+        self.token_pattern = re.compile(token_pattern)
+        self.lowercase = lowercase == "1"
+        self.ngram_range = (int(low), int(high))
+        self.sublinear_tf = sublinear == "1"
+        self.norm = norm or None
+        self.link = link
+        self.vocabulary = {term: column for column, term in enumerate(arrays["terms"].tolist())}
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as arrays:
+            return cls({name: arrays[name] for name in arrays.files})
+
+    # Same terms as TfidfVectorizer's word analyzer
+    def _terms(self, text):
+        if self.lowercase:
+            text = text.lower()
+        tokens = self.token_pattern.findall(text)
+        low, high = self.ngram_range
+        if (low, high) == (1, 1):
+            return tokens
+        terms = []
+        for n in range(low, high + 1):
+            terms.extend(" ".join(tokens[i:i + n]) for i in range(len(tokens) - n + 1))
+        return terms
+
+    # Sparse TF-IDF row as (columns, weights)
+    def _features(self, text):
+        counts = {}
+        for term in self._terms(text):
+            column = self.vocabulary.get(term)
+            if column is not None:
+                counts[column] = counts.get(column, 0) + 1
+        columns = np.fromiter(counts, dtype=np.intp, count=len(counts))
+        weights = np.fromiter(counts.values(), dtype=np.float64, count=len(counts))
+        if self.sublinear_tf:
+            weights = np.log(weights) + 1
+        weights *= self.idf[columns]
+        if self.norm == "l2":
+            length = np.sqrt(weights @ weights)
+        elif self.norm == "l1":
+            length = np.abs(weights).sum()
+        else:
+            length = 0
+        if length:
+            weights /= length
+        return columns, weights
+
+    # TF-IDF matrix and scores for a block of rows at a time: one dense
+    # block is rows x vocabulary floats
+    BLOCK_ROWS = 1024
+
+    def decision_function(self, texts):
+        scores = np.empty((len(texts), self.coef.shape[0]))
+        for start in range(0, len(texts), self.BLOCK_ROWS):
+            block = texts[start:start + self.BLOCK_ROWS]
+            features = np.zeros((len(block), len(self.idf)))
+            for i, text in enumerate(block):
+                columns, weights = self._features(text)
+                features[i, columns] = weights
+            scores[start:start + len(block)] = features @ self.coef.T
+        return scores + self.intercept
+
+    # Class probabilities, columns in self.tags order, as LogisticRegression.predict_proba
+    def predict_proba(self, texts):
+        scores = self.decision_function(texts)
+        if self.link == "softmax":
+            scores -= scores.max(axis=1, keepdims=True)
+            probabilities = np.exp(scores)
+            return probabilities / probabilities.sum(axis=1, keepdims=True)
+        probabilities = 1 / (1 + np.exp(-scores))
+        if self.link == "binary":
+            return np.hstack([1 - probabilities, probabilities])
+        return probabilities / probabilities.sum(axis=1, keepdims=True)
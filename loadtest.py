@@ -0,0 +1,427 @@
+import argparse
+import http.client
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+import config
+import db
+import metrics
+import schema
+from engine import BookingEngine, new_state
+from mail_queue import MailQueue, Outbox
+from seatmap import parse_seats
+from smtp_stub import SMTPStub
+from storage import SQLiteStorage, get_storage, set_storage
+
+# Load generator for the booking conversation. Simulates --users chat
+# users, --concurrency at a time, each going through the full dialog:
+#   greeting -> movie listing -> movie id -> [waiting in line] -> ticket
+#   count -> user info -> optional cancellation (--cancel-rate), or walking
+#   away with seats held (--abandon-rate)
+# against a scratch SQLite database and a local SMTP stub, so runs are
+# repeatable on any machine. --backend configured uses the configured
+# database instead (its test movies are removed afterwards). --transport
+# http drives the same dialog through api_server.py over loopback.
+#
+# Reports throughput, p50/p95/p99 per dialog step, outcomes, error rates
+# and consistency violations (oversell, seat-counter drift, double-booked
+# seats), and writes everything to a JSON file. --compare prints the
+# latency change against an earlier run.
+#
+#   python loadtest.py --users 500 --concurrency 50 --out before.json
+#   python loadtest.py --users 500 --concurrency 50 --compare before.json
+
+STEPS = ("greeting", "movie_listing", "movie_id", "waiting", "ticket_count", "user_info", "cancel_prompt", "cancel")
+
+
+def _percentile(values, q):
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = {step: [] for step in STEPS}
+        self.errors = {step: 0 for step in STEPS}
+        self.outcomes = {}
+        self.error_messages = []
+        self.lock = threading.Lock()
+
+    def sample(self, step, seconds):
+        with self.lock:
+            self.samples[step].append(seconds)
+
+    def error(self, step, exc):
+        with self.lock:
+            self.errors[step] += 1
+            if len(self.error_messages) < 20:
+                self.error_messages.append(f"{step}: {exc!r}")
+
+    def outcome(self, name):
+        with self.lock:
+            self.outcomes[name] = self.outcomes.get(name, 0) + 1
+
+    def step_report(self):
+        report = {}
+        for step in STEPS:
+            values = sorted(self.samples[step])
+            count = len(values)
+            report[step] = {
+                "count": count,
+                "errors": self.errors[step],
+                "error_rate": round(self.errors[step] / (count + self.errors[step]), 4) if count + self.errors[step] else 0.0,
+            }
+            for name, q in (("p50_ms", 0.5), ("p95_ms", 0.95), ("p99_ms", 0.99), ("max_ms", 1.0)):
+                value = _percentile(values, q)
+                report[step][name] = round(value * 1000, 3) if value is not None else None
+        return report
+
+
+# A simulated user talking to the engine in-process
+class EngineClient:
+    def __init__(self, engine):
+        self.engine = engine
+        self.state = new_state()
+
+    def send(self, text):
+        turn = self.engine.handle(self.state, text)
+        self.state = turn.state
+        return turn.state['expecting'], turn.state['booking']
+
+    def close(self):
+        pass
+
+
+# A simulated user talking to api_server.py over HTTP keep-alive
+class HttpClient:
+    def __init__(self, host, port, username, password):
+        self.conn = http.client.HTTPConnection(host, port, timeout=60)
+        created = self._request("POST", "/sessions", {"username": username, "password": password})
+        self.session_id = created['session_id']
+
+    def _request(self, method, path, body=None):
+        self.conn.request(method, path, json.dumps(body) if body is not None else None,
+                          {"Content-Type": "application/json"})
+        response = self.conn.getresponse()
+        data = json.loads(response.read() or b"{}")
+        if response.status >= 400:
+            raise RuntimeError(f"{method} {path} -> {response.status} {data.get('error')}")
+        return data
+
+    def send(self, text):
+        turn = self._request("POST", f"/sessions/{self.session_id}/messages", {"text": text})
+        return turn['expecting'], turn['booking']
+
+    def close(self):
+        self.conn.close()
+
+
+def _simulate(user, make_client, movie_ids, args, recorder):
+    rng = random.Random(args.seed + user)
+    time.sleep(rng.random() * args.ramp)
+    try:
+        client = make_client()
+    except Exception as exc:
+        recorder.error("greeting", exc)
+        recorder.outcome("error")
+        return
+
+    def say(step, text):
+        if args.think:
+            time.sleep(rng.uniform(0, 2 * args.think))
+        started = time.perf_counter()
+        try:
+            result = client.send(text)
+        except Exception as exc:
+            recorder.error(step, exc)
+            raise
+        recorder.sample(step, time.perf_counter() - started)
+        return result
+
+    try:
+        say("greeting", "hello")
+        expecting, _ = say("movie_listing", "book a movie")
+        if expecting != 'movie_id':
+            recorder.outcome("misunderstood")
+            return
+        expecting, _ = say("movie_id", str(rng.choice(movie_ids)))
+        # A busy show puts the user in line (see admission.py); check back
+        while expecting == 'waiting':
+            time.sleep(args.poll)
+            expecting, _ = say("waiting", "status")
+        if expecting != 'num_tickets':
+            recorder.outcome("sold_out")
+            return
+        expecting, _ = say("ticket_count", str(rng.randint(1, args.max_tickets)))
+        if expecting != 'user_info':
+            recorder.outcome("sold_out")
+            return
+        if rng.random() < args.abandon_rate:
+            recorder.outcome("abandoned")  # the hold is left to expire
+            return
+        expecting, booking = say("user_info", f"Load User {user}, load{user}@example.com, 555{user:06d}")
+        if expecting != 'delete_prompt':
+            recorder.outcome("hold_expired")
+            return
+        if rng.random() < args.cancel_rate:
+            say("cancel_prompt", "yes")
+            say("cancel", str(booking['booking_id']))
+            recorder.outcome("cancelled")
+        else:
+            say("cancel_prompt", "no")
+            recorder.outcome("booked")
+    except Exception:
+        recorder.outcome("error")
+    finally:
+        client.close()
+
+
+def _create_movies(count, seats):
+    today = date.today()
+    movie_ids = []
+    with db.connection() as conn:
+        cursor = conn.cursor()
+        for i in range(count):
+            cursor.execute(
+                "INSERT INTO movies (name, genre, rating, available_seats, Price, Date, showtiming) "
+                "VALUES (%s, %s, %s, %s, %s, %s, %s)",
+                (f"loadtest-{int(time.time())}-{i}", "test", 7.5, seats, 250,
+                 today + timedelta(days=1 + i), timedelta(hours=18 + i % 5))
+            )
+            movie_ids.append(cursor.lastrowid)
+        cursor.close()
+    db.movie_catalog.invalidate()
+    return movie_ids
+
+
+def _drop_movies(movie_ids):
+    with db.connection() as conn:
+        cursor = conn.cursor()
+        for movie_id in movie_ids:
+            for table, column in (("bookings", "movie_id"), ("seat_holds", "movie_id"),
+                                  ("show_seats", "movie_id"), ("show_sales", "movie_id"), ("movies", "id")):
+                cursor.execute(f"DELETE FROM {table} WHERE {column} = %s", (movie_id,))
+        cursor.close()
+    db.movie_catalog.invalidate()
+
+
+# Per-show invariants after the run. Bookings, not holds, are the source of
+# truth for sold seats, since cancelled bookings give their seats back.
+def _check_consistency(movie_ids, seats):
+    problems = []
+    shows = {}
+    with db.connection() as conn:
+        cursor = conn.cursor()
+        for movie_id in movie_ids:
+            cursor.execute("SELECT available_seats FROM movies WHERE id = %s", (movie_id,))
+            available = cursor.fetchone()[0]
+            cursor.execute("SELECT num_tickets, seats FROM bookings WHERE movie_id = %s", (movie_id,))
+            rows = cursor.fetchall()
+            booked = sum(row[0] for row in rows)
+            booked_seats = [seat for row in rows for seat in parse_seats(row[1])]
+            cursor.execute(
+                "SELECT COALESCE(SUM(num_tickets), 0) FROM seat_holds WHERE movie_id = %s AND status = %s",
+                (movie_id, 'held')
+            )
+            held = int(cursor.fetchone()[0])
+            shows[movie_id] = {"available": available, "booked": booked, "held": held, "bookings": len(rows)}
+            if available < 0:
+                problems.append(f"movie {movie_id}: available_seats went negative ({available})")
+            if booked > seats:
+                problems.append(f"movie {movie_id}: oversold, {booked} tickets for {seats} seats")
+            if available != seats - booked - held:
+                problems.append(f"movie {movie_id}: seat counter drifted, available={available}, expected {seats - booked - held}")
+            if len(set(booked_seats)) != len(booked_seats):
+                problems.append(f"movie {movie_id}: {len(booked_seats) - len(set(booked_seats))} seats booked twice")
+            cursor.execute("SELECT bookings, tickets_sold FROM show_sales WHERE movie_id = %s", (movie_id,))
+            sales = cursor.fetchone() or (0, 0)
+            if tuple(sales) != (len(rows), booked):
+                problems.append(f"movie {movie_id}: sales summary drifted, {sales[0]} bookings/{sales[1]} tickets,"
+                                f" expected {len(rows)}/{booked}")
+        cursor.close()
+    return shows, problems
+
+
+# Run api_server.py in its own process, so the simulated users do not
+# compete with it for the GIL, pointed at the same database and the stub
+def _start_api(workdir, smtp_port):
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    env = dict(
+        os.environ,
+        TICKETGENIE_API_HOST="127.0.0.1",
+        TICKETGENIE_API_PORT=str(port),
+        TICKETGENIE_SMTP_HOST="127.0.0.1",
+        TICKETGENIE_SMTP_PORT=str(smtp_port),
+        TICKETGENIE_SMTP_SSL="0",
+        TICKETGENIE_OUTBOX=os.path.join(workdir, "outbox.db"),
+        TICKETGENIE_TICKET_KEY=config.TICKET_KEY_PATH,
+    )
+    storage = get_storage()
+    if isinstance(storage, SQLiteStorage):
+        env.update(TICKETGENIE_DB_BACKEND="sqlite", TICKETGENIE_SQLITE_PATH=os.path.abspath(storage.path))
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "api_server.py")
+    process = subprocess.Popen([sys.executable, script], env=env, stdout=subprocess.DEVNULL)
+    deadline = time.monotonic() + 120  # the first start may train the model
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"api_server.py exited with {process.returncode}")
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            conn.request("GET", "/healthz")
+            if conn.getresponse().status == 200:
+                return port, process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("api_server.py did not come up")
+
+
+def _compare(previous, current):
+    print(f"\n{'step':15s} {'p50 before':>11s} {'p50 after':>10s} {'p99 before':>11s} {'p99 after':>10s} {'p99 change':>11s}")
+    for step in STEPS:
+        old, new = previous['steps'].get(step, {}), current['steps'][step]
+        if not old.get('p99_ms') or not new.get('p99_ms'):
+            continue
+        change = (new['p99_ms'] - old['p99_ms']) / old['p99_ms'] * 100
+        print(f"{step:15s} {old['p50_ms']:11.3f} {new['p50_ms']:10.3f} {old['p99_ms']:11.3f} {new['p99_ms']:10.3f} {change:+10.1f}%")
+    print(f"{'throughput':15s} {previous['throughput']['turns_per_s']:11.1f} {current['throughput']['turns_per_s']:10.1f}  turns/s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate concurrent chat users end to end.")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--movies", type=int, default=3)
+    parser.add_argument("--seats", type=int, default=100, help="seats per show")
+    parser.add_argument("--max-tickets", type=int, default=4)
+    parser.add_argument("--cancel-rate", type=float, default=0.1)
+    parser.add_argument("--abandon-rate", type=float, default=0.05)
+    parser.add_argument("--think", type=float, default=0.0, help="mean seconds between a user's messages")
+    parser.add_argument("--ramp", type=float, default=0.0, help="spread user start times over this many seconds")
+    parser.add_argument("--poll", type=float, default=0.2, help="seconds between checks while waiting in line")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--backend", choices=["sqlite", "configured"], default="sqlite",
+                        help="scratch SQLite file, or the database from config")
+    parser.add_argument("--transport", choices=["engine", "http"], default="engine")
+    parser.add_argument("--out", default=None, help="results file (default loadtest-<time>.json)")
+    parser.add_argument("--compare", default=None, help="earlier results file to compare against")
+    parser.add_argument("--keep", action="store_true", help="keep the scratch files / test movies")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="ticketgenie-load-")
+    # Tickets are signed with a throwaway key, not one left in the current directory
+    config.TICKET_KEY_PATH = os.path.join(workdir, "ticket.key")
+    if args.backend == "sqlite":
+        set_storage(SQLiteStorage(os.path.join(workdir, "load.db")))
+    schema.migrate()
+
+    # Ticket emails go through the real queue to a local stub
+    stub = SMTPStub().start()
+    movie_ids = _create_movies(args.movies, args.seats)
+    mail = api = None
+    if args.transport == "http":
+        db.register_user("loadtest", "loadtest")
+        port, api = _start_api(workdir, stub.port)
+        make_client = lambda: HttpClient("127.0.0.1", port, "loadtest", "loadtest")
+    else:
+        config.SMTP_HOST, config.SMTP_PORT, config.SMTP_SSL = "127.0.0.1", stub.port, False
+        mail = MailQueue(Outbox(os.path.join(workdir, "outbox.db"))).start()
+        engine = BookingEngine(mail=mail)
+        engine.classifier.predict_one("hello")  # load the model before the clock starts
+        make_client = lambda: EngineClient(engine)
+
+    recorder = Recorder()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        for user in range(args.users):
+            pool.submit(_simulate, user, make_client, movie_ids, args, recorder)
+    elapsed = time.perf_counter() - started
+
+    bookings = recorder.outcomes.get("booked", 0) + recorder.outcomes.get("cancelled", 0)
+    if mail is not None:
+        mail_drained = mail.drain(timeout=60)
+        mail.stop(timeout=5)
+    else:
+        deadline = time.monotonic() + 60
+        while len(stub.messages) < bookings and time.monotonic() < deadline:
+            time.sleep(0.1)
+        mail_drained = len(stub.messages) >= bookings
+        api.terminate()
+        api.wait(10)
+    stub.stop()
+    try:
+        shows, problems = _check_consistency(movie_ids, args.seats)
+    finally:
+        if args.backend == "configured" and not args.keep:
+            _drop_movies(movie_ids)
+
+    steps = recorder.step_report()
+    turns = sum(step['count'] for step in steps.values())
+    errors = sum(step['errors'] for step in steps.values())
+    results = {
+        "run_at": datetime.now().isoformat(timespec="seconds"),
+        "args": vars(args),
+        "storage": get_storage().name,
+        "elapsed_s": round(elapsed, 3),
+        "throughput": {
+            "users_per_s": round(args.users / elapsed, 2),
+            "turns_per_s": round(turns / elapsed, 2),
+            "bookings_per_s": round(bookings / elapsed, 2),
+        },
+        "steps": steps,
+        "outcomes": recorder.outcomes,
+        "errors": {"count": errors, "rate": round(errors / (turns + errors), 4) if turns + errors else 0.0,
+                   "samples": recorder.error_messages},
+        "consistency": {"shows": shows, "problems": problems},
+        "mail": {"bookings": bookings, "delivered": len(stub.messages), "drained": mail_drained},
+        # In-process stage timings; with --transport http they are on the server's /metrics
+        "stages": metrics.stage_summary(),
+    }
+
+    out = args.out or f"loadtest-{datetime.now():%Y%m%d-%H%M%S}.json"
+    with open(out, "w", encoding="utf-8") as file:
+        json.dump(results, file, indent=2, default=str)
+    if not args.keep:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"users={args.users} concurrency={args.concurrency} storage={results['storage']} "
+          f"transport={args.transport} elapsed={elapsed:.2f}s")
+    print(f"throughput: {results['throughput']['turns_per_s']} turns/s, "
+          f"{results['throughput']['bookings_per_s']} bookings/s")
+    print(f"outcomes={recorder.outcomes}")
+    print(f"{'step':15s} {'count':>6s} {'err':>4s} {'p50 ms':>9s} {'p95 ms':>9s} {'p99 ms':>9s}")
+    for step, report in steps.items():
+        if report['count']:
+            print(f"{step:15s} {report['count']:6d} {report['errors']:4d} "
+                  f"{report['p50_ms']:9.3f} {report['p95_ms']:9.3f} {report['p99_ms']:9.3f}")
+    print(f"mail: {len(stub.messages)} delivered for {bookings} bookings")
+    for message in recorder.error_messages[:5]:
+        print(f"error: {message}")
+    for problem in problems:
+        print(f"❌ {problem}")
+    print(f"results written to {out}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            _compare(json.load(file), results)
+    if problems or errors:
+        return 1
+    print("✅ consistent")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
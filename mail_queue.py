@@ -0,0 +1,378 @@
+import random
+import smtplib
+import sqlite3
+import threading
+import time
+from email.mime.application import MIMEApplication
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+import config
+import metrics
+from metrics import timed
+
+# Ticket emails are written to a SQLite outbox in the booking request and
+# delivered later by a small pool of worker threads. Each worker keeps one
+# authenticated SMTP connection open across messages. Failed sends are
+# retried with exponential backoff, and every message keeps its delivery
+# status, attempt count and last error until MAIL_RETENTION_DAYS have
+# passed; a sent message's attachment is dropped at once.
+
+PENDING = 'pending'
+SENDING = 'sending'
+SENT = 'sent'
+FAILED = 'failed'
+
+TICKET_SUBJECT = "🎟️ Your Movie Ticket Confirmation"
+TICKET_BODY = "Thank you for your booking! Please find your ticket attached."
+
+LOCAL_HOSTS = ("localhost", "127.0.0.1", "::1")
+PURGE_INTERVAL = 3600  # seconds between a worker's outbox purges
+
+
+# Mail goes out only with an account to log in with, or to a server on
+# this machine (smtp_stub.py, a local relay) that needs none
+def sending_enabled():
+    return bool(config.SMTP_USER and config.SMTP_PASSWORD) or config.SMTP_HOST in LOCAL_HOSTS
+
+
+class Outbox:
+    def __init__(self, path=None):
+        self.path = path or config.OUTBOX_PATH
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS outbox ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " to_email TEXT NOT NULL,"
+                " subject TEXT NOT NULL,"
+                " body TEXT NOT NULL,"
+                " attachment BLOB,"
+                " attachment_name TEXT,"
+                " status TEXT NOT NULL,"
+                " attempts INTEGER NOT NULL DEFAULT 0,"
+                " next_attempt_at REAL NOT NULL,"
+                " last_error TEXT,"
+                " created_at REAL NOT NULL,"
+                " sent_at REAL,"
+                " claimed_at REAL"
+                ")"
+            )
+            columns = {row['name'] for row in conn.execute("PRAGMA table_info(outbox)")}
+            if 'claimed_at' not in columns:  # outboxes created before claims expired
+                conn.execute("ALTER TABLE outbox ADD COLUMN claimed_at REAL")
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_outbox_status_next ON outbox (status, next_attempt_at)"
+            )
+
+    # One SQLite connection per thread
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def enqueue(self, to_email, subject, body, attachment=None, attachment_name=None):
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "INSERT INTO outbox (to_email, subject, body, attachment, attachment_name,"
+                " status, next_attempt_at, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (to_email, subject, body, attachment, attachment_name, PENDING, now, now)
+            )
+        return cursor.lastrowid
+
+    def enqueue_many(self, messages):
+        now = time.time()
+        rows = [
+            (m['to_email'], m['subject'], m['body'], m.get('attachment'), m.get('attachment_name'),
+             PENDING, now, now)
+            for m in messages
+        ]
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT INTO outbox (to_email, subject, body, attachment, attachment_name,"
+                " status, next_attempt_at, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+        return len(rows)
+
+    # Atomically move up to `limit` due messages from pending to sending.
+    # Messages claimed more than MAIL_CLAIM_LEASE seconds ago were left by a
+    # worker that died (with its process, usually) and are due again; any
+    # number of processes can share the outbox without taking over each
+    # other's live claims.
+    def claim(self, limit=10):
+        now = time.time()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "UPDATE outbox SET status = ?, next_attempt_at = ?"
+                " WHERE status = ? AND (claimed_at IS NULL OR claimed_at <= ?)",
+                (PENDING, now, SENDING, now - config.MAIL_CLAIM_LEASE)
+            )
+            rows = conn.execute(
+                "SELECT * FROM outbox WHERE status = ? AND next_attempt_at <= ?"
+                " ORDER BY next_attempt_at LIMIT ?",
+                (PENDING, now, limit)
+            ).fetchall()
+            conn.executemany(
+                "UPDATE outbox SET status = ?, claimed_at = ? WHERE id = ?",
+                [(SENDING, now, row['id']) for row in rows]
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return rows
+
+    # The attachment (a ticket PDF) is dropped once it is sent
+    def mark_sent(self, message_id):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE outbox SET status = ?, attempts = attempts + 1, sent_at = ?, last_error = NULL,"
+                " attachment = NULL WHERE id = ?",
+                (SENT, time.time(), message_id)
+            )
+
+    # Schedule a retry with exponential backoff and jitter, or give up
+    # after MAIL_MAX_ATTEMPTS.
+    def mark_failed(self, message_id, attempts, error, permanent=False):
+        attempts += 1
+        if permanent or attempts >= config.MAIL_MAX_ATTEMPTS:
+            status, next_attempt_at = FAILED, time.time()
+        else:
+            delay = min(config.MAIL_BACKOFF_MAX, config.MAIL_BACKOFF_BASE * 2 ** (attempts - 1))
+            status, next_attempt_at = PENDING, time.time() + delay * random.uniform(0.8, 1.2)
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE outbox SET status = ?, attempts = ?, next_attempt_at = ?, last_error = ?"
+                " WHERE id = ?",
+                (status, attempts, next_attempt_at, str(error)[:500], message_id)
+            )
+        return status
+
+    # Delete sent and failed messages created more than `days` days ago;
+    # returns how many
+    def purge(self, days):
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "DELETE FROM outbox WHERE status IN (?, ?) AND created_at < ?",
+                (SENT, FAILED, time.time() - days * 86400)
+            )
+        return cursor.rowcount
+
+    def status(self, message_id):
+        row = self._connect().execute(
+            "SELECT id, to_email, status, attempts, last_error, created_at, sent_at FROM outbox WHERE id = ?",
+            (message_id,)
+        ).fetchone()
+        return dict(row) if row is not None else None
+
+    def counts(self):
+        rows = self._connect().execute("SELECT status, COUNT(*) FROM outbox GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+
+def build_message(row):
+    msg = MIMEMultipart()
+    msg['From'] = config.MAIL_SENDER
+    msg['To'] = row['to_email']
+    msg['Subject'] = row['subject']
+    msg.attach(MIMEText(row['body'], 'plain'))
+    if row['attachment'] is not None:
+        name = row['attachment_name'] or "attachment"
+        part = MIMEApplication(row['attachment'], Name=name)
+        part['Content-Disposition'] = f'attachment; filename="{name}"'
+        msg.attach(part)
+    return msg
+
+
+# Keeps one SMTP connection open and reconnects when the server drops it
+class SMTPSession:
+    def __init__(self):
+        self.server = None
+        self.last_used = 0.0
+
+    def _open(self):
+        if config.SMTP_SSL:
+            server = smtplib.SMTP_SSL(config.SMTP_HOST, config.SMTP_PORT, timeout=30)
+        else:
+            server = smtplib.SMTP(config.SMTP_HOST, config.SMTP_PORT, timeout=30)
+        if config.SMTP_USER and config.SMTP_PASSWORD:
+            server.login(config.SMTP_USER, config.SMTP_PASSWORD)
+        return server
+
+    def send(self, msg):
+        if self.server is None:
+            self.server = self._open()
+        try:
+            self.server.send_message(msg)
+        except smtplib.SMTPServerDisconnected:
+            # The provider closed an idle connection: reconnect once and retry
+            self.server = self._open()
+            self.server.send_message(msg)
+        self.last_used = time.monotonic()
+
+    def close_if_idle(self, idle_timeout):
+        if self.server is not None and time.monotonic() - self.last_used > idle_timeout:
+            self.close()
+
+    def close(self):
+        if self.server is not None:
+            try:
+                self.server.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self.server = None
+
+
+class MailWorker(threading.Thread):
+    def __init__(self, outbox, wakeup, stopped, poll_interval=1.0, name=None):
+        super().__init__(name=name, daemon=True)
+        self.outbox = outbox
+        self.wakeup = wakeup
+        self.stopped = stopped
+        self.poll_interval = poll_interval
+        self.session = SMTPSession()
+        self.purged_at = float('-inf')
+
+    # Nothing one message or one busy outbox does may end the loop: there is
+    # no one to start another worker
+    def run(self):
+        while not self.stopped.is_set():
+            try:
+                rows = self.outbox.claim()
+            except Exception as exc:  # e.g. the outbox is locked; try again at the next poll
+                print(f"⚠️ Mail worker could not claim messages: {exc!r}")
+                self.stopped.wait(self.poll_interval)
+                continue
+            if not rows:
+                self.session.close_if_idle(config.SMTP_IDLE_TIMEOUT)
+                self.purge_if_due()
+                self.wakeup.wait(self.poll_interval)
+                self.wakeup.clear()
+                continue
+            for row in rows:
+                try:
+                    self.deliver(row)
+                except Exception as exc:
+                    print(f"⚠️ Mail worker failed on message {row['id']}: {exc!r}")
+                    self.give_back(row, exc)
+        self.session.close()
+
+    # Drop old sent and failed messages, at most once an hour per worker
+    def purge_if_due(self):
+        if not config.MAIL_RETENTION_DAYS or time.monotonic() - self.purged_at < PURGE_INTERVAL:
+            return
+        self.purged_at = time.monotonic()
+        try:
+            self.outbox.purge(config.MAIL_RETENTION_DAYS)
+        except sqlite3.Error as exc:
+            print(f"⚠️ Mail worker could not purge the outbox: {exc!r}")
+
+    def deliver(self, row):
+        try:
+            with timed("smtp_send"):
+                self.session.send(build_message(row))
+        except smtplib.SMTPRecipientsRefused as exc:
+            # A bad address will not get better by retrying
+            self.outbox.mark_failed(row['id'], row['attempts'], exc, permanent=True)
+            metrics.emails.inc("rejected")
+        except (smtplib.SMTPException, OSError) as exc:
+            self.session.close()
+            self.outbox.mark_failed(row['id'], row['attempts'], exc)
+            metrics.emails.inc("failed")
+        else:
+            metrics.emails.inc("sent")
+            self.record_sent(row)
+
+    # The message is out: keep trying to record that rather than let it be
+    # sent again
+    def record_sent(self, row):
+        while True:
+            try:
+                self.outbox.mark_sent(row['id'])
+                return
+            except sqlite3.Error as exc:
+                print(f"⚠️ Could not record message {row['id']} as sent: {exc!r}")
+                if self.stopped.wait(self.poll_interval):
+                    return
+
+    # Count an unexpected error as a failed attempt. If even that cannot be
+    # written the message stays claimed and goes back to the queue when its
+    # claim lapses.
+    def give_back(self, row, error):
+        self.session.close()
+        try:
+            self.outbox.mark_failed(row['id'], row['attempts'], error)
+            metrics.emails.inc("failed")
+        except Exception as exc:
+            print(f"⚠️ Could not record the failure of message {row['id']}: {exc!r}")
+
+
+class MailQueue:
+    def __init__(self, outbox=None, workers=None, poll_interval=1.0):
+        self.outbox = outbox or Outbox()
+        self.num_workers = config.MAIL_WORKERS if workers is None else workers
+        self.poll_interval = poll_interval
+        self.wakeup = threading.Event()
+        self.stopped = threading.Event()
+        self.workers = []
+
+    def start(self):
+        if not sending_enabled():
+            print(f"⚠️ Ticket emails are not being sent: set TICKETGENIE_SMTP_USER and "
+                  f"TICKETGENIE_SMTP_PASSWORD for {config.SMTP_HOST}; until then they wait in the outbox")
+            return self
+        for i in range(self.num_workers):
+            worker = MailWorker(self.outbox, self.wakeup, self.stopped, self.poll_interval, name=f"mail-worker-{i}")
+            worker.start()
+            self.workers.append(worker)
+        return self
+
+    def stop(self, timeout=None):
+        self.stopped.set()
+        self.wakeup.set()
+        for worker in self.workers:
+            worker.join(timeout)
+
+    def enqueue_ticket(self, to_email, pdf_bytes, filename):
+        message_id = self.outbox.enqueue(to_email, TICKET_SUBJECT, TICKET_BODY, pdf_bytes, filename)
+        self.wakeup.set()
+        return message_id
+
+    def enqueue_many(self, messages):
+        count = self.outbox.enqueue_many(messages)
+        self.wakeup.set()
+        return count
+
+    # Block until nothing is pending or sending (used by scripts and tests)
+    def drain(self, timeout=30.0):
+        if not self.workers:
+            return False
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            counts = self.outbox.counts()
+            if not counts.get(PENDING) and not counts.get(SENDING):
+                return True
+            self.wakeup.set()
+            time.sleep(0.05)
+        return False
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+# The process-wide queue and its workers, started on first use
+def get_queue():
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = MailQueue().start()
+    return _queue
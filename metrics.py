@@ -0,0 +1,320 @@
+import argparse
+import contextvars
+import functools
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import config
+
+# Process-wide latency histograms and event counters. Wrap a stage with
+# timed("name") (as a decorator or a with-block) to record its duration in
+# ticketgenie_stage_seconds{stage="name"}; a stage that raises is also
+# counted in ticketgenie_stage_failures_total. Everything is exposed in
+# Prometheus text format, over HTTP (METRICS_PORT) and/or as a file
+# rewritten every few seconds (METRICS_FILE).
+#
+# With TIMING_LOG set, each timed stage is also written there as one JSON
+# line carrying the chat session id (set_session), so a slow booking can be
+# followed stage by stage.
+
+# Bucket bounds in seconds, from a cached catalog read to a slow SMTP send
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_session = contextvars.ContextVar("ticketgenie_session", default=None)
+timing_log = logging.getLogger("ticketgenie.timing")
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{value}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values):
+        return self._values.get(label_values, 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for values, count in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labels, values)} {count}")
+        return lines
+
+
+class Gauge:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def set(self, value, *label_values):
+        with self._lock:
+            self._values[label_values] = value
+
+    def value(self, *label_values):
+        return self._values.get(label_values, 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        with self._lock:
+            for values, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labels, values)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # label values -> [count per bucket (+Inf last), sum]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            index = len(self.buckets)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    index = i
+                    break
+            series[0][index] += 1
+            series[1] += value
+
+    def count(self, *label_values):
+        series = self._series.get(label_values)
+        return sum(series[0]) if series else 0
+
+    # Estimate the q-quantile the way Prometheus' histogram_quantile does:
+    # linear interpolation inside the bucket that holds it
+    def quantile(self, q, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            counts = list(series[0]) if series else []
+        total = sum(counts)
+        if not total:
+            return None
+        rank = q * total
+        seen = 0
+        lower = 0.0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            if count and seen + count >= rank:
+                if bound == float("inf"):
+                    return lower
+                return lower + (bound - lower) * (rank - seen) / count
+            seen += count
+            lower = bound
+        return lower
+
+    def series(self):
+        with self._lock:
+            return sorted(self._series)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for values, (counts, total) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"{self.name}_bucket{_labels(self.labels + ('le',), values + (le,))} {cumulative}")
+                lines.append(f"{self.name}_sum{_labels(self.labels, values)} {total}")
+                lines.append(f"{self.name}_count{_labels(self.labels, values)} {cumulative}")
+        return lines
+
+
+stage_seconds = Histogram("ticketgenie_stage_seconds", "Time spent in each stage of the booking flow.", ["stage"])
+stage_failures = Counter("ticketgenie_stage_failures_total", "Stages that raised an exception.", ["stage"])
+bookings = Counter("ticketgenie_bookings_total", "Bookings confirmed.")
+tickets = Counter("ticketgenie_tickets_total", "Tickets (seats) in confirmed bookings.")
+booking_failures = Counter("ticketgenie_booking_failures_total", "Bookings that could not be confirmed, by reason.", ["reason"])
+sold_out = Counter("ticketgenie_seats_sold_out_total", "Hold requests refused because the show had too few seats left.")
+emails = Counter("ticketgenie_emails_total", "Ticket email delivery attempts, by outcome.", ["outcome"])
+cancellations = Counter("ticketgenie_cancelled_bookings_total", "Bookings cancelled, by scope (booking, email, show).", ["scope"])
+gate_scans = Counter("ticketgenie_gate_scans_total", "Tickets scanned at the gates, by result.", ["result"])
+admissions = Counter("ticketgenie_admissions_total", "Sessions entering the booking flow of a show, by outcome.", ["outcome"])
+admission_waiting = Gauge("ticketgenie_admission_waiting", "Sessions in line to book a show.", ["movie_id"])
+admission_in_flight = Gauge("ticketgenie_admission_in_flight", "Admitted sessions booking a show.", ["movie_id"])
+model_reloads = Counter("ticketgenie_model_reloads_total", "Intent model retrains after an intents.json edit, by outcome.", ["outcome"])
+transaction_retries = Counter("ticketgenie_transaction_retries_total", "Transactions run again after a deadlock or lock wait timeout, by function.", ["function"])
+
+REGISTRY = [
+    stage_seconds, stage_failures, bookings, tickets, booking_failures, sold_out, emails, cancellations,
+    gate_scans, admissions, admission_waiting, admission_in_flight, model_reloads,
+    transaction_retries,
+]
+
+
+# Tag this thread/task's timing logs with a chat session id
+def set_session(session_id):
+    _session.set(session_id)
+
+
+class timed:
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.started
+        stage_seconds.observe(elapsed, self.stage)
+        if exc_type is not None:
+            stage_failures.inc(self.stage)
+        if timing_log.isEnabledFor(logging.INFO):
+            timing_log.info(json.dumps({
+                "ts": time.time(),
+                "session": _session.get(),
+                "stage": self.stage,
+                "ms": round(elapsed * 1000, 3),
+                "ok": exc_type is None,
+            }))
+        return False
+
+    def __call__(self, fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timed(self.stage):
+                return fn(*args, **kwargs)
+        return wrapper
+
+
+def render():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# p50/p99 of every stage seen so far, in milliseconds
+def stage_summary():
+    summary = {}
+    for (stage,) in stage_seconds.series():
+        summary[stage] = {
+            "count": stage_seconds.count(stage),
+            "p50_ms": round(stage_seconds.quantile(0.5, stage) * 1000, 3),
+            "p99_ms": round(stage_seconds.quantile(0.99, stage) * 1000, 3),
+        }
+    return summary
+
+
+def write_file(path):
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as file:
+        file.write(render())
+    os.replace(tmp, path)  # scrapers never see a half-written file
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _FileWriter(threading.Thread):
+    def __init__(self, path, interval):
+        super().__init__(name="metrics-file", daemon=True)
+        self.path = path
+        self.interval = interval
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                write_file(self.path)
+            except OSError as exc:
+                print(f"⚠️ Could not write metrics to {self.path}: {exc}")
+
+
+_exporters = None
+_exporters_lock = threading.Lock()
+
+
+# Start whatever config asks for: the HTTP endpoint, the metrics file and
+# the timing log. Once per process; safe to call on every rerun.
+def start_exporters():
+    global _exporters
+    with _exporters_lock:
+        if _exporters is not None:
+            return _exporters
+        _exporters = []
+        if config.TIMING_LOG:
+            handler = logging.FileHandler(config.TIMING_LOG, encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            timing_log.addHandler(handler)
+            timing_log.setLevel(logging.INFO)
+            timing_log.propagate = False
+        if config.METRICS_PORT:
+            server = ThreadingHTTPServer((config.METRICS_HOST, config.METRICS_PORT), _Handler)
+            server.daemon_threads = True
+            threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+            _exporters.append(server)
+        if config.METRICS_FILE:
+            writer = _FileWriter(config.METRICS_FILE, config.METRICS_FILE_INTERVAL)
+            writer.start()
+            _exporters.append(writer)
+        return _exporters
+
+
+# p50/p99 per stage from a timing log, for capacity planning after a run:
+#   python metrics.py timing.jsonl
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Summarize stage latencies from a timing log.")
+    parser.add_argument("log", help="JSON lines written via TICKETGENIE_TIMING_LOG")
+    args = parser.parse_args(argv)
+
+    samples = {}
+    with open(args.log, encoding="utf-8") as file:
+        for line in file:
+            if line.strip():
+                record = json.loads(line)
+                samples.setdefault(record['stage'], []).append(record['ms'])
+    for stage, values in sorted(samples.items()):
+        values.sort()
+        p50 = values[int(0.5 * (len(values) - 1))]
+        p99 = values[int(0.99 * (len(values) - 1))]
+        print(f"{stage:32s} n={len(values):7d} p50={p50:9.3f}ms p99={p99:9.3f}ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
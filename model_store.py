@@ -0,0 +1,226 @@
+import argparse
+import hashlib
+import json
+import os
+import random
+import tempfile
+import threading
+
+import numpy as np
+
+import config
+from intent_runtime import CompiledModel, compile_pipeline
+from metrics import timed
+
+# Serving artifact: the pipeline compiled to arrays (see intent_runtime.py).
+# Bump RUNTIME_FORMAT when its layout changes so old files are retrained.
+RUNTIME_NAME = "model.npz"
+RUNTIME_FORMAT = "npz-1"
+
+# Artifacts already loaded in this process, keyed by fingerprint.
+# Streamlit reruns the script for every message, but imported modules stay
+# in memory, so every session in the process shares this cache.
+_loaded = {}
+_lock = threading.Lock()
+
+
+# Fingerprint = content hash of intents.json + the runtime format. The
+# compiled arrays do not depend on the sklearn version that trained them,
+# so serving never has to import sklearn to find its model.
+def fingerprint(intents_bytes):
+    digest = hashlib.sha256()
+    digest.update(intents_bytes)
+    digest.update(b"\0format=" + RUNTIME_FORMAT.encode())
+    return digest.hexdigest()[:16]
+
+
+def artifact_dir(fp, model_dir=None):
+    return os.path.join(model_dir or config.MODEL_DIR, fp)
+
+
+# Build training data from the intents file and fit the classifier. The only
+# place sklearn is imported.
+def train(data):
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.preprocessing import LabelEncoder
+
+    texts = []     # X - inputs
+    labels = []    # y - tags
+    for intent in data['intents']:
+        for pattern in intent['patterns']:
+            texts.append(pattern)
+            labels.append(intent['tag'])
+
+    vectorizer = TfidfVectorizer()
+    X = vectorizer.fit_transform(texts)
+
+    label_encoder = LabelEncoder()
+    y = label_encoder.fit_transform(labels)
+
+    model = LogisticRegression()
+    model.fit(X, y)
+
+    arrays = compile_pipeline(vectorizer, model, label_encoder)
+    return {
+        "model": model,
+        "vectorizer": vectorizer,
+        "label_encoder": label_encoder,
+        "arrays": arrays,
+        "runtime": CompiledModel(arrays),
+    }
+
+
+# An intents file that must not replace the model being served
+class ModelRejected(Exception):
+    pass
+
+
+# Structural problems that would break training or serving
+def check_intents(data):
+    intents = data.get('intents') if isinstance(data, dict) else None
+    if not intents:
+        raise ModelRejected("no intents")
+    tags = set()
+    for intent in intents:
+        missing = [key for key in ('tag', 'patterns', 'responses') if not intent.get(key)]
+        if missing:
+            raise ModelRejected(f"intent {intent.get('tag')!r} has no {', '.join(missing)}")
+        if intent['tag'] in tags:
+            raise ModelRejected(f"intent {intent['tag']!r} appears twice")
+        tags.add(intent['tag'])
+    if len(tags) < 2:
+        raise ModelRejected("a classifier needs at least two intents")
+
+
+# Split off `fraction` of each intent's patterns (at least one, never the
+# last) as (text, tag) pairs. Seeded, so the same file splits the same way.
+def split_holdout(data, fraction=None, seed=0):
+    fraction = config.INTENT_HOLDOUT if fraction is None else fraction
+    rng = random.Random(seed)
+    training, holdout = [], []
+    for intent in data['intents']:
+        patterns = sorted(intent['patterns'])
+        rng.shuffle(patterns)
+        count = min(len(patterns) - 1, max(1, round(len(patterns) * fraction)))
+        holdout.extend((pattern, intent['tag']) for pattern in patterns[:count])
+        training.append(dict(intent, patterns=patterns[count:]))
+    return {"intents": training}, holdout
+
+
+# Accuracy on held-out patterns of a model trained on the rest
+def holdout_accuracy(data, fraction=None):
+    training, holdout = split_holdout(data, fraction)
+    if not holdout:
+        return None
+    runtime = train(training)['runtime']
+    best = runtime.predict_proba([text.lower() for text, _ in holdout]).argmax(axis=1)
+    return sum(tag == runtime.tags[i] for (_, tag), i in zip(holdout, best)) / len(holdout)
+
+
+# Reject intents whose model generalises worse than INTENT_MIN_ACCURACY and
+# worse than the intents it would replace (`baseline`, scored the same way)
+def validate(data, baseline):
+    accuracy = holdout_accuracy(data)
+    if accuracy is None:
+        return
+    needed = config.INTENT_MIN_ACCURACY
+    if accuracy < needed:
+        baseline_accuracy = holdout_accuracy(baseline)
+        if baseline_accuracy is not None:
+            needed = min(needed, baseline_accuracy)
+    if accuracy < needed:
+        raise ModelRejected(f"held-out accuracy {accuracy:.0%} is below {needed:.0%}")
+
+
+# Write the arrays train() compiled to a temp file and rename it into
+# place, so a concurrent reader never sees a half-written artifact.
+def save_artifacts(artifacts, directory):
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as tmp:
+            np.savez(tmp, **artifacts['arrays'])
+        os.replace(tmp_path, os.path.join(directory, RUNTIME_NAME))
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def load_saved_artifacts(directory):
+    path = os.path.join(directory, RUNTIME_NAME)
+    if not os.path.exists(path):
+        return None
+    return {"runtime": CompiledModel.load(path)}
+
+
+# Return the artifacts for the current intents file, loading them from disk
+# or retraining only when no artifacts exist for its fingerprint. With a
+# `baseline` (the intents being served), a retrained model must also pass
+# validate() first. Raises ModelRejected for files that must not be served.
+def load_artifacts(intents_path=None, model_dir=None, baseline=None):
+    intents_path = intents_path or config.INTENTS_PATH
+    with open(intents_path, "rb") as file:
+        raw = file.read()
+    fp = fingerprint(raw)
+
+    artifacts = _loaded.get(fp)
+    if artifacts is not None:
+        return artifacts
+
+    with _lock:
+        artifacts = _loaded.get(fp)
+        if artifacts is not None:
+            return artifacts
+
+        directory = artifact_dir(fp, model_dir)
+        with timed("model_load"):
+            artifacts = load_saved_artifacts(directory)
+        try:
+            data = json.loads(raw)
+        except ValueError as exc:
+            raise ModelRejected(f"not valid JSON: {exc}")
+        check_intents(data)
+        if artifacts is None:
+            if baseline is not None:
+                with timed("model_validate"):
+                    validate(data, baseline)
+            with timed("model_train"):
+                artifacts = train(data)
+            artifacts["intents"] = data
+            save_artifacts(artifacts, directory)
+            print(f"✅ Training done and files saved in {directory}")
+        else:
+            artifacts["intents"] = data
+        artifacts["fingerprint"] = fp
+        _loaded.clear()
+        _loaded[fp] = artifacts
+    return artifacts
+
+
+# Train (if needed) and export the model for the intents file. --verify
+# refits with sklearn and checks the compiled scorer gives the same
+# probabilities on every pattern.
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train and export the intent model.")
+    parser.add_argument("--intents", default=config.INTENTS_PATH)
+    parser.add_argument("--model-dir", default=config.MODEL_DIR)
+    parser.add_argument("--verify", action="store_true")
+    args = parser.parse_args(argv)
+
+    artifacts = load_artifacts(args.intents, args.model_dir)
+    path = os.path.join(artifact_dir(artifacts['fingerprint'], args.model_dir), RUNTIME_NAME)
+    print(f"✅ {path} ({os.path.getsize(path)} bytes, {len(artifacts['runtime'].vocabulary)} terms)")
+    if args.verify:
+        fitted = train(artifacts['intents'])
+        texts = [p.lower() for intent in artifacts['intents']['intents'] for p in intent['patterns']]
+        expected = fitted['model'].predict_proba(fitted['vectorizer'].transform(texts))
+        actual = CompiledModel.load(path).predict_proba(texts)
+        difference = float(np.abs(expected - actual).max())
+        print(f"{'✅' if difference < 1e-9 else '❌'} max probability difference vs sklearn: {difference:.2e}")
+        return 0 if difference < 1e-9 else 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,261 @@
+import argparse
+import csv
+import json
+import sys
+from datetime import date, timedelta
+from decimal import Decimal, InvalidOperation
+
+import config
+from db import connection, movie_catalog
+from metrics import timed
+from seatmap import SeatLayout
+
+# Load shows (a movie at a date and time) into the movies table from CSV or
+# JSONL, e.g. a cinema chain's schedule for the week. Rows are read and
+# checked one at a time; every CHUNK good rows are written in one
+# transaction with one executemany for the new shows and one for the
+# changed ones, so tens of thousands of shows take seconds.
+#
+# A show is identified by name + Date + showtiming: importing the same
+# schedule twice updates genre, rating and Price in place instead of
+# adding shows. An existing show keeps its available_seats, which bookings
+# have already been taken from.
+#
+# Rows that fail validation are skipped and reported with their line
+# number; the rest are imported.
+#
+#   python movie_import.py schedule.csv --errors rejected.jsonl
+
+CHUNK = 1000
+
+# Accepted column names (case-insensitive) -> movies column
+COLUMNS = {
+    "name": "name", "movie": "name", "title": "name",
+    "genre": "genre",
+    "rating": "rating",
+    "available_seats": "available_seats", "seats": "available_seats",
+    "price": "Price",
+    "date": "Date",
+    "showtiming": "showtiming", "showtime": "showtiming", "time": "showtiming",
+}
+REQUIRED = ("name", "Date", "showtiming")
+
+
+class RowError(ValueError):
+    pass
+
+
+def _text(value, column, limit):
+    value = str(value).strip()
+    if len(value) > limit:
+        raise RowError(f"{column} is longer than {limit} characters")
+    return value
+
+
+def _decimal(value, column, low, high, places):
+    try:
+        number = Decimal(str(value).strip())
+    except InvalidOperation:
+        raise RowError(f"{column} is not a number: {value!r}")
+    if not number.is_finite() or not low <= number <= high:
+        raise RowError(f"{column} must be between {low} and {high}")
+    return number.quantize(Decimal(1).scaleb(-places))
+
+
+def _date(value):
+    try:
+        return date.fromisoformat(str(value).strip())
+    except ValueError:
+        raise RowError(f"Date must be YYYY-MM-DD, not {value!r}")
+
+
+# "19:45", "19:45:00" or "7:45 PM" -> timedelta since midnight
+def _time(value):
+    text = str(value).strip().upper()
+    meridiem = text[-2:] if text[-2:] in ("AM", "PM") else None
+    if meridiem:
+        text = text[:-2].strip()
+    try:
+        parts = [int(part) for part in text.split(":")]
+    except ValueError:
+        parts = []
+    if len(parts) not in (2, 3):
+        raise RowError(f"showtiming must be HH:MM, not {value!r}")
+    hours, minutes, seconds = (parts + [0])[:3]
+    if meridiem:
+        if not 1 <= hours <= 12:
+            raise RowError(f"showtiming must be HH:MM, not {value!r}")
+        hours = hours % 12 + (12 if meridiem == "PM" else 0)
+    if not (0 <= hours < 24 and 0 <= minutes < 60 and 0 <= seconds < 60):
+        raise RowError(f"showtiming must be HH:MM, not {value!r}")
+    return timedelta(hours=hours, minutes=minutes, seconds=seconds)
+
+
+# One raw row (dict of strings or JSON values) -> movies columns, or RowError
+def clean_row(raw, capacity):
+    row = {}
+    for key, value in raw.items():
+        column = COLUMNS.get(str(key).strip().lower())
+        if column is not None and value is not None and str(value).strip() != "":
+            row[column] = value
+    missing = [column for column in REQUIRED if column not in row]
+    if missing:
+        raise RowError(f"missing {', '.join(missing)}")
+    seats = row.get("available_seats", capacity)
+    try:
+        seats = int(str(seats).strip())
+    except ValueError:
+        raise RowError(f"available_seats is not a whole number: {seats!r}")
+    if not 0 <= seats <= capacity:
+        # Seat maps are drawn from SEAT_LAYOUT; more seats would not fit
+        raise RowError(f"available_seats must be between 0 and {capacity}")
+    name = _text(row["name"], "name", 255)
+    if not name:
+        raise RowError("name is empty")
+    return {
+        "name": name,
+        "genre": _text(row["genre"], "genre", 100) if "genre" in row else None,
+        "rating": _decimal(row["rating"], "rating", 0, 10, 1) if "rating" in row else None,
+        "available_seats": seats,
+        "Price": _decimal(row.get("Price", 0), "Price", 0, Decimal("99999999.99"), 2),
+        "Date": _date(row["Date"]),
+        "showtiming": _time(row["showtiming"]),
+    }
+
+
+# (line number, raw row) from a CSV file with a header line
+def read_csv(file):
+    reader = csv.DictReader(file)
+    for raw in reader:
+        yield reader.line_num, raw
+
+
+# (line number, raw row) from a file of JSON objects, one per line
+def read_jsonl(file):
+    for number, line in enumerate(file, 1):
+        if not line.strip():
+            continue
+        try:
+            raw = json.loads(line)
+        except ValueError as exc:
+            yield number, RowError(f"not JSON: {exc}")
+            continue
+        yield number, raw if isinstance(raw, dict) else RowError("not a JSON object")
+
+
+def _key(row):
+    return row["name"], row["Date"], row["showtiming"]
+
+
+# Write one chunk of clean rows in one transaction. Existing shows are
+# found with one locking read over the chunk's names and dates; the lock
+# keeps two imports from both inserting the same show. Returns (inserted,
+# updated), a repeat of a show earlier in the chunk counting as an update.
+def _write_chunk(rows):
+    latest = {}
+    for row in rows:
+        latest[_key(row)] = row  # the last row for a show wins
+    names = sorted({key[0] for key in latest})
+    dates = [key[1] for key in latest]
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT id, name, Date, showtiming FROM movies"
+            f" WHERE name IN ({', '.join(['%s'] * len(names))}) AND Date BETWEEN %s AND %s FOR UPDATE",
+            names + [min(dates), max(dates)]
+        )
+        existing = {}
+        for movie_id, name, show_date, showtiming in cursor.fetchall():
+            existing.setdefault((name, show_date, showtiming), movie_id)
+        inserts = [row for key, row in latest.items() if key not in existing]
+        updates = [row for key, row in latest.items() if key in existing]
+        if inserts:
+            cursor.executemany(
+                "INSERT INTO movies (name, genre, rating, available_seats, Price, Date, showtiming)"
+                " VALUES (%s, %s, %s, %s, %s, %s, %s)",
+                [(row["name"], row["genre"], row["rating"], row["available_seats"], row["Price"],
+                  row["Date"], row["showtiming"]) for row in inserts]
+            )
+        if updates:
+            cursor.executemany(
+                "UPDATE movies SET genre = %s, rating = %s, Price = %s WHERE id = %s",
+                [(row["genre"], row["rating"], row["Price"], existing[_key(row)]) for row in updates]
+            )
+        cursor.close()
+    return len(inserts), len(rows) - len(inserts)
+
+
+# Import rows from read_csv()/read_jsonl(). Returns {"valid", "inserted",
+# "updated", "errors"}, errors being {"line", "error", "row"} for every row
+# skipped. dry_run validates without writing. A database error stops the
+# import; the chunks before it stay imported.
+@timed("movie_import")
+def import_movies(records, chunk_size=CHUNK, dry_run=False):
+    capacity = SeatLayout.parse(config.SEAT_LAYOUT).capacity
+    summary = {"valid": 0, "inserted": 0, "updated": 0, "errors": []}
+    chunk = []
+
+    def flush():
+        if chunk and not dry_run:
+            inserted, updated = _write_chunk(chunk)
+            summary["inserted"] += inserted
+            summary["updated"] += updated
+        chunk.clear()
+
+    try:
+        for line, raw in records:
+            try:
+                if isinstance(raw, Exception):
+                    raise RowError(str(raw))
+                chunk.append(clean_row(raw, capacity))
+                summary["valid"] += 1
+            except RowError as exc:
+                summary["errors"].append({"line": line, "error": str(exc), "row": raw if isinstance(raw, dict) else None})
+                continue
+            if len(chunk) >= chunk_size:
+                flush()
+        flush()
+    finally:
+        if summary["inserted"] or summary["updated"]:
+            movie_catalog.invalidate()
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import shows into the movies table from CSV or JSONL.")
+    parser.add_argument("path", help="file to import, or - for stdin")
+    parser.add_argument("--format", choices=("csv", "jsonl"),
+                        help="default: from the file extension, else csv")
+    parser.add_argument("--errors", help="write the rejected rows here as JSONL")
+    parser.add_argument("--chunk", type=int, default=CHUNK, help="rows per transaction")
+    parser.add_argument("--dry-run", action="store_true", help="only validate")
+    args = parser.parse_args(argv)
+
+    fmt = args.format or ("jsonl" if args.path.endswith((".jsonl", ".json")) else "csv")
+    file = sys.stdin if args.path == "-" else open(args.path, newline="", encoding="utf-8-sig")
+    try:
+        records = read_jsonl(file) if fmt == "jsonl" else read_csv(file)
+        summary = import_movies(records, args.chunk, args.dry_run)
+    finally:
+        if file is not sys.stdin:
+            file.close()
+
+    errors = summary["errors"]
+    if args.errors:
+        with open(args.errors, "w", encoding="utf-8") as out:
+            for error in errors:
+                out.write(json.dumps(error, default=str) + "\n")
+    if args.dry_run:
+        print(f"✅ {summary['valid']} rows valid, {len(errors)} rows rejected", file=sys.stderr)
+    else:
+        print(f"✅ imported {summary['inserted']} new and {summary['updated']} updated shows,"
+              f" {len(errors)} rows rejected", file=sys.stderr)
+    for error in errors[:10]:
+        print(f"❌ line {error['line']}: {error['error']}", file=sys.stderr)
+    if len(errors) > 10:
+        print(f"… and {len(errors) - 10} more" + (f" (see {args.errors})" if args.errors else ""), file=sys.stderr)
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,352 @@
+import bisect
+import heapq
+import re
+import threading
+from datetime import date, timedelta
+
+from metrics import timed
+
+# In-memory search over the movie catalog, so users can pick a show with
+# "avengers tonight" or "comedy tomorrow" instead of its numeric id.
+#
+#   titles    title -> its shows' sort keys (date, showtime, id), sorted;
+#             one title runs on many screens and days, so words are
+#             matched and scored per title, not per show
+#   words     title word -> titles containing it
+#   trigrams  trigram -> title words containing it; a query word that is
+#             not a title word is matched to words sharing most of its
+#             trigrams within a small edit distance (typo tolerance)
+#   facets    genre word / time of day -> its shows' sort keys, sorted
+#   order     every show's sort key, sorted
+#
+# Genre, date and time of day filter the shows as they come off the sorted
+# lists, soonest first, so a query reads about as many shows as it returns
+# rather than everything that matches. Queries with no title words read the
+# shortest facet list that applies.
+#
+# The index follows catalog.MovieCatalog: each search checks the catalog's
+# version and, when it moved, re-indexes only the shows whose name, genre,
+# date or showtime changed. Seat counts are read live from the catalog.
+
+STOPWORDS = {
+    "a", "an", "the", "for", "at", "on", "in", "of", "to", "and", "i", "me", "my", "we",
+    "want", "would", "like", "please", "book", "booking", "ticket", "tickets", "seat", "seats",
+    "movie", "movies", "film", "films", "show", "shows", "showing", "watch", "see", "any", "some",
+}
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+# Time of day: name -> [start hour, end hour)
+DAYPARTS = {
+    "morning": (0, 12),
+    "afternoon": (12, 17),
+    "evening": (17, 21),
+    "night": (21, 24),
+}
+# Word tiers for ranking title matches
+EXACT, PREFIX, FUZZY = 3, 2, 1
+
+_WORD = re.compile(r"\d{4}-\d{2}-\d{2}|[a-z0-9]+")
+_ISO_DATE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+
+
+def tokenize(text):
+    return _WORD.findall(str(text or "").lower())
+
+
+def trigrams(word):
+    padded = f"${word}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+# Levenshtein distance, giving up (returning limit + 1) once it must exceed limit
+def edit_distance(a, b, limit):
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+def _typo_limit(word):
+    return 0 if len(word) < 4 else 1 if len(word) < 8 else 2
+
+
+def daypart(showtiming):
+    if showtiming is None:
+        return None
+    hour = int(showtiming.total_seconds()) // 3600 % 24
+    for name, (start, end) in DAYPARTS.items():
+        if start <= hour < end:
+            return name
+    return None
+
+
+class MovieIndex:
+    def __init__(self, catalog):
+        self.catalog = catalog
+        self._version = None
+        self._lock = threading.Lock()
+        self._clear()
+
+    def _clear(self):
+        self._signatures = {}  # id -> (name, genre, Date, showtiming) as indexed
+        self._docs = {}        # id -> (title, genre words, daypart, sort key)
+        self._titles = {}      # title words -> sort keys of its shows, sorted
+        self._words = {}       # word -> titles containing it
+        self._trigrams = {}    # trigram -> words
+        self._vocabulary = []  # sorted words, for prefix lookups
+        self._genres = {}      # genre word -> number of shows
+        self._order = []       # every sort key, sorted
+        self._facets = {}      # ('genre', word) or ('part', daypart) -> sort keys, sorted
+        self._expansions = {}  # query word -> [(word, tier)], cleared when words change
+        self._unsorted = {}    # id -> key list appended out of order since the last sort
+
+    # Bring the index up to date with the catalog, or with a snapshot of it
+    # already taken
+    def sync(self, snapshot=None):
+        version, movies = snapshot or self.catalog.snapshot()
+        if version == self._version:
+            return
+        with self._lock:
+            if version == self._version:
+                return
+            # Writers may add rows while we walk them
+            movies = dict(movies)
+            changed = [
+                movie for movie_id, movie in movies.items()
+                if self._signatures.get(movie_id) != _signature(movie)
+            ]
+            removed = [movie_id for movie_id in self._signatures if movie_id not in movies]
+            if len(changed) + len(removed) > len(self._docs) // 4:
+                # Mostly new: cheaper to start over than to patch
+                self._clear()
+                changed = list(movies.values())
+            else:
+                for movie_id in removed + [movie['id'] for movie in changed if movie['id'] in self._docs]:
+                    self._remove(movie_id)
+            for movie in changed:
+                self._insert(movie)
+            for keys in self._unsorted.values():
+                keys.sort()
+            self._unsorted.clear()
+            self._version = version
+
+    # Appends without sorting; sync() sorts once at the end
+    def _insert(self, movie):
+        title = tuple(tokenize(movie.get('name')))
+        genre_words = frozenset(tokenize(movie.get('genre')))
+        show_date = movie.get('Date')
+        showtiming = movie.get('showtiming')
+        key = (show_date or date.max, showtiming or timedelta(0), movie['id'])
+
+        part = daypart(showtiming)
+        if title not in self._titles:
+            self._titles[title] = []
+            for word in set(title):
+                if word not in self._words:
+                    self._words[word] = set()
+                    bisect.insort(self._vocabulary, word)
+                    for gram in trigrams(word):
+                        self._trigrams.setdefault(gram, set()).add(word)
+                    self._expansions.clear()
+                self._words[word].add(title)
+        self._append(self._titles[title], key)
+        for word in genre_words:
+            self._genres[word] = self._genres.get(word, 0) + 1
+            self._append(self._facets.setdefault(('genre', word), []), key)
+        if part is not None:
+            self._append(self._facets.setdefault(('part', part), []), key)
+        self._append(self._order, key)
+        self._docs[movie['id']] = (title, genre_words, part, key)
+        self._signatures[movie['id']] = _signature(movie)
+
+    def _append(self, keys, key):
+        if keys and keys[-1] > key:
+            self._unsorted[id(keys)] = keys
+        keys.append(key)
+
+    # Keeps every list sorted; only called before the inserts of a sync
+    def _remove(self, movie_id):
+        title, genre_words, part, key = self._docs.pop(movie_id)
+        del self._signatures[movie_id]
+        _drop(self._titles, title, key)
+        if title not in self._titles:
+            for word in set(title):
+                titles = self._words[word]
+                titles.discard(title)
+                if not titles:
+                    del self._words[word]
+                    self._vocabulary.pop(bisect.bisect_left(self._vocabulary, word))
+                    for gram in trigrams(word):
+                        words = self._trigrams[gram]
+                        words.discard(word)
+                        if not words:
+                            del self._trigrams[gram]
+                    self._expansions.clear()
+        for word in genre_words:
+            self._genres[word] -= 1
+            if not self._genres[word]:
+                del self._genres[word]
+            _drop(self._facets, ('genre', word), key)
+        if part is not None:
+            _drop(self._facets, ('part', part), key)
+        self._order.pop(bisect.bisect_left(self._order, key))
+
+    # Vocabulary words a query word may mean, with their tier
+    def _expand(self, word):
+        cached = self._expansions.get(word)
+        if cached is not None:
+            return cached
+        found = {}
+        if word in self._words:
+            found[word] = EXACT
+        if len(word) >= 3:
+            start = bisect.bisect_left(self._vocabulary, word)
+            for candidate in self._vocabulary[start:start + 20]:
+                if not candidate.startswith(word):
+                    break
+                found.setdefault(candidate, PREFIX)
+        limit = _typo_limit(word)
+        if limit and not found:
+            grams = trigrams(word)
+            shared = {}
+            for gram in grams:
+                for candidate in self._trigrams.get(gram, ()):
+                    shared[candidate] = shared.get(candidate, 0) + 1
+            # Each edit breaks at most three trigrams; skip words that share too few
+            needed = max(1, len(grams) - 3 * limit)
+            for candidate, count in shared.items():
+                if count >= needed and edit_distance(word, candidate, limit) <= limit:
+                    found.setdefault(candidate, FUZZY)
+        expansion = sorted(found.items(), key=lambda item: -item[1])
+        self._expansions[word] = expansion
+        return expansion
+
+    # Split a query into title words and facet filters
+    def _parse(self, query, today):
+        words, dates, parts, genres = [], set(), set(), set()
+        for word in tokenize(query):
+            if word in STOPWORDS:
+                continue
+            if word in ("today", "tonight"):
+                dates.add(today)
+                if word == "tonight":
+                    parts.update(("evening", "night"))
+            elif word in ("tomorrow", "tmrw"):
+                dates.add(today + timedelta(days=1))
+            elif word == "weekend":
+                saturday = today + timedelta(days=(5 - today.weekday()) % 7)
+                dates.update((saturday, saturday + timedelta(days=1)))
+            elif word in DAYPARTS:
+                parts.add(word)
+            elif len(word) >= 3 and any(day.startswith(word) for day in WEEKDAYS):
+                weekday = next(i for i, day in enumerate(WEEKDAYS) if day.startswith(word))
+                dates.add(today + timedelta(days=(weekday - today.weekday()) % 7))
+            elif _ISO_DATE.match(word):
+                try:
+                    dates.add(date.fromisoformat(word))
+                except ValueError:  # shaped like a date but not one, e.g. 2026-02-30
+                    words.append(word)
+            elif word in self._genres:
+                genres.add(word)
+            else:
+                words.append(word)
+        return words, dates, parts, genres
+
+    # Shows matching `query`, best first: most title words matched (exact
+    # before prefix before typo), then soonest. Past shows are left out
+    # unless upcoming=False; sold-out ones unless available_only=False.
+    # Returns copies of the catalog rows.
+    @timed("movie_search")
+    def search(self, query, limit=5, today=None, upcoming=True, available_only=True):
+        # Taken before the lock: an expired catalog reloads from the database
+        # here, and other searches should not queue behind that
+        snapshot = self.catalog.snapshot()
+        movies = snapshot[1]
+        self.sync(snapshot)
+        today = today or date.today()
+        with self._lock:
+            words, dates, parts, genres = self._parse(query, today)
+            if not words and not (dates or parts or genres):
+                return []
+            start = today if upcoming else date.min
+            if dates:
+                start = max(start, min(dates))
+            end = max(dates) if dates else date.max
+
+            if words:
+                keys = self._ranked(self._score(words), start, end)
+            else:
+                keys = self._facet_keys(genres, parts, start, end)
+
+            results = []
+            for key in keys:
+                title, genre_words, part, _ = self._docs[key[2]]
+                if (dates and key[0] not in dates) or (parts and part not in parts) or not genres <= genre_words:
+                    continue
+                movie = movies.get(key[2])
+                if movie is None or (available_only and movie['available_seats'] <= 0):
+                    continue
+                results.append(dict(movie))
+                if len(results) == limit:
+                    break
+            return results
+
+    # title -> (query words it matched, summed tier)
+    def _score(self, words):
+        scores = {}
+        for word in words:
+            best = {}
+            for candidate, tier in self._expand(word):
+                for title in self._words.get(candidate, ()):
+                    if tier > best.get(title, 0):
+                        best[title] = tier
+            for title, tier in best.items():
+                matched, total = scores.get(title, (0, 0))
+                scores[title] = (matched + 1, total + tier)
+        return scores
+
+    # Sort keys of the scored titles' shows: best score first, soonest
+    # first within a score, merged lazily so only what is read gets sorted
+    def _ranked(self, scores, start, end):
+        by_score = {}
+        for title, score in scores.items():
+            by_score.setdefault(score, []).append(self._titles[title])
+        for score in sorted(by_score, reverse=True):
+            yield from heapq.merge(*(self._walk(keys, start, end) for keys in by_score[score]))
+
+    # Sort keys for a facet-only query, soonest first, read from the
+    # shortest list that covers the matches
+    def _facet_keys(self, genres, parts, start, end):
+        choices = [[self._order]]
+        choices.extend([self._facets.get(('genre', genre), [])] for genre in genres)
+        if parts:
+            choices.append([self._facets.get(('part', part), []) for part in parts])
+        lists = min(choices, key=lambda lists: sum(map(len, lists)))
+        if len(lists) == 1:
+            return self._walk(lists[0], start, end)
+        return heapq.merge(*(self._walk(keys, start, end) for keys in lists))
+
+    # Keys of a sorted list dated from start to end
+    def _walk(self, keys, start, end):
+        for i in range(bisect.bisect_left(keys, (start,)), len(keys)):
+            key = keys[i]
+            if key[0] > end:
+                return
+            yield key
+
+
+def _drop(lists, name, key):
+    keys = lists[name]
+    keys.pop(bisect.bisect_left(keys, key))
+    if not keys:
+        del lists[name]
+
+
+def _signature(movie):
+    return movie.get('name'), movie.get('genre'), movie.get('Date'), movie.get('showtiming')
@@ -0,0 +1,243 @@
+import threading
+from datetime import datetime, timedelta
+
+import config
+import metrics
+from db import connection, insert_booking, movie_catalog, record_sales, retry_transaction
+from metrics import timed
+from seatmap import SeatLayout, SeatMap, format_seats, parse_seats
+
+# A hold takes seats out of movies.available_seats the moment the user picks
+# a ticket count. It then either becomes a booking (confirm_hold) or gives
+# the seats back (release_hold, or the sweeper once it expires). Every
+# state change is a conditional single-statement UPDATE, so two sessions
+# can never both win the same seats or both settle the same hold.
+#
+# The hold also picks the actual seats from the show's seat map
+# (show_seats). The map row is read FOR UPDATE, so allocations for one show
+# are serialized. Locks are always taken in the order seat_holds ->
+# show_seats -> movies -> show_sales. A transaction MySQL still rolls back
+# as a deadlock victim is run again (see db.retry_transaction).
+
+HELD = 'held'
+CONFIRMED = 'confirmed'
+RELEASED = 'released'
+EXPIRED = 'expired'
+
+
+# The show's seat map, locked until the caller's transaction ends. A show
+# without one gets a map of the default layout with only its currently
+# available seats on sale. Returns None for an unknown movie.
+#
+# The map is created before it is locked: in InnoDB a locking read of a
+# missing row takes a gap lock, and two sessions holding it deadlock on
+# their inserts. The upsert locks the row whoever creates it, where INSERT
+# IGNORE would share the lock and deadlock a third session.
+def lock_seat_map(cursor, movie_id):
+    cursor.execute("SELECT 1 FROM show_seats WHERE movie_id = %s", (movie_id,))
+    if cursor.fetchone() is None:
+        cursor.execute("SELECT available_seats FROM movies WHERE id = %s", (movie_id,))
+        movie = cursor.fetchone()
+        if movie is None:
+            return None
+        layout = SeatLayout.parse(config.SEAT_LAYOUT)
+        seat_map = SeatMap.new(layout, on_sale=movie[0])
+        cursor.execute(
+            "INSERT INTO show_seats (movie_id, layout, taken, updated_at) VALUES (%s, %s, %s, %s)"
+            " ON DUPLICATE KEY UPDATE movie_id = movie_id",
+            (movie_id, str(layout), seat_map.to_bytes(), datetime.now())
+        )
+    cursor.execute("SELECT layout, taken FROM show_seats WHERE movie_id = %s FOR UPDATE", (movie_id,))
+    layout, taken = cursor.fetchone()
+    return SeatMap.from_bytes(SeatLayout.parse(layout), bytes(taken))
+
+
+def save_seat_map(cursor, movie_id, seat_map):
+    cursor.execute(
+        "UPDATE show_seats SET taken = %s, updated_at = %s WHERE movie_id = %s",
+        (seat_map.to_bytes(), datetime.now(), movie_id)
+    )
+
+
+# Read-only copy of a show's seat map, or None if it has none yet
+def load_seat_map(movie_id):
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT layout, taken FROM show_seats WHERE movie_id = %s", (movie_id,))
+        row = cursor.fetchone()
+        cursor.close()
+    if row is None:
+        return None
+    return SeatMap.from_bytes(SeatLayout.parse(row[0]), bytes(row[1]))
+
+
+# Reserve num_tickets adjacent seats (see SeatMap.allocate) for
+# ttl_minutes. Returns the hold id, or None when the show does not have
+# that many seats left or has been withdrawn.
+@timed("place_hold")
+@retry_transaction
+def place_hold(movie_id, num_tickets, ttl_minutes=None):
+    if num_tickets < 1:
+        raise ValueError("num_tickets must be at least 1")
+    ttl = timedelta(minutes=config.HOLD_TTL_MINUTES if ttl_minutes is None else ttl_minutes)
+    now = datetime.now()
+    since = movie_catalog.stamp()
+    with connection() as conn:
+        cursor = conn.cursor()
+        seat_map = lock_seat_map(cursor, movie_id)
+        seats = seat_map.allocate(num_tickets) if seat_map is not None else None
+        if seats is None:
+            cursor.close()
+            if seat_map is not None:
+                metrics.sold_out.inc()
+            return None
+        cursor.execute(
+            "UPDATE movies SET available_seats = available_seats - %s "
+            "WHERE id = %s AND available_seats >= %s AND withdrawn_at IS NULL",
+            (num_tickets, movie_id, num_tickets)
+        )
+        if cursor.rowcount != 1:
+            cursor.close()
+            metrics.sold_out.inc()
+            return None
+        save_seat_map(cursor, movie_id, seat_map)
+        cursor.execute(
+            "INSERT INTO seat_holds (movie_id, num_tickets, seats, status, created_at, expires_at) "
+            "VALUES (%s, %s, %s, %s, %s, %s)",
+            (movie_id, num_tickets, format_seats(seats), HELD, now, now + ttl)
+        )
+        hold_id = cursor.lastrowid
+        cursor.close()
+    movie_catalog.adjust_seats(movie_id, -num_tickets, since)
+    return hold_id
+
+
+# Turn a live hold into a booking. Returns (booking id, seats), or None when
+# the hold has expired or was already settled.
+@timed("confirm_hold")
+@retry_transaction
+def confirm_hold(hold_id, name, email, phone):
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "UPDATE seat_holds SET status = %s WHERE id = %s AND status = %s AND expires_at > %s",
+            (CONFIRMED, hold_id, HELD, datetime.now())
+        )
+        if cursor.rowcount != 1:
+            cursor.close()
+            metrics.booking_failures.inc("hold_expired")
+            return None
+        cursor.execute("SELECT movie_id, num_tickets, seats FROM seat_holds WHERE id = %s", (hold_id,))
+        movie_id, num_tickets, seats = cursor.fetchone()
+        booking_id = insert_booking(cursor, name, email, phone, movie_id, num_tickets, seats)
+        cursor.execute("UPDATE seat_holds SET booking_id = %s WHERE id = %s", (booking_id, hold_id))
+        record_sales(cursor, {movie_id: (1, num_tickets)})
+        cursor.close()
+    metrics.bookings.inc()
+    metrics.tickets.inc(amount=num_tickets)
+    return booking_id, parse_seats(seats)
+
+
+# Settle one hold as released/expired and return its seats, with an open
+# cursor. Returns (movie_id, num_tickets), or None if it was no longer held.
+def _return_seats(cursor, hold_id, status, expired_before=None):
+    cursor.execute("SELECT movie_id, num_tickets, seats FROM seat_holds WHERE id = %s", (hold_id,))
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    if expired_before is None:
+        cursor.execute(
+            "UPDATE seat_holds SET status = %s WHERE id = %s AND status = %s",
+            (status, hold_id, HELD)
+        )
+    else:
+        cursor.execute(
+            "UPDATE seat_holds SET status = %s WHERE id = %s AND status = %s AND expires_at <= %s",
+            (status, hold_id, HELD, expired_before)
+        )
+    if cursor.rowcount != 1:
+        return None
+    movie_id, num_tickets, seats = row
+    if seats:
+        seat_map = lock_seat_map(cursor, movie_id)
+        seat_map.release(parse_seats(seats))
+        save_seat_map(cursor, movie_id, seat_map)
+    cursor.execute(
+        "UPDATE movies SET available_seats = available_seats + %s WHERE id = %s",
+        (num_tickets, movie_id)
+    )
+    return movie_id, num_tickets
+
+
+# Give a hold's seats back early, e.g. when the user picks another movie
+@timed("release_hold")
+@retry_transaction
+def release_hold(hold_id):
+    since = movie_catalog.stamp()
+    with connection() as conn:
+        cursor = conn.cursor()
+        released = _return_seats(cursor, hold_id, RELEASED)
+        cursor.close()
+    if released is None:
+        return False
+    movie_catalog.adjust_seats(*released, since)
+    return True
+
+
+# Return the seats of every hold that ran out. Each batch is one transaction.
+@timed("release_expired")
+def release_expired(batch_size=500):
+    total = 0
+    while True:
+        now = datetime.now()
+        since = movie_catalog.stamp()
+        released = []
+        with connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT id FROM seat_holds WHERE status = %s AND expires_at <= %s LIMIT %s",
+                (HELD, now, batch_size)
+            )
+            hold_ids = [row[0] for row in cursor.fetchall()]
+            for hold_id in hold_ids:
+                result = _return_seats(cursor, hold_id, EXPIRED, expired_before=now)
+                if result is not None:
+                    released.append(result)
+            cursor.close()
+        for movie_id, num_tickets in released:
+            movie_catalog.adjust_seats(movie_id, num_tickets, since)
+        total += len(released)
+        if len(hold_ids) < batch_size:
+            return total
+
+
+# Background thread that runs release_expired() every interval seconds.
+# One per process; start_sweeper() is safe to call on every rerun.
+class HoldSweeper(threading.Thread):
+    def __init__(self, interval):
+        super().__init__(name="seat-hold-sweeper", daemon=True)
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                release_expired()
+            except Exception as exc:  # keep sweeping through transient DB errors
+                print(f"⚠️ Seat hold sweep failed: {exc}")
+
+    def stop(self):
+        self.stopped.set()
+
+
+_sweeper = None
+_sweeper_lock = threading.Lock()
+
+
+def start_sweeper(interval=None):
+    global _sweeper
+    with _sweeper_lock:
+        if _sweeper is None or not _sweeper.is_alive():
+            _sweeper = HoldSweeper(config.HOLD_SWEEP_INTERVAL if interval is None else interval)
+            _sweeper.start()
+    return _sweeper
@@ -0,0 +1,242 @@
+import argparse
+import sys
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+import numpy as np
+
+from db import connection
+from display import format_show_date, format_show_time
+from metrics import timed
+
+# Occupancy and revenue without touching the bookings table. show_sales
+# holds one row per show that has sold (bookings, tickets_sold, revenue),
+# kept current inside the same transactions that book and cancel (see
+# db.record_sales), so reports read a few summary rows however many
+# bookings there are. Daily figures add up a day's show rows when asked
+# rather than keeping a row per day, which every booking of the day would
+# have to lock.
+#
+# Revenue is tickets times the show's Price at the time of the sale or
+# cancellation; bookings do not record what was paid. The fill rate is
+# tickets sold over tickets sold plus seats still on sale, so seats in a
+# live hold count as neither.
+#
+# rebuild() recomputes the table from bookings for backfills and repairs.
+#
+#   python sales.py --daily 2025-06-01 2025-06-07
+#   python sales.py --top 10 2025-06-01 2025-06-07
+#   python sales.py --show 42
+#   python sales.py --rebuild
+
+INSERT_CHUNK = 1000
+TOP_ORDER = {"revenue": "s.revenue", "tickets": "s.tickets_sold"}
+
+
+def _money(value):
+    return Decimal(value or 0).quantize(Decimal("0.01"))
+
+
+def _fill_rate(sold, available):
+    seats = sold + available
+    return round(sold / seats, 4) if seats > 0 else None
+
+
+# Recompute show_sales from the bookings table, for every show or just
+# movie_ids. Bookings are streamed through an unbuffered cursor and summed
+# per show with NumPy, so memory holds a few arrays the size of the movies
+# table. Sales made while it runs may be missed: run it when bookings are
+# paused or quiet. Returns the number of shows written.
+@timed("sales.rebuild")
+def rebuild(movie_ids=None, fetch_size=10000):
+    where, params = "", []
+    if movie_ids is not None:
+        movie_ids = sorted(set(movie_ids))
+        if not movie_ids:
+            return 0
+        where = f" WHERE {{}} IN ({', '.join(['%s'] * len(movie_ids))})"
+        params = movie_ids
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT id, Date, Price FROM movies" + where.format("id"), params)
+        movies = cursor.fetchall()
+        cursor.close()
+    if not movies:
+        return 0
+
+    ids = np.fromiter((movie[0] for movie in movies), dtype=np.int64, count=len(movies))
+    size = int(ids.max()) + 1
+    counts = np.zeros(size, dtype=np.int64)
+    tickets = np.zeros(size, dtype=np.int64)
+    with connection() as conn:
+        cursor = conn.cursor(buffered=False)
+        cursor.execute("SELECT movie_id, num_tickets FROM bookings" + where.format("movie_id"), params)
+        while True:
+            rows = cursor.fetchmany(fetch_size)
+            if not rows:
+                break
+            chunk = np.array(rows, dtype=np.int64)
+            chunk = chunk[(chunk[:, 0] >= 0) & (chunk[:, 0] < size)]  # bookings of deleted shows
+            counts += np.bincount(chunk[:, 0], minlength=size)
+            tickets += np.bincount(chunk[:, 0], weights=chunk[:, 1], minlength=size).astype(np.int64)
+        cursor.close()
+
+    # Whole cents keep the products exact
+    cents = np.fromiter((int((movie[2] or 0) * 100) for movie in movies), dtype=np.int64, count=len(movies))
+    sold = tickets[ids]
+    revenue = sold * cents
+    booked = counts[ids]
+    dates = [movie[1] for movie in movies]
+    now = datetime.now()
+    rows = [
+        (int(ids[i]), dates[i], int(booked[i]), int(sold[i]), Decimal(int(revenue[i])).scaleb(-2), now)
+        for i in np.flatnonzero(booked)
+    ]
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM show_sales" + where.format("movie_id"), params)
+        for start in range(0, len(rows), INSERT_CHUNK):
+            cursor.executemany(
+                "INSERT INTO show_sales (movie_id, show_date, bookings, tickets_sold, revenue, updated_at)"
+                " VALUES (%s, %s, %s, %s, %s, %s)",
+                rows[start:start + INSERT_CHUNK]
+            )
+        cursor.close()
+    return len(rows)
+
+
+# One show's sales, or None for an unknown show
+@timed("sales.show_report")
+def show_report(movie_id):
+    with connection() as conn:
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute(
+            "SELECT m.id, m.name, m.Date, m.showtiming, m.Price, m.available_seats,"
+            " s.bookings, s.tickets_sold, s.revenue"
+            " FROM movies m LEFT JOIN show_sales s ON s.movie_id = m.id WHERE m.id = %s",
+            (movie_id,)
+        )
+        row = cursor.fetchone()
+        cursor.close()
+    if row is None:
+        return None
+    sold = row['tickets_sold'] or 0
+    return {
+        "movie_id": row['id'],
+        "name": row['name'],
+        "date": row['Date'],
+        "showtiming": row['showtiming'],
+        "price": row['Price'],
+        "bookings": row['bookings'] or 0,
+        "tickets_sold": sold,
+        "revenue": _money(row['revenue']),
+        "available_seats": row['available_seats'],
+        "fill_rate": _fill_rate(sold, row['available_seats']),
+    }
+
+
+# One row per show date from start to end (inclusive) that has shows:
+# shows, bookings, tickets sold, revenue and fill rate
+@timed("sales.daily_report")
+def daily_report(start, end):
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT show_date, SUM(bookings), SUM(tickets_sold), SUM(revenue) FROM show_sales"
+            " WHERE show_date BETWEEN %s AND %s GROUP BY show_date",
+            (start, end)
+        )
+        sales = {row[0]: row[1:] for row in cursor.fetchall()}
+        cursor.execute(
+            "SELECT Date, COUNT(*), SUM(available_seats) FROM movies WHERE Date BETWEEN %s AND %s GROUP BY Date",
+            (start, end)
+        )
+        seats = cursor.fetchall()
+        cursor.close()
+    days = []
+    for show_date, shows, available in sorted(seats):
+        bookings, sold, revenue = sales.get(show_date, (0, 0, 0))
+        sold, available = int(sold or 0), int(available or 0)
+        days.append({
+            "date": show_date,
+            "shows": shows,
+            "bookings": int(bookings or 0),
+            "tickets_sold": sold,
+            "revenue": _money(revenue),
+            "fill_rate": _fill_rate(sold, available),
+        })
+    return days
+
+
+# The best-selling shows between two dates, by "revenue" or "tickets"
+@timed("sales.top_shows")
+def top_shows(start, end, limit=10, by="revenue"):
+    if by not in TOP_ORDER:
+        raise ValueError(f"by must be one of {sorted(TOP_ORDER)}, not {by!r}")
+    with connection() as conn:
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute(
+            "SELECT s.movie_id, m.name, s.show_date, m.showtiming, s.bookings, s.tickets_sold, s.revenue,"
+            " m.available_seats FROM show_sales s JOIN movies m ON m.id = s.movie_id"
+            f" WHERE s.show_date BETWEEN %s AND %s ORDER BY {TOP_ORDER[by]} DESC, s.movie_id LIMIT %s",
+            (start, end, limit)
+        )
+        rows = cursor.fetchall()
+        cursor.close()
+    return [{
+        "movie_id": row['movie_id'],
+        "name": row['name'],
+        "date": row['show_date'],
+        "showtiming": row['showtiming'],
+        "bookings": row['bookings'],
+        "tickets_sold": row['tickets_sold'],
+        "revenue": _money(row['revenue']),
+        "fill_rate": _fill_rate(row['tickets_sold'], row['available_seats']),
+    } for row in rows]
+
+
+def _percent(rate):
+    return "   -" if rate is None else f"{rate * 100:3.0f}%"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Occupancy and revenue reports.")
+    action = parser.add_mutually_exclusive_group(required=True)
+    action.add_argument("--daily", nargs=2, type=date.fromisoformat, metavar=("FROM", "TO"),
+                        help="one line per show date")
+    action.add_argument("--top", type=int, metavar="N", help="best-selling N shows between FROM and TO")
+    action.add_argument("--show", type=int, metavar="MOVIE_ID", help="one show")
+    action.add_argument("--rebuild", action="store_true", help="recompute the summary from the bookings")
+    parser.add_argument("dates", nargs="*", type=date.fromisoformat, metavar="FROM TO",
+                        help="date range for --top (default: the next 7 days)")
+    parser.add_argument("--by", choices=sorted(TOP_ORDER), default="revenue")
+    args = parser.parse_args(argv)
+
+    if args.rebuild:
+        print(f"✅ rebuilt sales for {rebuild()} shows")
+    elif args.show is not None:
+        report = show_report(args.show)
+        if report is None:
+            print(f"💔 No show with ID {args.show}")
+            return 1
+        print(f"🎬 {report['name']} on {format_show_date(report['date'])} at {format_show_time(report['showtiming'])}")
+        print(f"   {report['tickets_sold']} tickets in {report['bookings']} bookings, "
+              f"₹{report['revenue']}, {_percent(report['fill_rate']).strip()} full")
+    elif args.daily:
+        print(f"{'date':10s} {'shows':>6s} {'tickets':>8s} {'revenue':>12s} {'fill':>5s}")
+        for day in daily_report(*args.daily):
+            print(f"{day['date'].isoformat():10s} {day['shows']:6d} {day['tickets_sold']:8d} "
+                  f"{day['revenue']:12} {_percent(day['fill_rate']):>5s}")
+    else:
+        start, end = (args.dates + [None, None])[:2]
+        start = start or date.today()
+        end = end or start + timedelta(days=6)
+        for show in top_shows(start, end, args.top, args.by):
+            print(f"{show['movie_id']:6d}  {show['name'][:30]:30s} {show['date'].isoformat()} "
+                  f"{format_show_time(show['showtiming']):>8s} {show['tickets_sold']:6d} "
+                  f"{show['revenue']:>12} {_percent(show['fill_rate']):>5s}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
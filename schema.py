@@ -0,0 +1,302 @@
+import argparse
+import sys
+from datetime import date, datetime
+
+from db import connection
+from storage import get_storage
+
+# Versioned schema for the app's tables. migrate() applies every migration
+# newer than the version recorded in schema_version, in order, and is safe
+# to run at every startup. Migrations only add what is missing, so they also
+# bring hand-made databases from before this module up to date.
+
+
+def _add_column(cursor, table, column, definition):
+    if not get_storage().column_exists(cursor, table, column):
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
+def _add_index(cursor, table, name, columns, unique=False):
+    if not get_storage().index_exists(cursor, table, columns, unique):
+        kind = "UNIQUE INDEX" if unique else "INDEX"
+        cursor.execute(f"CREATE {kind} {name} ON {table} ({', '.join(columns)})")
+
+
+# 1: users, movies and bookings with the keys the hot queries need
+def _v1_core_tables(cursor):
+    auto_id = get_storage().AUTO_ID
+    cursor.execute(
+        "CREATE TABLE IF NOT EXISTS users ("
+        f" id {auto_id},"
+        " username VARCHAR(100) NOT NULL,"
+        " password VARCHAR(255) NOT NULL"
+        ")"
+    )
+    cursor.execute(
+        "CREATE TABLE IF NOT EXISTS movies ("
+        f" id {auto_id},"
+        " name VARCHAR(255) NOT NULL,"
+        " genre VARCHAR(100),"
+        " rating DECIMAL(3,1),"
+        " available_seats INT NOT NULL DEFAULT 0,"
+        " Price DECIMAL(10,2) NOT NULL DEFAULT 0,"
+        " Date DATE,"
+        " showtiming TIME"
+        ")"
+    )
+    cursor.execute(
+        "CREATE TABLE IF NOT EXISTS bookings ("
+        f" id {auto_id},"
+        " name VARCHAR(255) NOT NULL,"
+        " email VARCHAR(255) NOT NULL,"
+        " phone VARCHAR(32),"
+        " movie_id INT NOT NULL,"
+        " booking_time DATETIME NOT NULL"
+        ")"
+    )
+    _add_index(cursor, "users", "uq_users_username", ["username"], unique=True)
+    _add_column(cursor, "bookings", "num_tickets", "INT NOT NULL DEFAULT 1")
+    _add_index(cursor, "bookings", "idx_bookings_movie_id", ["movie_id"])
+    _add_index(cursor, "bookings", "idx_bookings_email", ["email"])
+    _add_index(cursor, "bookings", "idx_bookings_booking_time", ["booking_time"])
+
+
+# 2: seat holds (see reservations.py)
+def _v2_seat_holds(cursor):
+    auto_id = get_storage().AUTO_ID
+    cursor.execute(
+        "CREATE TABLE IF NOT EXISTS seat_holds ("
+        f" id {auto_id},"
+        " movie_id INT NOT NULL,"
+        " num_tickets INT NOT NULL,"
+        " status VARCHAR(16) NOT NULL,"
+        " created_at DATETIME NOT NULL,"
+        " expires_at DATETIME NOT NULL,"
+        " booking_id INT NULL"
+        ")"
+    )
+    _add_index(cursor, "seat_holds", "idx_seat_holds_status_expires", ["status", "expires_at"])
+    _add_index(cursor, "seat_holds", "idx_seat_holds_movie_id", ["movie_id"])
+
+
+# 3: per-show seat maps (see seatmap.py) and the seats held or booked
+def _v3_seat_maps(cursor):
+    cursor.execute(
+        "CREATE TABLE IF NOT EXISTS show_seats ("
+        " movie_id INT PRIMARY KEY,"
+        " layout VARCHAR(32) NOT NULL,"
+        " taken BLOB NOT NULL,"
+        " updated_at DATETIME NOT NULL"
+        ")"
+    )
+    _add_column(cursor, "seat_holds", "seats", "TEXT NULL")
+    _add_column(cursor, "bookings", "seats", "TEXT NULL")
+
+
+# 4: keys for the upcoming-shows listing, with and without a genre
+def _v4_listing_indexes(cursor):
+    _add_index(cursor, "movies", "idx_movies_date_showtiming", ["Date", "showtiming"])
+    _add_index(cursor, "movies", "idx_movies_genre_date", ["genre", "Date", "showtiming"])
+
+
+# 5: bookings that were cancelled, kept for support and reporting
+def _v5_cancelled_bookings(cursor):
+    cursor.execute(
+        "CREATE TABLE IF NOT EXISTS cancelled_bookings ("
+        " id INT PRIMARY KEY,"
+        " name VARCHAR(255) NOT NULL,"
+        " email VARCHAR(255) NOT NULL,"
+        " phone VARCHAR(32),"
+        " movie_id INT NOT NULL,"
+        " num_tickets INT NOT NULL,"
+        " seats TEXT NULL,"
+        " booking_time DATETIME NOT NULL,"
+        " cancelled_at DATETIME NOT NULL,"
+        " reason VARCHAR(255) NOT NULL"
+        ")"
+    )
+    _add_index(cursor, "cancelled_bookings", "idx_cancelled_bookings_movie_id", ["movie_id"])
+    _add_index(cursor, "cancelled_bookings", "idx_cancelled_bookings_email", ["email"])
+
+
+# 6: tickets let in at the gates (see gate.py); one row per ticket at most
+def _v6_ticket_scans(cursor):
+    auto_id = get_storage().AUTO_ID
+    cursor.execute(
+        "CREATE TABLE IF NOT EXISTS ticket_scans ("
+        f" id {auto_id},"
+        " booking_id INT NOT NULL,"
+        " movie_id INT NOT NULL,"
+        " seat_block INT NOT NULL,"
+        " seat_row INT NOT NULL,"
+        " seat_number INT NOT NULL,"
+        " gate VARCHAR(64) NOT NULL,"
+        " scanned_at DATETIME NOT NULL"
+        ")"
+    )
+    _add_index(cursor, "ticket_scans", "uq_ticket_scans_ticket",
+               ["booking_id", "seat_block", "seat_row", "seat_number"], unique=True)
+    _add_index(cursor, "ticket_scans", "idx_ticket_scans_movie_id", ["movie_id", "id"])
+    _add_index(cursor, "cancelled_bookings", "idx_cancelled_bookings_cancelled_at", ["cancelled_at"])
+
+
+# 7: the natural key of a show, looked up by movie_import.py
+def _v7_show_key_index(cursor):
+    _add_index(cursor, "movies", "idx_movies_name_date_time", ["name", "Date", "showtiming"])
+
+
+# 8: per-show sales summary kept by the booking paths (see sales.py),
+# filled from the bookings already made
+def _v8_show_sales(cursor):
+    cursor.execute(
+        "CREATE TABLE IF NOT EXISTS show_sales ("
+        " movie_id INT PRIMARY KEY,"
+        " show_date DATE NULL,"
+        " bookings INT NOT NULL DEFAULT 0,"
+        " tickets_sold INT NOT NULL DEFAULT 0,"
+        " revenue DECIMAL(14,2) NOT NULL DEFAULT 0,"
+        " updated_at DATETIME NOT NULL"
+        ")"
+    )
+    _add_index(cursor, "show_sales", "idx_show_sales_show_date", ["show_date"])
+    cursor.execute(
+        "INSERT IGNORE INTO show_sales (movie_id, show_date, bookings, tickets_sold, revenue, updated_at)"
+        " SELECT m.id, m.Date, COUNT(*), SUM(b.num_tickets), SUM(b.num_tickets) * m.Price, %s"
+        " FROM movies m JOIN bookings b ON b.movie_id = m.id GROUP BY m.id, m.Date, m.Price",
+        (datetime.now(),)
+    )
+
+
+# 9: shows taken off sale by cancellations.cancel_show
+def _v9_withdrawn_shows(cursor):
+    _add_column(cursor, "movies", "withdrawn_at", "DATETIME NULL")
+
+
+MIGRATIONS = [
+    (1, _v1_core_tables),
+    (2, _v2_seat_holds),
+    (3, _v3_seat_maps),
+    (4, _v4_listing_indexes),
+    (5, _v5_cancelled_bookings),
+    (6, _v6_ticket_scans),
+    (7, _v7_show_key_index),
+    (8, _v8_show_sales),
+    (9, _v9_withdrawn_shows),
+]
+
+
+def current_version(cursor):
+    cursor.execute(
+        "CREATE TABLE IF NOT EXISTS schema_version ("
+        " version INT PRIMARY KEY,"
+        " applied_at DATETIME NOT NULL"
+        ")"
+    )
+    cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+    return cursor.fetchone()[0]
+
+
+# Apply pending migrations. The backend's migration lock keeps two processes
+# starting at the same time from running them twice. Returns the versions
+# applied.
+def migrate():
+    storage = get_storage()
+    applied = []
+    with connection() as conn:
+        cursor = conn.cursor()
+        try:
+            with storage.migration_lock(cursor):
+                version = current_version(cursor)
+                for target, migration in MIGRATIONS:
+                    if target <= version:
+                        continue
+                    migration(cursor)
+                    cursor.execute(
+                        "INSERT INTO schema_version (version, applied_at) VALUES (%s, %s)",
+                        (target, datetime.now())
+                    )
+                    if not storage.TRANSACTIONAL_DDL:
+                        # MySQL has committed the DDL already; record the version with it
+                        conn.commit()
+                    applied.append(target)
+        finally:
+            cursor.close()
+    return applied
+
+
+# The queries the chat flow and the admin tools run most, with sample
+# parameters. check_indexes() EXPLAINs each one.
+HOT_QUERIES = [
+    ("login", "SELECT * FROM users WHERE username=%s", ("someone",)),
+    ("movie by id", "SELECT * FROM movies WHERE id = %s", (1,)),
+    ("bookings for a show", "SELECT id FROM bookings WHERE movie_id = %s", (1,)),
+    ("bookings by email", "SELECT id FROM bookings WHERE email = %s", ("someone@example.com",)),
+    ("bookings by time range",
+     "SELECT id FROM bookings WHERE booking_time >= %s AND booking_time < %s",
+     (datetime(2000, 1, 1), datetime(2000, 1, 2))),
+    ("upcoming shows",
+     "SELECT * FROM movies WHERE Date >= %s AND available_seats > 0 AND withdrawn_at IS NULL"
+     " ORDER BY Date, showtiming, id LIMIT %s OFFSET %s",
+     (date(2000, 1, 1), 11, 0)),
+    ("upcoming shows by genre",
+     "SELECT * FROM movies WHERE Date >= %s AND available_seats > 0 AND withdrawn_at IS NULL AND genre = %s"
+     " ORDER BY Date, showtiming, id LIMIT %s OFFSET %s",
+     (date(2000, 1, 1), "Comedy", 11, 0)),
+    ("cancel booking", "SELECT movie_id FROM bookings WHERE id = %s", (1,)),
+    ("expired holds",
+     "SELECT id FROM seat_holds WHERE status = %s AND expires_at <= %s LIMIT 500",
+     ("held", datetime(2000, 1, 1))),
+    ("gate scans for a show",
+     "SELECT id, booking_id, seat_block, seat_row, seat_number FROM ticket_scans"
+     " WHERE movie_id IN (%s) AND id > %s ORDER BY id",
+     (1, 0)),
+    ("import show lookup",
+     "SELECT id, name, Date, showtiming FROM movies WHERE name IN (%s) AND Date BETWEEN %s AND %s",
+     ("Dune", date(2000, 1, 1), date(2000, 1, 7))),
+    ("sales by day",
+     "SELECT show_date, SUM(bookings), SUM(tickets_sold), SUM(revenue) FROM show_sales"
+     " WHERE show_date BETWEEN %s AND %s GROUP BY show_date",
+     (date(2000, 1, 1), date(2000, 1, 7))),
+    ("seats by day",
+     "SELECT Date, COUNT(*), SUM(available_seats) FROM movies WHERE Date BETWEEN %s AND %s GROUP BY Date",
+     (date(2000, 1, 1), date(2000, 1, 7))),
+    ("gate revocations",
+     "SELECT id, cancelled_at FROM cancelled_bookings WHERE cancelled_at >= %s",
+     (datetime(2000, 1, 1),)),
+]
+
+
+# Plan every hot query and return those that read a whole table: a list
+# of (name, plan step). Small tables are often scanned even when an index
+# exists, so run this against a database with realistic volumes.
+def check_indexes():
+    storage = get_storage()
+    problems = []
+    with connection() as conn:
+        cursor = conn.cursor()
+        for name, sql, params in HOT_QUERIES:
+            for step in storage.full_scans(cursor, sql, params):
+                problems.append((name, step))
+        cursor.close()
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Create or upgrade the database schema.")
+    parser.add_argument("--check", action="store_true", help="also EXPLAIN the hot queries")
+    args = parser.parse_args(argv)
+
+    applied = migrate()
+    print(f"✅ schema up to date (applied: {applied or 'nothing'})")
+    if args.check:
+        problems = check_indexes()
+        for name, row in problems:
+            print(f"❌ {name}: scans {row.get('table')} (type={row.get('type')}, key={row.get('key')})")
+        if problems:
+            return 1
+        print("✅ all hot queries use an index")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,167 @@
+import numpy as np
+
+# Seat inventory for one show. Seats are addressed as (block, row, seat),
+# all 1-based, and stored as one bit each: a 5 x 20 x 50 auditorium is 625
+# bytes in the database. In memory the map is a NumPy bool array of shape
+# (blocks * rows, seats_per_row), one line per physical row, True = taken.
+
+
+class SeatLayout:
+    def __init__(self, blocks, rows, seats_per_row):
+        self.blocks = blocks
+        self.rows = rows
+        self.seats_per_row = seats_per_row
+
+    @classmethod
+    def parse(cls, text):
+        blocks, rows, seats = (int(part) for part in text.lower().split("x"))
+        return cls(blocks, rows, seats)
+
+    @property
+    def lines(self):
+        return self.blocks * self.rows
+
+    @property
+    def capacity(self):
+        return self.lines * self.seats_per_row
+
+    def seat(self, line, col):
+        block, row = divmod(line, self.rows)
+        return (block + 1, row + 1, col + 1)
+
+    def position(self, seat):
+        block, row, number = seat
+        return (block - 1) * self.rows + (row - 1), number - 1
+
+    def __eq__(self, other):
+        return (self.blocks, self.rows, self.seats_per_row) == (other.blocks, other.rows, other.seats_per_row)
+
+    def __str__(self):
+        return f"{self.blocks}x{self.rows}x{self.seats_per_row}"
+
+
+class SeatMap:
+    def __init__(self, layout, taken=None):
+        self.layout = layout
+        if taken is None:
+            taken = np.zeros((layout.lines, layout.seats_per_row), dtype=bool)
+        self.taken = taken
+
+    # A new map with only `on_sale` seats free; the rest (from the back of
+    # the house) are marked taken. Used when a show that already sold
+    # tickets gets its first seat map.
+    @classmethod
+    def new(cls, layout, on_sale=None):
+        seat_map = cls(layout)
+        if on_sale is not None and on_sale < layout.capacity:
+            flat = seat_map.taken.reshape(-1)
+            flat[max(on_sale, 0):] = True
+        return seat_map
+
+    @classmethod
+    def from_bytes(cls, layout, data):
+        bits = np.unpackbits(np.frombuffer(data, dtype=np.uint8), count=layout.capacity)
+        return cls(layout, bits.astype(bool).reshape(layout.lines, layout.seats_per_row))
+
+    def to_bytes(self):
+        return np.packbits(self.taken.reshape(-1)).tobytes()
+
+    def free_count(self):
+        return int(self.taken.size - np.count_nonzero(self.taken))
+
+    # Every run of free seats as parallel arrays (line, first col, length)
+    def _free_runs(self):
+        lines, width = self.taken.shape
+        # Pad each line with a taken seat on both ends so runs never cross lines
+        padded = np.ones((lines, width + 2), dtype=np.int8)
+        padded[:, 1:-1] = self.taken
+        edges = np.diff(padded, axis=1)
+        run_lines, starts = np.nonzero(edges == -1)  # taken -> free
+        _, ends = np.nonzero(edges == 1)             # free -> taken
+        return run_lines, starts, ends - starts
+
+    # Pick num_tickets seats and mark them taken. Returns a list of
+    # (block, row, seat), or None if the show does not have that many free.
+    #   1. best fit: the smallest run in a single row that holds them all
+    #   2. otherwise side-by-side runs in the nearest rows of one block
+    #   3. otherwise the first free seats anywhere
+    def allocate(self, num_tickets):
+        if num_tickets < 1 or self.free_count() < num_tickets:
+            return None
+        run_lines, starts, lengths = self._free_runs()
+
+        fits = np.nonzero(lengths >= num_tickets)[0]
+        if fits.size:
+            # lexsort: last key is primary -> shortest run, then lowest line
+            best = fits[np.lexsort((run_lines[fits], lengths[fits]))[0]]
+            positions = [(run_lines[best], starts[best] + i) for i in range(num_tickets)]
+        else:
+            positions = self._nearby_rows(num_tickets, run_lines, starts, lengths)
+            if positions is None:
+                free_lines, free_cols = np.nonzero(~self.taken)
+                positions = list(zip(free_lines[:num_tickets], free_cols[:num_tickets]))
+
+        for line, col in positions:
+            self.taken[line, col] = True
+        return [self.layout.seat(int(line), int(col)) for line, col in positions]
+
+    # Start from the row with the longest free run and keep taking the
+    # longest run from rows at increasing distance within the same block.
+    def _nearby_rows(self, num_tickets, run_lines, starts, lengths):
+        rows = self.layout.rows
+        longest = {}
+        for line, start, length in zip(run_lines.tolist(), starts.tolist(), lengths.tolist()):
+            if length > longest.get(line, (0, 0))[1]:
+                longest[line] = (start, length)
+
+        for anchor in sorted(longest, key=lambda line: (-longest[line][1], line)):
+            block_start = anchor - anchor % rows
+            positions = []
+            for distance in range(rows):
+                for line in {anchor - distance, anchor + distance}:
+                    if block_start <= line < block_start + rows and line in longest:
+                        start, length = longest[line]
+                        take = min(length, num_tickets - len(positions))
+                        positions.extend((line, start + i) for i in range(take))
+                if len(positions) == num_tickets:
+                    return positions
+        return None
+
+    def release(self, seats):
+        for seat in seats:
+            line, col = self.layout.position(seat)
+            self.taken[line, col] = False
+
+    # Free `count` taken seats that are nobody's, from the back of the house
+    # where new() put the seats sold before the show had a map. `assigned`
+    # are the seats of the show's bookings and live holds. Returns how many
+    # were freed, fewer than count if the map has no more to give.
+    def release_unassigned(self, count, assigned):
+        spare = self.taken.copy()
+        for seat in assigned:
+            spare[self.layout.position(seat)] = False
+        flat = self.taken.reshape(-1)
+        chosen = np.flatnonzero(spare.reshape(-1))[::-1][:count]
+        flat[chosen] = False
+        return len(chosen)
+
+    def is_taken(self, seat):
+        line, col = self.layout.position(seat)
+        return bool(self.taken[line, col])
+
+
+# Seats are kept on holds and bookings as "block-row-seat" items separated
+# by commas, e.g. "1-4-12,1-4-13"
+def format_seats(seats):
+    return ",".join(f"{block}-{row}-{seat}" for block, row, seat in seats)
+
+
+def parse_seats(text):
+    if not text:
+        return []
+    return [tuple(int(part) for part in item.split("-")) for item in text.split(",")]
+
+
+# Human-readable seat list for chat replies
+def describe_seats(seats):
+    return ", ".join(f"Block {block:02d} Row {row:02d} Seat {seat:02d}" for block, row, seat in seats)
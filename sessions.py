@@ -0,0 +1,131 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import config
+
+# Where the API server keeps each conversation between messages. A session
+# is any JSON-serializable dict (see engine.new_state). Sessions idle for
+# longer than ttl seconds are dropped, and handed back by purge() so the
+# server can end them (release a hold, leave a line).
+#   MemorySessionStore  in-process, LRU-capped; lost on restart
+#   SQLiteSessionStore  a local WAL-mode file; survives restarts and can be
+#                       shared by several server processes on one host
+# Pick one with TICKETGENIE_SESSION_STORE.
+
+
+class MemorySessionStore:
+    def __init__(self, ttl=None, max_sessions=None):
+        self.ttl = config.SESSION_TTL if ttl is None else ttl
+        self.max_sessions = config.SESSION_MAX if max_sessions is None else max_sessions
+        self._sessions = OrderedDict()  # id -> (last used, session), oldest first
+        self._dropped = []  # sessions expired or evicted since the last purge
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None
+            if time.monotonic() - entry[0] > self.ttl:
+                del self._sessions[session_id]
+                self._dropped.append(entry[1])
+                return None
+            return entry[1]
+
+    def put(self, session_id, session):
+        with self._lock:
+            self._sessions[session_id] = (time.monotonic(), session)
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._dropped.append(self._sessions.popitem(last=False)[1][1])
+
+    def delete(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    # Drop expired sessions; returns them with any evicted since last time
+    def purge(self):
+        cutoff = time.monotonic() - self.ttl
+        with self._lock:
+            dropped, self._dropped = self._dropped, []
+            while self._sessions:
+                session_id, (used, session) = next(iter(self._sessions.items()))
+                if used > cutoff:
+                    break
+                del self._sessions[session_id]
+                dropped.append(session)
+        return dropped
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+class SQLiteSessionStore:
+    def __init__(self, path=None, ttl=None):
+        self.path = path or config.SESSION_DB
+        self.ttl = config.SESSION_TTL if ttl is None else ttl
+        self._local = threading.local()
+        conn = self._connect()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " id TEXT PRIMARY KEY,"
+            " data TEXT NOT NULL,"
+            " updated_at REAL NOT NULL"
+            ")"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_updated_at ON sessions (updated_at)")
+        conn.commit()
+
+    # One SQLite connection per thread
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            self._local.conn = conn
+        return conn
+
+    def get(self, session_id):
+        row = self._connect().execute(
+            "SELECT data FROM sessions WHERE id = ? AND updated_at > ?",
+            (session_id, time.time() - self.ttl)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, session_id, session):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO sessions (id, data, updated_at) VALUES (?, ?, ?)",
+                (session_id, json.dumps(session), time.time())
+            )
+
+    def delete(self, session_id):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+
+    # Drop expired sessions; returns them
+    def purge(self):
+        with self._connect() as conn:
+            rows = conn.execute(
+                "DELETE FROM sessions WHERE updated_at <= ? RETURNING data", (time.time() - self.ttl,)
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def __len__(self):
+        return self._connect().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+
+STORES = {
+    "memory": MemorySessionStore,
+    "sqlite": SQLiteSessionStore,
+}
+
+
+def make_store(kind=None):
+    kind = kind or config.SESSION_STORE
+    if kind not in STORES:
+        raise ValueError(f"unknown session store {kind!r}, use one of {sorted(STORES)}")
+    return STORES[kind]()
@@ -0,0 +1,116 @@
+import argparse
+import socketserver
+import threading
+import time
+from email import message_from_bytes
+
+# Local stand-in for an SMTP provider. Accepts any login and keeps every
+# delivered message in memory, so the mail queue can be exercised without
+# a real account:
+#
+#   python smtp_stub.py --port 2525
+#   TICKETGENIE_SMTP_HOST=localhost TICKETGENIE_SMTP_PORT=2525 TICKETGENIE_SMTP_SSL=0 streamlit run app.py
+#
+# fail_first makes the first N DATA commands fail with a temporary error,
+# to exercise retries.
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def _reply(self, line):
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        server = self.server
+        server.connections += 1
+        self._reply("220 ticketgenie-stub ESMTP")
+        mail_from, rcpt_to = None, []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode(errors="replace").strip()
+            verb = command.split(" ", 1)[0].upper()
+            if verb == "EHLO":
+                self.wfile.write(b"250-ticketgenie-stub\r\n250-AUTH PLAIN LOGIN\r\n250 8BITMIME\r\n")
+            elif verb == "HELO":
+                self._reply("250 ticketgenie-stub")
+            elif verb == "AUTH":
+                server.logins += 1
+                if command.upper().startswith("AUTH LOGIN"):
+                    # Username and password prompts; the values are ignored
+                    for _ in range(2 if len(command.split()) == 2 else 1):
+                        self._reply("334 VXNlcm5hbWU6")
+                        self.rfile.readline()
+                self._reply("235 2.7.0 Authentication successful")
+            elif verb == "MAIL":
+                mail_from, rcpt_to = command[10:].strip(), []
+                self._reply("250 OK")
+            elif verb == "RCPT":
+                rcpt_to.append(command[8:].strip())
+                self._reply("250 OK")
+            elif verb == "DATA":
+                self._reply("354 End data with <CR><LF>.<CR><LF>")
+                data = []
+                while True:
+                    chunk = self.rfile.readline()
+                    if not chunk or chunk == b".\r\n":
+                        break
+                    data.append(chunk[1:] if chunk.startswith(b"..") else chunk)
+                with server.lock:
+                    fail = server.fail_first > 0
+                    if fail:
+                        server.fail_first -= 1
+                    else:
+                        server.messages.append({
+                            "from": mail_from,
+                            "to": rcpt_to,
+                            "message": message_from_bytes(b"".join(data)),
+                            "received_at": time.time(),
+                        })
+                self._reply("451 4.3.0 Try again later" if fail else "250 OK queued")
+            elif verb in ("RSET", "NOOP"):
+                self._reply("250 OK")
+            elif verb == "QUIT":
+                self._reply("221 Bye")
+                return
+            else:
+                self._reply("502 Command not implemented")
+
+
+class SMTPStub(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host="127.0.0.1", port=0, fail_first=0):
+        super().__init__((host, port), _Handler)
+        self.messages = []
+        self.lock = threading.Lock()
+        self.fail_first = fail_first
+        self.connections = 0
+        self.logins = 0
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name="smtp-stub", daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a local SMTP stand-in.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=2525)
+    parser.add_argument("--fail-first", type=int, default=0)
+    args = parser.parse_args()
+    stub = SMTPStub(args.host, args.port, args.fail_first)
+    print(f"SMTP stub listening on {args.host}:{stub.port}")
+    try:
+        stub.serve_forever()
+    except KeyboardInterrupt:
+        pass
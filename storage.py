@@ -0,0 +1,384 @@
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from functools import lru_cache
+
+import config
+
+# Where the app's tables live. Every query in the app is written once, in
+# MySQL's dialect with %s placeholders, and runs through a Storage backend:
+#   MySQLStorage   the pooled MySQL server connection (the default)
+#   SQLiteStorage  a single WAL-mode SQLite file, for single-screen venues,
+#                  kiosks and running the whole booking flow without a server
+# A backend hands out connections (see Storage.connection) and knows the
+# few catalog and locking differences schema.py needs. Pick one with
+# TICKETGENIE_DB_BACKEND.
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class Storage:
+    name = None
+    # Column definition for an auto-numbered primary key
+    AUTO_ID = None
+    # True if schema changes can be rolled back with the rest of a transaction
+    TRANSACTIONAL_DDL = False
+
+    # Borrow a connection. Commits when the block succeeds, rolls back when
+    # it raises. Connections offer cursor(dictionary=False, buffered=True),
+    # commit(), rollback() and consume_results().
+    @contextmanager
+    def connection(self):
+        raise NotImplementedError
+
+    def column_exists(self, cursor, table, column):
+        raise NotImplementedError
+
+    # True if some index on `table` starts with exactly `columns`
+    def index_exists(self, cursor, table, columns, unique=False):
+        raise NotImplementedError
+
+    # Keeps two processes from migrating at the same time
+    @contextmanager
+    def migration_lock(self, cursor):
+        yield
+
+    # True if `exc` rolled back a transaction that may well succeed when
+    # run again: chosen as a deadlock victim, or timed out on a row lock
+    def is_transient(self, exc):
+        return False
+
+    # Plan `sql` and return the steps that read a whole table, as dicts with
+    # at least 'table', 'type' and 'key'
+    def full_scans(self, cursor, sql, params):
+        raise NotImplementedError
+
+
+class MySQLStorage(Storage):
+    name = "mysql"
+    AUTO_ID = "INT AUTO_INCREMENT PRIMARY KEY"
+
+    def __init__(self):
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        # mysql-connector's pool raises as soon as it is empty; the semaphore
+        # makes callers wait for a connection to come back instead.
+        self._slots = None
+        # Last time each underlying connection was handed out, for health checks
+        self._last_used = {}
+
+    def _get_pool(self):
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    from mysql.connector import pooling
+                    self._slots = threading.BoundedSemaphore(config.DB_POOL_SIZE)
+                    self._pool = pooling.MySQLConnectionPool(
+                        pool_name="ticketgenie",
+                        pool_size=config.DB_POOL_SIZE,
+                        pool_reset_session=True,
+                        host=config.DB_HOST,
+                        port=config.DB_PORT,
+                        user=config.DB_USER,
+                        password=config.DB_PASSWORD,
+                        database=config.DB_NAME,
+                    )
+        return self._pool
+
+    # Ping connections that sat idle in the pool, so a connection dropped by
+    # the server (wait_timeout, restart) is reconnected instead of failing a query.
+    def _check_health(self, conn):
+        raw = getattr(conn, "_cnx", conn)
+        now = time.monotonic()
+        last = self._last_used.get(id(raw))
+        if last is None or now - last > config.DB_POOL_PING_AFTER:
+            conn.ping(reconnect=True, attempts=3, delay=0.2)
+        self._last_used[id(raw)] = now
+
+    @contextmanager
+    def connection(self):
+        pool = self._get_pool()
+        if not self._slots.acquire(timeout=config.DB_POOL_TIMEOUT):
+            raise PoolTimeout(f"no database connection free after {config.DB_POOL_TIMEOUT}s")
+        try:
+            conn = pool.get_connection()
+            try:
+                self._check_health(conn)
+                yield conn
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+            finally:
+                conn.close()  # returns it to the pool
+        finally:
+            self._slots.release()
+
+    def column_exists(self, cursor, table, column):
+        cursor.execute(
+            "SELECT COUNT(*) FROM information_schema.columns "
+            "WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s",
+            (table, column)
+        )
+        return cursor.fetchone()[0] > 0
+
+    def index_exists(self, cursor, table, columns, unique=False):
+        cursor.execute(
+            "SELECT index_name, non_unique, GROUP_CONCAT(column_name ORDER BY seq_in_index) "
+            "FROM information_schema.statistics "
+            "WHERE table_schema = DATABASE() AND table_name = %s GROUP BY index_name, non_unique",
+            (table,)
+        )
+        for _, non_unique, indexed in cursor.fetchall():
+            if indexed.split(",")[:len(columns)] == list(columns) and (not unique or not non_unique):
+                return True
+        return False
+
+    @contextmanager
+    def migration_lock(self, cursor):
+        cursor.execute("SELECT GET_LOCK('ticketgenie_migrate', 60)")
+        if cursor.fetchone()[0] != 1:
+            raise RuntimeError("timed out waiting for another process to finish migrating")
+        try:
+            yield
+        finally:
+            cursor.execute("SELECT RELEASE_LOCK('ticketgenie_migrate')")
+            cursor.fetchone()
+
+    # ER_LOCK_DEADLOCK, ER_LOCK_WAIT_TIMEOUT
+    def is_transient(self, exc):
+        return getattr(exc, "errno", None) in (1213, 1205)
+
+    # Access type ALL, or a table read without any key. MySQL happily scans
+    # tables of a few rows, so run this against realistic volumes.
+    def full_scans(self, cursor, sql, params):
+        cursor.execute("EXPLAIN " + sql, params)
+        columns = [column[0] for column in cursor.description]
+        scans = []
+        for row in cursor.fetchall():
+            row = dict(zip(columns, row))
+            if row.get('type') == 'ALL' or (row.get('table') and row.get('key') is None
+                                             and row.get('type') not in ('const', 'system')):
+                scans.append(row)
+        return scans
+
+
+# SQLite hands back what MySQL would: DATE/TIME/DATETIME/DECIMAL columns
+# come out as date, timedelta, datetime and Decimal.
+def _to_timedelta(value):
+    hours, minutes, seconds = value.decode().split(":")
+    return timedelta(hours=int(hours), minutes=int(minutes), seconds=float(seconds))
+
+
+def _from_timedelta(value):
+    total = int(value.total_seconds())
+    return f"{total // 3600:02d}:{total // 60 % 60:02d}:{total % 60:02d}"
+
+
+sqlite3.register_adapter(Decimal, str)
+sqlite3.register_adapter(date, date.isoformat)
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(" "))
+sqlite3.register_adapter(timedelta, _from_timedelta)
+sqlite3.register_converter("DATE", lambda value: date.fromisoformat(value.decode()))
+sqlite3.register_converter("DATETIME", lambda value: datetime.fromisoformat(value.decode()))
+sqlite3.register_converter("TIME", _to_timedelta)
+sqlite3.register_converter("DECIMAL", lambda value: Decimal(value.decode()))
+
+_WRITES = ("INSERT", "UPDATE", "DELETE", "REPLACE", "CREATE", "ALTER", "DROP")
+
+
+_UPSERT = " ON DUPLICATE KEY UPDATE "
+_INSERTED_VALUE = re.compile(r"VALUES\((\w+)\)")
+
+
+# MySQL statement -> (SQLite statement, takes the write lock). Cached, so
+# each distinct statement is rewritten once; sqlite3 then reuses its
+# prepared form from the connection's statement cache.
+@lru_cache(maxsize=512)
+def _translate(sql):
+    writes = " FOR UPDATE" in sql or sql.lstrip().split(None, 1)[0].upper() in _WRITES
+    sql = sql.replace(" FOR UPDATE", "").replace("INSERT IGNORE", "INSERT OR IGNORE")
+    if _UPSERT in sql:
+        # VALUES(col), the value that would have been inserted, is excluded.col
+        insert, update = sql.split(_UPSERT)
+        sql = insert + " ON CONFLICT DO UPDATE SET " + _INSERTED_VALUE.sub(r"excluded.\1", update)
+    return sql.replace("%s", "?"), writes
+
+
+class _SQLiteCursor:
+    def __init__(self, conn, dictionary):
+        self._conn = conn
+        self._cursor = conn.raw.cursor()
+        self._dictionary = dictionary
+
+    # Writes and SELECT ... FOR UPDATE open the transaction with BEGIN
+    # IMMEDIATE, so the connection holds the database write lock from its
+    # first locking statement to commit. That gives the row-lock guarantees
+    # reservations.py relies on; plain reads never wait.
+    def execute(self, sql, params=()):
+        sql, writes = _translate(sql)
+        if writes and not self._conn.raw.in_transaction:
+            self._conn.raw.execute("BEGIN IMMEDIATE")
+        self._cursor.execute(sql, tuple(params))
+
+    def executemany(self, sql, seq_of_params):
+        sql, _ = _translate(sql)
+        if not self._conn.raw.in_transaction:
+            self._conn.raw.execute("BEGIN IMMEDIATE")
+        self._cursor.executemany(sql, seq_of_params)
+
+    def _row(self, row):
+        if row is None or not self._dictionary:
+            return row
+        return dict(zip((column[0] for column in self._cursor.description), row))
+
+    def fetchone(self):
+        return self._row(self._cursor.fetchone())
+
+    def fetchmany(self, size=1):
+        return [self._row(row) for row in self._cursor.fetchmany(size)]
+
+    def fetchall(self):
+        return [self._row(row) for row in self._cursor.fetchall()]
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    def close(self):
+        self._cursor.close()
+
+
+class _SQLiteConnection:
+    def __init__(self, raw):
+        self.raw = raw
+
+    def cursor(self, dictionary=False, buffered=True):
+        return _SQLiteCursor(self, dictionary)
+
+    def commit(self):
+        if self.raw.in_transaction:
+            self.raw.execute("COMMIT")
+
+    def rollback(self):
+        if self.raw.in_transaction:
+            self.raw.execute("ROLLBACK")
+
+    # Unread rows need no draining in SQLite
+    def consume_results(self):
+        pass
+
+
+class SQLiteStorage(Storage):
+    name = "sqlite"
+    AUTO_ID = "INTEGER PRIMARY KEY AUTOINCREMENT"
+    TRANSACTIONAL_DDL = True
+
+    def __init__(self, path=None):
+        self.path = path or config.SQLITE_PATH
+        # Idle connections, reused by whichever thread asks next
+        self._idle = []
+        self._idle_lock = threading.Lock()
+
+    def _open(self):
+        raw = sqlite3.connect(
+            self.path,
+            timeout=config.DB_POOL_TIMEOUT,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            isolation_level=None,  # transactions are opened by _SQLiteCursor
+            check_same_thread=False,
+            cached_statements=256,
+        )
+        raw.execute("PRAGMA journal_mode=WAL")
+        raw.execute("PRAGMA synchronous=NORMAL")
+        raw.execute("PRAGMA foreign_keys=ON")
+        return _SQLiteConnection(raw)
+
+    @contextmanager
+    def connection(self):
+        with self._idle_lock:
+            conn = self._idle.pop() if self._idle else None
+        if conn is None:
+            conn = self._open()
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            with self._idle_lock:
+                self._idle.append(conn)
+
+    def column_exists(self, cursor, table, column):
+        cursor.execute("SELECT COUNT(*) FROM pragma_table_info(%s) WHERE name = %s", (table, column))
+        return cursor.fetchone()[0] > 0
+
+    def index_exists(self, cursor, table, columns, unique=False):
+        cursor.execute('SELECT name, "unique" FROM pragma_index_list(%s)', (table,))
+        for name, is_unique in cursor.fetchall():
+            cursor.execute("SELECT name FROM pragma_index_info(%s) ORDER BY seqno", (name,))
+            indexed = [row[0] for row in cursor.fetchall()]
+            if indexed[:len(columns)] == list(columns) and (not unique or is_unique):
+                return True
+        return False
+
+    # Nothing to do: migrate()'s first statement is a write, which takes the
+    # database write lock until the whole upgrade commits.
+    @contextmanager
+    def migration_lock(self, cursor):
+        yield
+
+    # "SCAN <table>" steps that no index narrows down
+    def full_scans(self, cursor, sql, params):
+        cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+        scans = []
+        for row in cursor.fetchall():
+            detail = row[-1]
+            if detail.startswith("SCAN ") and " INDEX " not in detail:
+                scans.append({"table": detail.split()[1], "type": "SCAN", "key": None, "detail": detail})
+        return scans
+
+
+BACKENDS = {
+    "mysql": MySQLStorage,
+    "sqlite": SQLiteStorage,
+}
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+# The process-wide backend chosen by config.DB_BACKEND
+def get_storage():
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                if config.DB_BACKEND not in BACKENDS:
+                    raise ValueError(f"unknown TICKETGENIE_DB_BACKEND {config.DB_BACKEND!r}, use one of {sorted(BACKENDS)}")
+                _storage = BACKENDS[config.DB_BACKEND]()
+    return _storage
+
+
+# Use `storage` from now on, e.g. a SQLiteStorage on a scratch file in a
+# load test. Returns the previous backend.
+def set_storage(storage):
+    global _storage
+    with _storage_lock:
+        previous, _storage = _storage, storage
+    return previous
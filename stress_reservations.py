@@ -0,0 +1,148 @@
+import argparse
+import random
+import sys
+import threading
+import time
+
+from db import connection
+import reservations
+import schema
+from seatmap import parse_seats
+
+# Concurrency stress check for seat holds against a real database
+# (MySQL, or SQLite with TICKETGENIE_DB_BACKEND=sqlite).
+# Creates a throwaway movie with --seats seats, lets --bookers threads race
+# to hold and confirm 1..--max-tickets seats each (some abandon or release
+# their hold), then checks that nothing was oversold:
+#   confirmed tickets <= seats, and
+#   available_seats == seats - confirmed - still held, and
+#   no seat in the seat map was booked twice.
+# Exits non-zero on any violation.
+
+
+def _create_movie(seats):
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "INSERT INTO movies (name, genre, rating, available_seats) VALUES (%s, %s, %s, %s)",
+            (f"stress-{int(time.time())}", "test", 0, seats)
+        )
+        movie_id = cursor.lastrowid
+        cursor.close()
+    return movie_id
+
+
+def _drop_movie(movie_id):
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM bookings WHERE movie_id = %s", (movie_id,))
+        cursor.execute("DELETE FROM seat_holds WHERE movie_id = %s", (movie_id,))
+        cursor.execute("DELETE FROM show_seats WHERE movie_id = %s", (movie_id,))
+        cursor.execute("DELETE FROM show_sales WHERE movie_id = %s", (movie_id,))
+        cursor.execute("DELETE FROM movies WHERE id = %s", (movie_id,))
+        cursor.close()
+
+
+def _booker(movie_id, max_tickets, barrier, results, rng):
+    barrier.wait()
+    num_tickets = rng.randint(1, max_tickets)
+    try:
+        hold_id = reservations.place_hold(movie_id, num_tickets)
+        if hold_id is None:
+            results.append(('sold_out', 0))
+            return
+        roll = rng.random()
+        if roll < 0.1:
+            reservations.release_hold(hold_id)
+            results.append(('released', 0))
+        elif roll < 0.2:
+            results.append(('abandoned', num_tickets))
+        elif reservations.confirm_hold(hold_id, "Stress Test", "stress@example.com", "0") is None:
+            results.append(('expired', 0))
+        else:
+            results.append(('confirmed', num_tickets))
+    except Exception as exc:
+        results.append(('error', repr(exc)))
+
+
+def _check(movie_id, seats):
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT available_seats FROM movies WHERE id = %s", (movie_id,))
+        available = cursor.fetchone()[0]
+        cursor.execute(
+            "SELECT status, COALESCE(SUM(num_tickets), 0) FROM seat_holds WHERE movie_id = %s GROUP BY status",
+            (movie_id,)
+        )
+        by_status = dict(cursor.fetchall())
+        cursor.execute("SELECT seats FROM bookings WHERE movie_id = %s", (movie_id,))
+        rows = cursor.fetchall()
+        booked_seats = [seat for (seats,) in rows for seat in parse_seats(seats)]
+        bookings = len(rows)
+        cursor.close()
+    confirmed = int(by_status.get(reservations.CONFIRMED, 0))
+    held = int(by_status.get(reservations.HELD, 0))
+    problems = []
+    if available < 0:
+        problems.append(f"available_seats went negative: {available}")
+    if confirmed > seats:
+        problems.append(f"oversold: {confirmed} tickets confirmed for {seats} seats")
+    if available != seats - confirmed - held:
+        problems.append(f"seat counter drifted: available={available}, expected {seats - confirmed - held}")
+    if len(set(booked_seats)) != len(booked_seats):
+        problems.append(f"same seat booked twice: {len(booked_seats) - len(set(booked_seats))} duplicates")
+    if len(booked_seats) != confirmed:
+        problems.append(f"{confirmed} tickets confirmed but {len(booked_seats)} seats assigned")
+    return available, confirmed, held, bookings, problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Race many bookers for one show and check for oversell.")
+    parser.add_argument("--bookers", type=int, default=300)
+    parser.add_argument("--seats", type=int, default=100)
+    parser.add_argument("--max-tickets", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--keep", action="store_true", help="keep the test movie and its rows")
+    args = parser.parse_args(argv)
+
+    schema.migrate()
+    movie_id = _create_movie(args.seats)
+    seed = args.seed if args.seed is not None else random.randrange(1 << 30)
+    barrier = threading.Barrier(args.bookers)
+    results = []
+    threads = [
+        threading.Thread(target=_booker, args=(movie_id, args.max_tickets, barrier, results, random.Random(seed + i)))
+        for i in range(args.bookers)
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    try:
+        available, confirmed, held, bookings, problems = _check(movie_id, args.seats)
+    finally:
+        if not args.keep:
+            _drop_movie(movie_id)
+
+    outcomes = {}
+    for outcome, _ in results:
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+    errors = [detail for outcome, detail in results if outcome == 'error']
+    print(f"seed={seed} bookers={args.bookers} seats={args.seats} elapsed={elapsed:.2f}s")
+    print(f"outcomes={outcomes}")
+    print(f"confirmed={confirmed} held={held} available={available} booking_rows={bookings}")
+    for error in errors[:5]:
+        print(f"error: {error}")
+    for problem in problems:
+        print(f"❌ {problem}")
+    if problems or errors:
+        return 1
+    print("✅ no oversell")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
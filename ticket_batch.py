@@ -0,0 +1,191 @@
+import argparse
+import os
+import sys
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import islice
+
+from seatmap import parse_seats
+from ticket_pdf import add_ticket_page, document_bytes, new_document
+
+# Bulk ticket rendering for group bookings and reissues. Bookings are
+# expanded to one ticket per seat, cut into chunks and rendered across a
+# process pool. Results are written out as they arrive, to a directory or a
+# zip file, with a bounded number of chunks in flight, so memory stays flat
+# however many tickets there are.
+
+
+# One (booking_info, seat, n) triple per seat of each booking, n counting
+# from 1 within the booking. A booking may carry 'seats' (list of
+# (block, row, seat)); otherwise 'num_tickets' tickets are made with
+# unassigned seats.
+def expand_tickets(bookings):
+    for booking in bookings:
+        seats = booking.get('seats')
+        if seats:
+            for n, seat in enumerate(seats, 1):
+                yield booking, tuple(seat), n
+        else:
+            for n in range(1, (booking.get('num_tickets') or 1) + 1):
+                yield booking, None, n
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+# Worker: one PDF per ticket, returned as (file name, bytes)
+def _render_files(chunk):
+    files = []
+    for booking, seat, n in chunk:
+        pdf = new_document()
+        add_ticket_page(pdf, booking, seat, n)
+        files.append((f"ticket_{booking.get('booking_id', 'x')}_{n:03d}.pdf", document_bytes(pdf)))
+    return files
+
+
+# Worker: the page content streams for a chunk, to be stitched into one
+# merged document by the parent
+def _render_pages(chunk):
+    pdf = new_document()
+    for booking, seat, n in chunk:
+        add_ticket_page(pdf, booking, seat, n)
+    return [pdf.pages[n] for n in range(1, pdf.page + 1)]
+
+
+# Run fn over chunks in a process pool, keeping at most `window` chunks in
+# flight, and yield (chunk index, chunk size, result) as they complete.
+def _run_pool(fn, chunks, workers, window):
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = {}
+        chunks = enumerate(chunks)
+        for index, chunk in islice(chunks, window):
+            pending[pool.submit(fn, chunk)] = (index, len(chunk))
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                index, size = pending.pop(future)
+                for next_index, chunk in islice(chunks, 1):
+                    pending[pool.submit(fn, chunk)] = (next_index, len(chunk))
+                yield index, size, future.result()
+
+
+class _Sink:
+    def __init__(self, output):
+        self.zip = None
+        self.directory = None
+        if output.lower().endswith(".zip"):
+            # PDF pages are already deflated; storing avoids compressing twice
+            self.zip = zipfile.ZipFile(output, "w", compression=zipfile.ZIP_STORED)
+        else:
+            os.makedirs(output, exist_ok=True)
+            self.directory = output
+
+    def write(self, name, data):
+        if self.zip is not None:
+            self.zip.writestr(name, data)
+        else:
+            with open(os.path.join(self.directory, name), "wb") as file:
+                file.write(data)
+
+    def close(self):
+        if self.zip is not None:
+            self.zip.close()
+
+
+# Render tickets for many bookings.
+#   output:   a directory, or a path ending in .zip
+#   merged:   one multi-page tickets.pdf instead of one PDF per ticket
+#   progress: optional callback(done, total); total is None when bookings
+#             is an iterator of unknown length
+# Returns the number of tickets rendered.
+def render_batch(bookings, output, merged=False, workers=None, chunk_size=50, progress=None):
+    total = None
+    if hasattr(bookings, '__len__'):
+        total = sum(len(b.get('seats') or ()) or (b.get('num_tickets') or 1) for b in bookings)
+    workers = workers or os.cpu_count() or 1
+    window = workers * 2
+    chunks = _chunks(expand_tickets(bookings), chunk_size)
+
+    sink = _Sink(output)
+    done = 0
+    try:
+        if not merged:
+            for _, size, files in _run_pool(_render_files, chunks, workers, window):
+                for name, data in files:
+                    sink.write(name, data)
+                done += size
+                if progress:
+                    progress(done, total)
+        else:
+            # Chunks finish out of order; pages are appended in booking order
+            pdf = new_document()
+            waiting = {}
+            next_index = 0
+            for index, size, pages in _run_pool(_render_pages, chunks, workers, window):
+                waiting[index] = pages
+                while next_index in waiting:
+                    for page in waiting.pop(next_index):
+                        pdf.add_page()
+                        pdf.pages[pdf.page] = page
+                    next_index += 1
+                done += size
+                if progress:
+                    progress(done, total)
+            if pdf.page:
+                sink.write("tickets.pdf", document_bytes(pdf))
+    finally:
+        sink.close()
+    return done
+
+
+# Ticket fields for a booking row from db.load_show_bookings()
+def booking_info_from_row(row):
+    return {
+        "booking_id": row['id'],
+        "movie_id": row['movie_id'],
+        "name": row['name'],
+        "email": row['email'],
+        "phone": row['phone'],
+        "movie": row['movie_name'],
+        "show_date": row['Date'],
+        "booking_time": row['booking_time'].strftime("%Y-%m-%d %H:%M"),
+        "show_time": row['showtiming'],
+        "num_tickets": row.get('num_tickets') or 1,
+        "seats": parse_seats(row.get('seats')),
+    }
+
+
+def _print_progress(done, total):
+    if total:
+        sys.stderr.write(f"\r{done}/{total} tickets ({100 * done // total}%)")
+    else:
+        sys.stderr.write(f"\r{done} tickets")
+    sys.stderr.flush()
+
+
+# Reissue every ticket for one show, e.g. after a time change
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Reissue all tickets for a show.")
+    parser.add_argument("movie_id", type=int)
+    parser.add_argument("output", help="directory, or a path ending in .zip")
+    parser.add_argument("--merged", action="store_true", help="one multi-page PDF")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--chunk-size", type=int, default=50)
+    args = parser.parse_args(argv)
+
+    from db import load_show_bookings
+
+    bookings = [booking_info_from_row(row) for row in load_show_bookings(args.movie_id)]
+    count = render_batch(bookings, args.output, merged=args.merged, workers=args.workers,
+                         chunk_size=args.chunk_size, progress=_print_progress)
+    sys.stderr.write(f"\n✅ {count} tickets written to {args.output}\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import struct
+import threading
+from datetime import date, datetime, timedelta
+
+import config
+
+# What a ticket's QR code says: booking id, show (movie id), seat and the
+# time after which it no longer opens the gate, signed with HMAC-SHA256 so
+# a gate can check it offline. The code is
+#
+#   "TG1:" + base32(version, booking, show, block, row, seat, expiry, mac)
+#
+# 17 bytes of fields plus a 10-byte truncated MAC, 48 characters in QR
+# alphanumeric mode. Tickets without an assigned seat use (0, 0, n) for
+# the n-th ticket of the booking.
+#
+# The key comes from TICKETGENIE_TICKET_SECRET, else from TICKET_KEY_PATH,
+# which is created with a random key on first use. Every box that prints or
+# scans tickets needs the same key.
+
+PREFIX = "TG1:"
+VERSION = 1
+_FIELDS = struct.Struct(">BIIBBHI")  # version, booking, show, block, row, seat, expiry (epoch s)
+MAC_BYTES = 10
+
+_key = None
+_key_lock = threading.Lock()
+
+
+class InvalidTicket(Exception):
+    pass
+
+
+def signing_key():
+    global _key
+    if _key is None:
+        with _key_lock:
+            if _key is None:
+                _key = _load_key()
+    return _key
+
+
+def _load_key():
+    if config.TICKET_SECRET:
+        return config.TICKET_SECRET.encode()
+    try:
+        with open(config.TICKET_KEY_PATH, "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        pass
+    key = secrets.token_bytes(32)
+    # O_EXCL: if two processes race, the loser reads the winner's key
+    try:
+        fd = os.open(config.TICKET_KEY_PATH, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        with open(config.TICKET_KEY_PATH, "rb") as f:
+            return f.read()
+    with os.fdopen(fd, "wb") as f:
+        f.write(key)
+    return key
+
+
+def _mac(body, key):
+    return hmac.new(key, body, hashlib.sha256).digest()[:MAC_BYTES]
+
+
+# Unix time after which a ticket for this show is refused: the show's start
+# plus TICKET_GRACE_HOURS. show_date may be a date or "YYYY-MM-DD", and
+# show_time a timedelta; without a date (None, or "None" from a session)
+# the ticket lasts TICKET_GRACE_HOURS from now.
+def expiry_for(show_date, show_time=None):
+    if isinstance(show_date, str):
+        show_date = date.fromisoformat(show_date) if show_date[:1].isdigit() else None
+    if show_date is None:
+        start = datetime.now()
+    else:
+        start = datetime.combine(show_date, datetime.min.time()) + (show_time or timedelta(0))
+    return int((start + timedelta(hours=config.TICKET_GRACE_HOURS)).timestamp())
+
+
+def encode(booking_id, movie_id, seat, expires_at, key=None):
+    block, row, number = seat
+    body = _FIELDS.pack(VERSION, booking_id, movie_id, block, row, number, expires_at)
+    token = base64.b32encode(body + _mac(body, key or signing_key())).decode().rstrip("=")
+    return PREFIX + token
+
+
+# The signed fields as a dict, or InvalidTicket. Expiry is left to the caller.
+def decode(code, key=None):
+    code = code.strip().upper()
+    if not code.startswith(PREFIX):
+        raise InvalidTicket("malformed")
+    token = code[len(PREFIX):]
+    try:
+        raw = base64.b32decode(token + "=" * (-len(token) % 8))
+    except ValueError:
+        raise InvalidTicket("malformed")
+    if len(raw) != _FIELDS.size + MAC_BYTES:
+        raise InvalidTicket("malformed")
+    body, mac = raw[:_FIELDS.size], raw[_FIELDS.size:]
+    if not hmac.compare_digest(mac, _mac(body, key or signing_key())):
+        raise InvalidTicket("bad_signature")
+    version, booking_id, movie_id, block, row, number, expires_at = _FIELDS.unpack(body)
+    if version != VERSION:
+        raise InvalidTicket("malformed")
+    return {
+        "booking_id": booking_id,
+        "movie_id": movie_id,
+        "seat": (block, row, number),
+        "expires_at": expires_at,
+    }
+
+
+# The code for one ticket of a booking_info (see ticket_pdf)
+def ticket_code(booking_info, seat=None, number=1):
+    return encode(
+        booking_info['booking_id'],
+        booking_info['movie_id'],
+        tuple(seat) if seat else (0, 0, number),
+        expiry_for(booking_info.get('show_date'), booking_info.get('show_time')),
+    )
@@ -0,0 +1,235 @@
+import re
+import threading
+
+import qrcode
+from fpdf import FPDF
+from qrcode import LUT, base, util
+
+from display import format_show_time
+from metrics import timed
+from ticket_codes import ticket_code
+
+# Tickets are rendered in memory. Everything that is the same on every
+# ticket (banners, labels, separators) is drawn once per process into a
+# template; its raw page content stream is then replayed onto each new
+# page, and only the booking-specific text and the ticket's signed QR code
+# are laid out per ticket.
+
+PAGE_FORMAT = (80, 150)  # Ticket-like size, in mm
+RED = (190, 30, 45)
+CREAM = (255, 245, 230)
+
+_template = None
+_template_lock = threading.Lock()
+
+
+def sanitize_text(text):
+    return ''.join(c for c in text if c.isalnum() or c in ' .,-')
+
+
+def ticket_filename(booking_info):
+    return f"ticket_{sanitize_text(booking_info['name'].replace(' ', '_'))}.pdf"
+
+
+# Every document registers its fonts in the same order as the template, so
+# the font names in the replayed content stream (/F1, /F2) resolve to the
+# same fonts.
+def new_document():
+    pdf = FPDF('P', 'mm', PAGE_FORMAT)
+    pdf.set_font("Arial", 'B', 12)
+    pdf.set_font("Arial", '', 12)
+    return pdf
+
+
+def _draw_static(pdf):
+    # Top Banner
+    pdf.set_fill_color(*RED)
+    pdf.rect(0, 0, 80, 40, 'F')
+
+    pdf.set_font("Arial", 'B', 12)
+    pdf.set_text_color(255, 255, 255)
+    pdf.set_xy(0, 5)
+    pdf.cell(80, 7, "E-TICKET", ln=True, align='C')
+
+    # Cream Background Body
+    pdf.set_fill_color(*CREAM)
+    pdf.rect(0, 40, 80, 110, 'F')
+
+    pdf.set_text_color(0, 0, 0)
+    pdf.set_xy(0, 45)
+    pdf.set_font("Arial", 'B', 14)
+    pdf.cell(80, 8, "Movie Details", ln=True, align='C')
+
+    # Separator Line
+    pdf.set_draw_color(0, 0, 0)
+    for x in range(5, 75, 5):
+        pdf.line(x, 55, x+2, 55)
+
+    # Seat Info labels
+    pdf.set_font("Arial", 'B', 12)
+    pdf.set_xy(5, 60)
+    pdf.cell(23, 10, "BLOCK", ln=0)
+    pdf.cell(23, 10, "ROW", ln=0)
+    pdf.cell(23, 10, "SEAT", ln=1)
+
+    # Date & Time labels
+    pdf.set_xy(5, 83)
+    pdf.cell(35, 10, "DATE", ln=0)
+    pdf.cell(35, 10, "TIME", ln=1)
+
+
+# Content stream of the static layer, built on first use
+def _static_stream():
+    global _template
+    if _template is None:
+        with _template_lock:
+            if _template is None:
+                pdf = new_document()
+                pdf.add_page()
+                start = len(pdf.pages[pdf.page])
+                _draw_static(pdf)
+                _template = pdf.pages[pdf.page][start:]
+    return _template
+
+
+def _draw_booking(pdf, booking_info, seat=None, number=1):
+    # Movie name on the banner
+    pdf.set_font("Arial", 'B', 25)
+    pdf.set_text_color(255, 255, 255)
+    pdf.set_xy(10, 12)
+    pdf.cell(60, 10, sanitize_text(booking_info['movie']), ln=True, align='C')
+
+    pdf.set_text_color(0, 0, 0)
+    # Seat from the show's seat map; "--" for bookings made without one
+    labels = [f"{part:02d}" for part in seat] if seat else ["--"] * 3
+    pdf.set_font("Arial", '', 12)
+    pdf.set_xy(5, 70)
+    pdf.cell(23, 8, labels[0], ln=0)
+    pdf.cell(23, 8, labels[1], ln=0)
+    pdf.cell(23, 8, labels[2], ln=1)
+
+    booking_date, booking_time = booking_info['booking_time'].split()
+    pdf.set_xy(5, 93)
+    pdf.cell(35, 8, booking_date, ln=0)
+    pdf.cell(35, 8, format_show_time(booking_info['show_time']), ln=1)
+
+    # Ticket ID and the signed code the gate scans (see ticket_codes.py)
+    pdf.set_font("Arial", '', 10)
+    pdf.set_y(103)
+    pdf.cell(0, 8, f"TICKET #{booking_info['booking_id']}-{number}", 0, 0, 'C')
+    _draw_qr(pdf, ticket_code(booking_info, seat, number), x=25, y=113, size=30)
+
+
+# Every ticket code (see ticket_codes.py) is 48 alphanumeric characters,
+# which fit version 3 at error correction level M (up to 61). A fixed
+# version skips qrcode's search for the smallest one, and a fixed mask
+# pattern its search for the best of eight masks; any mask scans.
+QR_VERSION = 3
+QR_ERROR_CORRECTION = qrcode.constants.ERROR_CORRECT_M
+QR_MASK = 2
+QR_PAD = (0xEC, 0x11)
+
+# GF(256) exponents doubled in length, so a product of two logs needs no mod
+_EXP = [base.EXP_TABLE[i % 255] for i in range(510)]
+_ALPHANUMERIC = {chr(c): i for i, c in enumerate(util.ALPHA_NUM)}
+_DARK_RUN = re.compile(b"\x01+")  # in a row of modules as bytes
+
+
+# Data and error correction codewords for `text`, as util.create_data
+# would give them: the bit stream is built in one Python int and the
+# Reed-Solomon remainder with table lookups, where qrcode goes bit by bit
+# and through polynomial objects at ~3x the cost. Characters outside the
+# alphanumeric set fall back to qrcode.
+def _qr_codewords(text):
+    blocks = base.rs_blocks(QR_VERSION, QR_ERROR_CORRECTION)
+    if not all(c in _ALPHANUMERIC for c in text):
+        return util.create_data(QR_VERSION, QR_ERROR_CORRECTION, [util.QRData(text)])
+    bits = util.MODE_ALPHA_NUM << util.length_in_bits(util.MODE_ALPHA_NUM, QR_VERSION) | len(text)
+    length = 4 + util.length_in_bits(util.MODE_ALPHA_NUM, QR_VERSION)
+    for i in range(0, len(text) - 1, 2):
+        bits = bits << 11 | _ALPHANUMERIC[text[i]] * 45 + _ALPHANUMERIC[text[i + 1]]
+        length += 11
+    if len(text) % 2:
+        bits = bits << 6 | _ALPHANUMERIC[text[-1]]
+        length += 6
+    capacity = sum(block.data_count for block in blocks) * 8
+    if length > capacity:
+        raise ValueError(f"{text!r} does not fit a version {QR_VERSION} QR code")
+    # Terminator (up to four zero bits), then zeros to a whole byte
+    padding = min(4, capacity - length)
+    padding += -(length + padding) % 8
+    data = list((bits << padding).to_bytes((length + padding) // 8, 'big'))
+    data += [QR_PAD[i % 2] for i in range(capacity // 8 - len(data))]
+
+    data_blocks, ec_blocks, offset = [], [], 0
+    for block in blocks:
+        chunk = data[offset:offset + block.data_count]
+        offset += block.data_count
+        generator = [base.glog(c) for c in LUT.rsPoly_LUT[block.total_count - block.data_count][1:]]
+        remainder = [0] * len(generator)
+        for byte in chunk:
+            factor = byte ^ remainder[0]
+            remainder = remainder[1:] + [0]
+            if factor:
+                log = base.glog(factor)
+                remainder = [r ^ _EXP[log + g] for r, g in zip(remainder, generator)]
+        data_blocks.append(chunk)
+        ec_blocks.append(remainder)
+    # Interleaved a codeword from each block at a time, as the standard lays them out
+    codewords = []
+    for group in (data_blocks, ec_blocks):
+        for i in range(max(len(block) for block in group)):
+            codewords.extend(block[i] for block in group if i < len(block))
+    return codewords
+
+
+# The code as a QR symbol drawn with vector squares, so no image library
+# is needed: one rectangle per run of dark modules in a row, all written
+# as a single filled path straight into the content stream. qrcode only
+# lays the codewords out into its module matrix.
+def _draw_qr(pdf, text, x, y, size):
+    qr = qrcode.QRCode(version=QR_VERSION, error_correction=QR_ERROR_CORRECTION, border=0, mask_pattern=QR_MASK)
+    qr.data_cache = _qr_codewords(text)
+    qr.make(fit=False)
+    matrix = qr.modules
+    k = pdf.k
+    module = size / len(matrix) * k
+    left, top = x * k, (pdf.h - y) * k
+    # Coordinates formatted once per symbol rather than once per rectangle
+    xs = ['%.2F' % (left + c * module) for c in range(len(matrix))]
+    ys = ['%.2F' % (top - r * module) for r in range(len(matrix))]
+    widths = ['%.2F' % (n * module) for n in range(len(matrix) + 1)]
+    height = '%.2F' % -module
+    ops = []
+    for r, line in enumerate(matrix):
+        for run in _DARK_RUN.finditer(bytes(line)):
+            start, end = run.span()
+            ops.append(f"{xs[start]} {ys[r]} {widths[end - start]} {height} re")
+    pdf._out('q 0 g ' + ' '.join(ops) + ' f Q')
+
+
+# Add one ticket page to an open document. number counts the tickets of
+# the booking from 1; it names seatless tickets apart.
+def add_ticket_page(pdf, booking_info, seat=None, number=1):
+    pdf.add_page()
+    # q/Q keeps the template's colours and font from leaking into the page,
+    # so FPDF's idea of the current graphics state stays correct.
+    pdf._out('q')
+    pdf._out(_static_stream())
+    pdf._out('Q')
+    _draw_booking(pdf, booking_info, seat, number)
+
+
+def document_bytes(pdf):
+    data = pdf.output(dest='S')
+    return data.encode('latin-1') if isinstance(data, str) else bytes(data)
+
+
+# Render a booking's tickets and return the PDF as bytes: one page per seat
+# in booking_info['seats'], or a single page when no seats are assigned
+@timed("ticket_pdf")
+def generate_ticket_pdf(booking_info):
+    pdf = new_document()
+    for number, seat in enumerate(booking_info.get('seats') or [None], 1):
+        add_ticket_page(pdf, booking_info, seat, number)
+    return document_bytes(pdf)
@@ -0,0 +1,137 @@
+import glob
+import gzip
+import json
+import os
+import shutil
+import threading
+import time
+
+import config
+
+# Chat transcripts. Every message of a session is appended to
+# <dir>/<session_id>.jsonl, one JSON object per line with a running
+# sequence number. When the file grows past max_bytes it is rotated into a
+# gzip-compressed segment named after its first sequence number
+# (<session_id>.<first_seq>.jsonl.gz), so older messages can be paged back
+# in without reading the whole history. The files double as training data
+# for the intent model.
+
+
+class TranscriptLog:
+    def __init__(self, session_id, directory=None, max_bytes=None):
+        self.session_id = session_id
+        self.directory = directory or config.TRANSCRIPT_DIR
+        self.max_bytes = config.TRANSCRIPT_MAX_BYTES if max_bytes is None else max_bytes
+        self.path = os.path.join(self.directory, f"{session_id}.jsonl")
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+        self.active_first, self.next_seq = self._recover()
+
+    def _segments(self):
+        segments = []
+        for path in glob.glob(os.path.join(self.directory, f"{self.session_id}.*.jsonl.gz")):
+            first = int(os.path.basename(path).split(".")[1])
+            segments.append((first, path))
+        return sorted(segments)
+
+    # Pick up numbering where an earlier process left off
+    def _recover(self):
+        if os.path.exists(self.path):
+            with open(self.path, encoding="utf-8") as file:
+                records = [json.loads(line) for line in file if line.strip()]
+            if records:
+                return records[0]['seq'], records[-1]['seq'] + 1
+        segments = self._segments()
+        if not segments:
+            return 0, 0
+        first, path = segments[-1]
+        with gzip.open(path, "rt", encoding="utf-8") as file:
+            count = sum(1 for line in file if line.strip())
+        return first + count, first + count
+
+    # Opened and closed on every message: a Streamlit session lives for as
+    # long as its browser tab, and a handle kept for each one would pile up
+    # on a long-running server
+    def append(self, role, content):
+        with self._lock:
+            record = {"seq": self.next_seq, "ts": time.time(), "role": role, "content": content}
+            with open(self.path, "a", encoding="utf-8") as file:
+                file.write(json.dumps(record, ensure_ascii=False) + "\n")
+                size = file.tell()
+            self.next_seq += 1
+            if size >= self.max_bytes:
+                self._rotate()
+            return record
+
+    def _rotate(self):
+        segment = os.path.join(self.directory, f"{self.session_id}.{self.active_first:08d}.jsonl.gz")
+        pending = self.path + ".rotating"
+        os.replace(self.path, pending)
+        with open(pending, "rb") as src, gzip.open(segment, "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        os.unlink(pending)
+        self.active_first = self.next_seq
+
+    # Records with start <= seq < stop, oldest first. Only the segments that
+    # overlap the range are opened.
+    def read(self, start, stop):
+        start = max(start, 0)
+        with self._lock:
+            sources = self._segments()
+            ends = [first for first, _ in sources[1:]] + [self.active_first]
+            files = [
+                (gzip.open, path) for (first, path), end in zip(sources, ends)
+                if first < stop and end > start
+            ]
+            if self.active_first < stop and os.path.exists(self.path):
+                files.append((open, self.path))
+            records = []
+            for opener, path in files:
+                with opener(path, "rt", encoding="utf-8") as file:
+                    for line in file:
+                        if not line.strip():
+                            continue
+                        record = json.loads(line)
+                        if start <= record['seq'] < stop:
+                            records.append(record)
+            return records
+
+
+# What the chat UI shows: the last `window` messages of a session, with
+# older ones paged back in from the transcript on request.
+class ChatHistory:
+    def __init__(self, transcript, window=None):
+        self.transcript = transcript
+        self.window = config.CHAT_WINDOW if window is None else window
+        self.limit = self.window
+        self.messages = []
+        self.first_seq = transcript.next_seq  # seq of messages[0]
+
+    def append(self, role, content):
+        record = self.transcript.append(role, content)
+        if not self.messages:
+            self.first_seq = record['seq']
+        self.messages.append({"role": role, "content": content})
+        overflow = len(self.messages) - self.limit
+        if overflow > 0:
+            del self.messages[:overflow]
+            self.first_seq += overflow
+
+    @property
+    def has_earlier(self):
+        return self.first_seq > 0
+
+    # Page `count` older messages from the transcript into the window
+    def load_earlier(self, count=None):
+        count = self.window if count is None else count
+        records = self.transcript.read(self.first_seq - count, self.first_seq)
+        self.messages[:0] = [{"role": r['role'], "content": r['content']} for r in records]
+        self.first_seq -= len(records)
+        self.limit += len(records)
+        return len(records)
+
+    # Start an empty window; the transcript keeps everything
+    def clear(self):
+        self.messages = []
+        self.limit = self.window
+        self.first_seq = self.transcript.next_seq